@@ -5,32 +5,51 @@ Json controller
 from application.interfaces.presenters.prst_json import JsonPrst
 from infrastructure.data.files_manager import FilesManager
 
+CHECKLIST_SCHEMA = {
+    "type": "list",
+    "items": {
+        "type": "dict",
+        "required": {
+            "name": {"type": "str"},
+            "description": {"type": "str"},
+            "state": {"type": "bool"},
+        },
+    },
+}
+
 
 class JsonCrtl:
     """
     Json controller class
     """
-    def __init__(self, json_file_path):
+    def __init__(self, json_file_path, schema=None):
         self.path = json_file_path
         self.file_manager = FilesManager()
 
         # if not self.file_manager.exist(json_file_path):
         #     print("error: file not found")
         #     return None
-        self.presenter = JsonPrst(json_file_path)
+        self.presenter = JsonPrst(json_file_path, schema)
 
-    def update(self, value):
+    def update(self, value, if_match=None):
         """
         Update json
-        :return: bool depend on execution result
+        Raises DocumentValidationError when the value does not match the schema
+        :return: the new Document, False if the value is empty, None if if_match no longer matches
         """
-        if value is None or value == "":
+        if value is None or value == "" or value == b"":
             print("JsonCrtl | Error | Value empty")
             return False
-        return self.presenter.update_json(value)
+        return self.presenter.update_json(value, if_match=if_match)
 
     def read(self):
         """
         :return: json file content
         """
         return self.presenter.read_json()
+
+    def read_document(self):
+        """
+        :return: Document, cached until the file changes
+        """
+        return self.presenter.read_document()
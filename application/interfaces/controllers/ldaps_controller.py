@@ -2,7 +2,83 @@
 Ldaps Controller interface
 """
 
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
 from application.interfaces.presenters.ldaps_presenter import LdapsPresenter
+from infrastructure.data.metrics import LDAP_BINDS, LDAP_BIND_DURATION
+
+
+class BindCache:
+    """
+    Short-lived LRU cache of successful LDAP binds.
+
+    Entries are keyed on the server, the DN and a salted PBKDF2 hash of the
+    password, so the cache never holds a password in clear and a wrong
+    password can never hit a cached bind.
+    """
+
+    HASH_ITERATIONS = 60000
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.salt = os.urandom(16)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = None
+
+    def set_version(self, version):
+        """
+        Flush the cache when the LDAP settings version changed
+        (a save made by another worker process included)
+        """
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+
+    def key(self, server, dn, password):
+        """
+        :return: cache key of a bind, computed once per bind attempt as hashing is deliberately slow
+        """
+        digest = hashlib.pbkdf2_hmac(
+            "sha256", password.encode(), self.salt + dn.encode(), self.HASH_ITERATIONS
+        )
+        return server, dn, digest
+
+    def hit(self, key):
+        """
+        :return: bool depend on if a still valid bind is cached
+        """
+        with self.lock:
+            expires_at = self.entries.get(key)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return False
+            self.entries.move_to_end(key)
+            return True
+
+    def store(self, key, ttl):
+        """
+        Remember a successful bind for ttl seconds
+        """
+        with self.lock:
+            self.entries[key] = time.monotonic() + ttl
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def flush(self):
+        """
+        Forget every cached bind
+        """
+        with self.lock:
+            self.entries.clear()
 
 
 class LdapsController:
@@ -10,13 +86,20 @@ class LdapsController:
     Ldaps Controller interface
     """
 
-    def __init__(self, server_address, path_to_cert_file, port=636):
+    bind_cache = BindCache()
+
+    def __init__(self, server_address, path_to_cert_file, port=636,
+                 bind_cache_ttl=0, bind_cache_size=256, bind_cache_version=None):
         self.presenter = LdapsPresenter(
             server_address=server_address,
             path_to_cert_file=path_to_cert_file,
             port=port
         )
         self.presenter.set_server()
+        self.server_id = f"{server_address}:{port}"
+        self.bind_cache_ttl = bind_cache_ttl
+        self.bind_cache.max_size = bind_cache_size
+        self.bind_cache.set_version(bind_cache_version)
 
     @staticmethod
     def set_request_user(cn, dc):
@@ -42,8 +125,26 @@ class LdapsController:
     def connect(self, bind_dn, password):
         """
         Connects to the LDAP server using a full DN
+        When the bind cache is enabled, a recent successful bind is reused
         """
-        return self.presenter.connect(
-            user=bind_dn,
-            password=password
-        )
+        key = self.bind_cache.key(self.server_id, bind_dn, password) if self.bind_cache_ttl > 0 else None
+        if key is not None and self.bind_cache.hit(key):
+            LDAP_BINDS.labels("cached").inc()
+            return True
+
+        with LDAP_BIND_DURATION.time():
+            result = self.presenter.connect(
+                user=bind_dn,
+                password=password
+            )
+        LDAP_BINDS.labels("success" if result else "failure").inc()
+        if result and key is not None:
+            self.bind_cache.store(key, self.bind_cache_ttl)
+        return result
+
+    @classmethod
+    def flush_bind_cache(cls):
+        """
+        Drop every cached bind, used when the LDAP configuration changes
+        """
+        cls.bind_cache.flush()
@@ -1,27 +1,32 @@
 """
 Json usage presenter
 """
-import json
+from infrastructure.data.document_store import DocumentStore
 
 
 class JsonPrst:
     """
     Json presenter class
     """
-    def __init__(self, json_file_path):
+    def __init__(self, json_file_path, schema=None):
         self.json_file_path = json_file_path
+        self.store = DocumentStore.open(json_file_path, schema)
 
     def read_json(self):
         """
         :return: json file content
         """
-        with open(self.json_file_path, 'r', encoding="utf-8") as file:
-            return json.load(file)
+        return self.store.read().data
 
-    def update_json(self, data):
+    def read_document(self):
+        """
+        :return: Document with the content, raw bytes, etag and version
+        """
+        return self.store.read()
+
+    def update_json(self, data, if_match=None):
         """
         Permit update json file
-        :return: json file update result
+        :return: the new Document, None if if_match no longer matches
         """
-        with open(self.json_file_path, 'wb') as file:
-            return bool(file.write(data))
+        return self.store.write(data, if_match=if_match)
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import logging
+import posixpath
+import threading
+import time
+from stat import S_ISDIR
+
+from infrastructure.data.metrics import CACHE_REQUESTS
+
+
+class AppCatalogService:
+    """In-memory copy of the SFTP app catalog, refreshed in the background"""
+
+    def __init__(self, sftp_pool, base_path, ttl=60):
+        self.sftp_pool = sftp_pool
+        self.base_path = base_path
+        self.ttl = ttl
+        self.apps = {}  # app name -> {"mtime": directory mtime, "entry": catalog entry or None}
+        self.catalog = None
+        self.etag = None
+        self.loaded_at = 0
+        self.refresh_lock = threading.Lock()
+        self.refreshing = False
+
+    def get_catalog(self):
+        """Return (catalog, etag), serving the cached copy while it is refreshed"""
+        if self.catalog is None:
+            CACHE_REQUESTS.labels("app_catalog", "miss").inc()
+            self.refresh()
+        elif time.monotonic() - self.loaded_at > self.ttl:
+            CACHE_REQUESTS.labels("app_catalog", "stale").inc()
+            self._refresh_in_background()
+        else:
+            CACHE_REQUESTS.labels("app_catalog", "hit").inc()
+        return self.catalog, self.etag
+
+    def _refresh_in_background(self):
+        with self.refresh_lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.error(f"App catalog refresh failed, keeping the previous catalog: {e}")
+        finally:
+            self.refreshing = False
+
+    def refresh(self):
+        """Re-read the catalog, only for apps whose directory changed since the last pass"""
+        with self.sftp_pool.session() as sftp:
+            # One round trip returns the name, type and mtime of every app directory
+            listing = sftp.listdir_attr(self.base_path)
+            apps = {}
+            for attr in listing:
+                name = attr.filename
+                if name.startswith('.') or not S_ISDIR(attr.st_mode):
+                    continue
+                cached = self.apps.get(name)
+                if cached and cached["mtime"] == attr.st_mtime:
+                    apps[name] = cached
+                    continue
+                apps[name] = {"mtime": attr.st_mtime, "entry": self._read_app(sftp, name)}
+
+        catalog = [apps[name]["entry"] for name in sorted(apps) if apps[name]["entry"]]
+        self.apps = apps
+        self.catalog = catalog
+        self.etag = hashlib.sha1(json.dumps(catalog, sort_keys=True).encode()).hexdigest()
+        self.loaded_at = time.monotonic()
+        logging.info(f"App catalog refreshed: {len(catalog)} apps")
+
+    def _read_app(self, sftp, name):
+        """Build the catalog entry of one app, None if it has no description"""
+        app_path = posixpath.join(self.base_path, name)
+        try:
+            if 'description.txt' not in sftp.listdir(app_path):
+                return None
+            with sftp.open(posixpath.join(app_path, 'description.txt')) as f:
+                description = f.read().decode()
+        except IOError:
+            return None
+        return {
+            'name': name,
+            'description': description.strip(),
+            'logo_url': f'/apps/{name}/logo'
+        }
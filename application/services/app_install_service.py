@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from infrastructure.data.metrics import QUEUE_DEPTH
+from infrastructure.data.shared_state import atomic_write_json, file_lock, pid_alive
+from infrastructure.data.terraform_utils import execute_terraform
+
+FINISHED_STATUSES = ('done', 'error')
+
+
+class AppInstallService:
+    """
+    Install catalog apps in the background with bounded concurrency.
+
+    Job and per-app run states live in a shared JSON file so every worker
+    process can report them, and a second install of an app that is still
+    running joins the existing run instead of starting another one.
+    """
+
+    def __init__(self, app_sync_service, jobs_file, max_workers=2, keep_jobs=50):
+        self.app_sync_service = app_sync_service
+        self.jobs_file = jobs_file
+        self.keep_jobs = keep_jobs
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="app-install")
+        self.finished = {}  # run id -> threading.Event, for runs owned by this process
+        self.queued = 0
+        self.lock = threading.Lock()
+        QUEUE_DEPTH.labels("app_install").set_function(lambda: self.queued)
+
+    def install(self, app_names):
+        """
+        Queue the installation of several apps
+        :return: the job, with the state of each app run
+        """
+        job_id = uuid.uuid4().hex
+        new_runs = []
+        with file_lock(self.jobs_file):
+            state = self._load()
+            job = {"id": job_id, "created_at": time.time(), "apps": {}}
+            for app_name in dict.fromkeys(app_names):
+                run_id = self._active_run(state, app_name)
+                if run_id is None:
+                    run_id = uuid.uuid4().hex
+                    state["runs"][run_id] = {
+                        "app": app_name,
+                        "status": "queued",
+                        "pid": os.getpid(),
+                        "started_at": None,
+                        "finished_at": None
+                    }
+                    new_runs.append((run_id, app_name))
+                else:
+                    logging.info(f"App {app_name} is already being installed, joining run {run_id}")
+                job["apps"][app_name] = run_id
+            state["jobs"][job_id] = job
+            self._prune(state)
+            atomic_write_json(self.jobs_file, state)
+
+        for run_id, app_name in new_runs:
+            with self.lock:
+                self.finished[run_id] = threading.Event()
+                self.queued += 1
+            self.executor.submit(self._run, run_id, app_name)
+        return self.get_job(job_id)
+
+    def get_job(self, job_id):
+        """
+        :return: the job with the state of each app run, None if unknown
+        """
+        state = self._load()
+        job = state["jobs"].get(job_id)
+        if job is None:
+            return None
+        apps = {app_name: self._public_run(run_id, state["runs"].get(run_id))
+                for app_name, run_id in job["apps"].items()}
+        statuses = [run["status"] for run in apps.values()]
+        if all(status == 'done' for status in statuses):
+            status = 'done'
+        elif all(status in FINISHED_STATUSES for status in statuses):
+            status = 'error'
+        else:
+            status = 'running'
+        return {"id": job_id, "status": status, "created_at": job["created_at"], "apps": apps}
+
+    def wait(self, job_id, poll_interval=1):
+        """
+        Block until every app of the job finished
+        """
+        while True:
+            job = self.get_job(job_id)
+            if job is None or job["status"] != 'running':
+                return job
+            for run in job["apps"].values():
+                with self.lock:
+                    event = self.finished.get(run["run_id"])
+                if event is not None:
+                    event.wait()
+                    break
+            else:
+                # Run owned by another worker process
+                time.sleep(poll_interval)
+
+    def _run(self, run_id, app_name):
+        with self.lock:
+            self.queued -= 1
+        try:
+            self._update(run_id, status='syncing', started_at=time.time())
+            sync_result = self.app_sync_service.sync(app_name)
+            self._update(run_id, sync=sync_result)
+
+            success, output_or_error = execute_terraform(
+                self.app_sync_service.local_path(app_name),
+                run_init=sync_result['needs_init'],
+                on_phase=lambda phase: self._update(run_id, status=phase)
+            )
+            if success:
+                self._update(run_id, status='done', output=output_or_error, finished_at=time.time())
+            else:
+                self._update(run_id, status='error', error=output_or_error, finished_at=time.time())
+        except Exception as e:
+            logging.error(f"Installation of app {app_name} failed: {e}")
+            self._update(run_id, status='error', error=str(e), finished_at=time.time())
+        finally:
+            with self.lock:
+                event = self.finished.pop(run_id, None)
+            if event is not None:
+                event.set()
+
+    def _update(self, run_id, **fields):
+        with file_lock(self.jobs_file):
+            state = self._load()
+            run = state["runs"].get(run_id)
+            if run is None:
+                return
+            run.update(fields)
+            atomic_write_json(self.jobs_file, state)
+
+    def _load(self):
+        if not os.path.exists(self.jobs_file):
+            return {"jobs": {}, "runs": {}}
+        with open(self.jobs_file, 'r') as f:
+            state = json.load(f)
+        # Runs left unfinished by a worker that died will never complete
+        for run in state["runs"].values():
+            if run["status"] not in FINISHED_STATUSES and not pid_alive(run["pid"]):
+                run["status"] = 'error'
+                run["error"] = 'Installation interrupted'
+        return state
+
+    @staticmethod
+    def _active_run(state, app_name):
+        for run_id, run in state["runs"].items():
+            if run["app"] == app_name and run["status"] not in FINISHED_STATUSES:
+                return run_id
+        return None
+
+    def _prune(self, state):
+        """Forget the oldest finished jobs, and the runs no job references anymore"""
+        jobs = sorted(state["jobs"].values(), key=lambda job: job["created_at"])
+        for job in jobs[:max(0, len(jobs) - self.keep_jobs)]:
+            run_states = [state["runs"].get(run_id, {}).get("status") for run_id in job["apps"].values()]
+            if all(status in FINISHED_STATUSES + (None,) for status in run_states):
+                del state["jobs"][job["id"]]
+        referenced = {run_id for job in state["jobs"].values() for run_id in job["apps"].values()}
+        state["runs"] = {run_id: run for run_id, run in state["runs"].items() if run_id in referenced}
+
+    @staticmethod
+    def _public_run(run_id, run):
+        if run is None:
+            return {"run_id": run_id, "status": 'error', "error": 'Unknown run'}
+        public = {key: value for key, value in run.items() if key != 'pid'}
+        public["run_id"] = run_id
+        return public
@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import os
+import posixpath
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from stat import S_ISDIR
+
+# Local Terraform workspace files that must survive a reinstall
+PRESERVED_FILES = {'.terraform', '.terraform.lock.hcl', 'terraform.tfstate', 'terraform.tfstate.backup', 'terraform.tfvars'}
+MANIFEST_FILE = 'manifest.sha256'
+
+
+class AppSyncService:
+    """
+    Mirror an app bundle from the SFTP catalog, downloading only what changed.
+    The downloads of every sync running at once share parallel threads, so
+    concurrent installs queue for a transfer instead of for a pooled session.
+    """
+
+    def __init__(self, sftp_pool, base_path, local_dir, parallel=4):
+        self.sftp_pool = sftp_pool
+        self.base_path = base_path
+        self.local_dir = local_dir
+        self.parallel = parallel
+        self.executor = ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="app-sync")
+
+    def local_path(self, app_name):
+        """Local workspace of an app"""
+        return os.path.join(self.local_dir, app_name)
+
+    def sync(self, app_name):
+        """
+        Bring the local copy of an app up to date.
+        Files are compared with the optional manifest.sha256 checksums, or by size and mtime.
+        """
+        if not app_name or app_name.startswith('.') or '/' in app_name:
+            raise ValueError(f"Invalid app name: {app_name}")
+
+        remote_root = posixpath.join(self.base_path, app_name)
+        local_root = self.local_path(app_name)
+        os.makedirs(local_root, exist_ok=True)
+
+        with self.sftp_pool.session() as sftp:
+            remote_files = self._walk(sftp, remote_root, "")
+            checksums = {}
+            if MANIFEST_FILE in remote_files:
+                with sftp.open(posixpath.join(remote_root, MANIFEST_FILE)) as f:
+                    checksums = self._parse_manifest(f.read().decode())
+
+        changed = [
+            rel_path for rel_path, attr in remote_files.items()
+            if self._is_changed(os.path.join(local_root, rel_path), attr, checksums.get(rel_path))
+        ]
+        if changed:
+            list(self.executor.map(
+                lambda rel_path: self._download(remote_root, local_root, rel_path, remote_files[rel_path]),
+                changed
+            ))
+
+        deleted = self._delete_stale(local_root, remote_files)
+        needs_init = (
+            not os.path.isdir(os.path.join(local_root, '.terraform'))
+            or any(rel_path.endswith(('.tf', '.hcl')) for rel_path in changed + deleted)
+        )
+        logging.info(f"Synced app {app_name}: {len(changed)} downloaded, {len(deleted)} deleted, "
+                     f"{len(remote_files) - len(changed)} unchanged")
+        return {
+            "downloaded": changed,
+            "deleted": deleted,
+            "unchanged": len(remote_files) - len(changed),
+            "needs_init": needs_init
+        }
+
+    def _walk(self, sftp, remote_root, rel_dir):
+        """Map every remote file path (relative to the app root) to its attributes"""
+        files = {}
+        for attr in sftp.listdir_attr(posixpath.join(remote_root, rel_dir) if rel_dir else remote_root):
+            if attr.filename in ('.git', '.terraform'):
+                continue
+            rel_path = posixpath.join(rel_dir, attr.filename) if rel_dir else attr.filename
+            if S_ISDIR(attr.st_mode):
+                files.update(self._walk(sftp, remote_root, rel_path))
+            else:
+                files[rel_path] = attr
+        return files
+
+    @staticmethod
+    def _parse_manifest(content):
+        """Parse sha256sum output: '<hex digest>  <path>' per line"""
+        checksums = {}
+        for line in content.splitlines():
+            parts = line.strip().split(None, 1)
+            if len(parts) == 2:
+                path = parts[1].lstrip('*')
+                if path.startswith('./'):
+                    path = path[2:]
+                checksums[path] = parts[0].lower()
+        return checksums
+
+    @staticmethod
+    def _is_changed(local_path, attr, checksum):
+        if not os.path.exists(local_path):
+            return True
+        if checksum:
+            digest = hashlib.sha256()
+            with open(local_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            return digest.hexdigest() != checksum
+        stat = os.stat(local_path)
+        return stat.st_size != attr.st_size or int(stat.st_mtime) != int(attr.st_mtime)
+
+    def _download(self, remote_root, local_root, rel_path, attr):
+        """Download one file through its own pooled session, using pipelined (prefetched) reads"""
+        local_path = os.path.join(local_root, *rel_path.split('/'))
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(local_path), prefix=".tmp-")
+        os.close(fd)
+        try:
+            with self.sftp_pool.session() as sftp:
+                sftp.get(posixpath.join(remote_root, rel_path), tmp_path, prefetch=True)
+            # Mirror the remote mtime so the next sync can compare it
+            os.utime(tmp_path, (attr.st_mtime, attr.st_mtime))
+            os.replace(tmp_path, local_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _delete_stale(local_root, remote_files):
+        """Remove local files that are gone from the catalog, keeping the Terraform workspace"""
+        deleted = []
+        for dir_path, dir_names, file_names in os.walk(local_root):
+            rel_dir = os.path.relpath(dir_path, local_root)
+            if rel_dir == '.':
+                dir_names[:] = [name for name in dir_names if name not in PRESERVED_FILES]
+                file_names = [name for name in file_names if name not in PRESERVED_FILES]
+            for name in file_names:
+                rel_path = name if rel_dir == '.' else posixpath.join(rel_dir.replace(os.sep, '/'), name)
+                if rel_path not in remote_files:
+                    os.remove(os.path.join(dir_path, name))
+                    deleted.append(rel_path)
+        return deleted
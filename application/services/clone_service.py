@@ -0,0 +1,101 @@
+import logging
+import re
+import threading
+import time
+
+# Storage types whose volumes can back a linked clone, file storages only with qcow2 disks
+LINKED_CLONE_STORAGES = frozenset(['lvmthin', 'zfspool', 'rbd'])
+FILE_STORAGES = frozenset(['dir', 'nfs', 'cifs', 'glusterfs', 'cephfs', 'btrfs'])
+DISK_KEY = re.compile(r'^(scsi|virtio|sata|ide)\d+$')
+# Proxmox refusing a linked clone at apply time, e.g. "Linked clone feature is not supported for drive 'scsi0'"
+LINKED_CLONE_ERROR = re.compile(r'linked clone', re.IGNORECASE)
+
+
+class CloneModeService:
+    """
+    Decide how a VM is cloned from its template: a linked clone shares the
+    template's disks and is created in seconds, a full clone copies them.
+    A linked clone needs the template on the target node, or on shared
+    storage, with every disk on a storage that supports them; otherwise
+    the VM falls back to a full clone.
+    """
+
+    def __init__(self, cluster_inventory, proxmox_client, default_mode="full", ttl=300):
+        """
+        :param default_mode: mode of the machines whose deployment does not ask for one
+        :param ttl: seconds the disks of a template are cached
+        """
+        self.cluster_inventory = cluster_inventory
+        self.proxmox_client = proxmox_client
+        self.default_mode = default_mode
+        self.ttl = ttl
+        self.disks = {}  # (node, vmid) -> (loaded at, list of (storage, volume))
+        self.lock = threading.Lock()
+
+    def resolve(self, template_name, node, requested=None):
+        """
+        :param requested: "full" or "linked", None for the default mode
+        :return: dict with the "mode" used, the "storage" a linked clone must stay on and the "reason"
+        """
+        if (requested or self.default_mode) != "linked":
+            return {"mode": "full", "storage": None, "reason": "full clone requested"}
+        reason = self._linked_clone_blocker(template_name, node)
+        if reason:
+            logging.warning(f"Linked clone of {template_name} on {node} not possible ({reason}), using a full clone")
+            return {"mode": "full", "storage": None, "reason": reason}
+        storage = self._template_disks(template_name, node)[1][0][0]
+        return {"mode": "linked", "storage": storage, "reason": "linked clone supported"}
+
+    def _linked_clone_blocker(self, template_name, node):
+        """
+        :return: why the template cannot be linked-cloned on node, None if it can
+        """
+        snapshot = self.cluster_inventory.get_snapshot()
+        if snapshot is None:
+            return "cluster snapshot unavailable"
+        template_node, disks = self._template_disks(template_name, node)
+        if template_node is None:
+            return "template not found"
+        if not disks:
+            return "template disks unknown"
+        storages = snapshot["storages"].get(template_node, {})
+        for storage_name, volume in disks:
+            storage = storages.get(storage_name)
+            if storage is None:
+                return f"storage {storage_name} unknown"
+            if template_node != node and not storage["shared"]:
+                return f"template is on {template_node}"
+            if storage["type"] in FILE_STORAGES and volume.endswith(".qcow2"):
+                continue
+            if storage["type"] not in LINKED_CLONE_STORAGES:
+                return f"storage {storage_name} ({storage['type']}) has no linked clones"
+        return None
+
+    def _template_disks(self, template_name, node):
+        """
+        :return: (node of the template, preferably node itself, list of its (storage, volume) disks),
+                 (None, []) if no template has that name
+        """
+        snapshot = self.cluster_inventory.get_snapshot() or {"guests": {}}
+        templates = sorted((guest["node"] != node, vmid, guest["node"]) for vmid, guest in snapshot["guests"].items()
+                           if guest["template"] and guest["type"] == "qemu" and guest["name"] == template_name)
+        if not templates:
+            return None, []
+        _, vmid, template_node = templates[0]
+        with self.lock:
+            cached = self.disks.get((template_node, vmid))
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                return template_node, cached[1]
+        try:
+            config = self.proxmox_client.get(f"/nodes/{template_node}/qemu/{vmid}/config") or {}
+        except Exception as e:
+            logging.warning(f"Could not read the configuration of template {template_name}: {e}")
+            return template_node, []
+        disks = []
+        for key, value in config.items():
+            if DISK_KEY.match(key) and ":" in str(value) and "media=cdrom" not in str(value):
+                storage, volume = str(value).split(",", 1)[0].split(":", 1)
+                disks.append((storage, volume))
+        with self.lock:
+            self.disks[(template_node, vmid)] = (time.monotonic(), disks)
+        return template_node, disks
@@ -0,0 +1,82 @@
+import logging
+import threading
+import time
+
+from infrastructure.data.metrics import CACHE_REQUESTS
+
+
+class ClusterInventoryService:
+    """Short-lived cache of the guests, nodes and storages known to the Proxmox cluster"""
+
+    def __init__(self, proxmox_client, ttl=15):
+        self.proxmox_client = proxmox_client
+        self.ttl = ttl
+        # {"guests": vmid -> {"name", "node", "type", "status", "template", "maxcpu", "maxmem"},
+        #  "nodes": node -> {"status", "maxcpu", "maxmem"},
+        #  "storages": node -> storage -> {"type", "status", "shared", "content", "avail", "total"}}
+        self.snapshot = None
+        self.loaded_at = 0
+        self.lock = threading.Lock()
+
+    def get_snapshot(self):
+        """
+        :return: dict with the "guests", "nodes" and "storages" of the cluster, None if Proxmox could not be reached
+        """
+        with self.lock:
+            if self.snapshot is None or time.monotonic() - self.loaded_at > self.ttl:
+                CACHE_REQUESTS.labels("cluster_inventory", "miss").inc()
+                try:
+                    self.snapshot = self._load()
+                    self.loaded_at = time.monotonic()
+                except Exception as e:
+                    logging.warning(f"Could not load the Proxmox cluster inventory: {e}")
+                    return None
+            else:
+                CACHE_REQUESTS.labels("cluster_inventory", "hit").inc()
+            return self.snapshot
+
+    def get_guests(self):
+        """
+        :return: dict vmid -> guest summary, None if Proxmox could not be reached
+        """
+        snapshot = self.get_snapshot()
+        return None if snapshot is None else snapshot["guests"]
+
+    def invalidate(self):
+        """Force a reload on next access, used after guests are created or destroyed"""
+        with self.lock:
+            self.snapshot = None
+
+    def _load(self):
+        # A single call lists the guests, nodes and storages of every node
+        resources = self.proxmox_client.get("/cluster/resources") or []
+        snapshot = {"guests": {}, "nodes": {}, "storages": {}}
+        for resource in resources:
+            resource_type = resource.get("type")
+            if resource_type in ("qemu", "lxc") and "vmid" in resource:
+                snapshot["guests"][int(resource["vmid"])] = {
+                    "name": resource.get("name"),
+                    "node": resource.get("node"),
+                    "type": resource_type,
+                    "status": resource.get("status"),
+                    "template": bool(resource.get("template")),
+                    "maxcpu": resource.get("maxcpu"),
+                    "maxmem": resource.get("maxmem")
+                }
+            elif resource_type == "node":
+                snapshot["nodes"][resource["node"]] = {
+                    "status": resource.get("status"),
+                    "maxcpu": resource.get("maxcpu") or 0,
+                    "maxmem": resource.get("maxmem") or 0
+                }
+            elif resource_type == "storage":
+                total = resource.get("maxdisk") or 0
+                snapshot["storages"].setdefault(resource.get("node"), {})[resource.get("storage")] = {
+                    "type": resource.get("plugintype"),
+                    "status": resource.get("status"),
+                    "shared": bool(resource.get("shared")),
+                    "content": resource.get("content", ""),
+                    "avail": total - (resource.get("disk") or 0),
+                    "total": total
+                }
+        return snapshot
@@ -4,15 +4,55 @@ import json
 import shutil
 from pathlib import Path
 import logging
+import random
 import re
-import requests
+import time
 import urllib3
+from functools import partial
 from .deployment_tracking_service import DeploymentTrackingService
 from .health_check_service import HealthCheckService
+from .clone_service import LINKED_CLONE_ERROR
+from infrastructure.data.inflight import inflight_operations
+from infrastructure.data.proxmox_client import ProxmoxClient
+from infrastructure.data.terraform_utils import run_terraform_phase
+from infrastructure.data.terraform_history import TerraformHistory, parse_resource_counts
+
+# Terraform variables Proxmox can change on an existing guest, with their config API parameter
+CT_HOT_FIELDS = {"cores": "cores", "memory": "memory", "swap": "swap", "start_on_boot": "onboot", "tags": "tags"}
+VM_HOT_FIELDS = {"cores": "cores", "memory": "memory", "start_on_boot": "onboot", "tags": "tags"}
+HOT_FIELDS = {
+    "linux-ct": CT_HOT_FIELDS,
+    "vm-pack": CT_HOT_FIELDS,
+    "linux-vm": VM_HOT_FIELDS,
+    "windows-vm": VM_HOT_FIELDS,
+}
+PROVIDER_FIELDS = {"proxmox_server", "proxmox_token", "proxmox_node"}
+WINDOWS_TEMPLATES = {
+    "2016": "windows-server-2016-template",
+    "2019": "windows-server-2019-template",
+    "2022": "windows-server-2022-template"
+}
+MIN_VMID = 5000
+MAX_VMID = 7000
 
 class DeploymentService:
-    def __init__(self, config_manager):
+    def __init__(self, config_manager, state_store=None, lock_timeout=300, scheduler=None, placement=None,
+                 clone_modes=None, warm_pool=None):
+        """
+        :param state_store: TerraformStateStore new workspaces keep their state in, None for local state files
+        :param lock_timeout: seconds Terraform waits for a workspace lock held by another operation
+        :param scheduler: OperationScheduler serializing the operations of a workspace, None runs them inline
+        :param placement: PlacementService choosing the node of each machine, None deploys to the configured node
+        :param clone_modes: CloneModeService choosing linked or full clones of VM templates, None keeps full clones
+        :param warm_pool: WarmPoolService whose stopped containers are adopted instead of created, None creates them all
+        """
         self.config_manager = config_manager
+        self.state_store = state_store
+        self.scheduler = scheduler
+        self.placement = placement
+        self.clone_modes = clone_modes
+        self.warm_pool = warm_pool
+        self.lock_args = [f"-lock-timeout={lock_timeout}s"]
         # Use relative paths from the project directory
         self.base_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         self.deployments_base_path = os.path.join(self.base_path, "deployments")
@@ -21,6 +61,10 @@ class DeploymentService:
         # Initialize tracking and health check services
         self.tracking_service = DeploymentTrackingService(config_manager)
         self.health_check_service = HealthCheckService(config_manager)
+        self.proxmox_client = ProxmoxClient(config_manager)
+        self.history = TerraformHistory(
+            os.path.join(self.base_path, "infrastructure", "persistence", "terraform_history.jsonl")
+        )
         
         # Ensure directories exist
         os.makedirs(self.deployments_base_path, exist_ok=True)
@@ -31,33 +75,160 @@ class DeploymentService:
         for template_type in template_types:
             os.makedirs(f"{self.templates_path}/{template_type}", exist_ok=True)
 
-    def deploy_machines(self, machines):
-        """Deploy multiple machines and return results for each"""
+    def deploy_machines(self, machines, clone_mode=None):
+        """
+        Deploy multiple machines and return results for each: the batch is placed across
+        the cluster nodes, then its workspaces run in parallel through the operation scheduler
+        :param clone_mode: "linked" or "full" for the VMs that do not set their own
+        """
+        machines = self.prepare_batch(machines, clone_mode)
+        if self.scheduler is None:
+            outcomes = [self._deploy_outcome(partial(self._deploy_workspace, machine)) for machine in machines]
+        else:
+            futures = [self.scheduler.submit(machine["id"], "deploy", partial(self._deploy_workspace, machine),
+                                             machine["id"])[1] for machine in machines]
+            outcomes = [self._deploy_outcome(future.result) for future in futures]
+
         results = []
-        
+        for machine, (result, error) in zip(machines, outcomes):
+            results.append({
+                "machine_id": machine["id"],
+                "machine_name": machine["name"],
+                "node": machine["advanced"].get("node"),
+                "clone_mode": machine["advanced"].get("clone_mode"),
+                "status": "success" if result and result["success"] else "error",
+                "message": result["message"] if result else f"Deployment failed: {error}",
+                "output": result.get("output", "") if result else ""
+            })
+        return results
+
+    @staticmethod
+    def _deploy_outcome(function):
+        """(result, None) of a deployment, or (None, error) when it raised"""
+        try:
+            return function(), None
+        except Exception as e:
+            return None, str(e)
+
+    def prepare_batch(self, machines, clone_mode=None):
+        """
+        Copies of the machines with their node chosen, their VMIDs reserved and the clone
+        mode of their VMs, from one cluster snapshot and one VMID scan for the whole batch
+        :return: list of machines whose advanced settings hold "node", "vmid" and, for VMs, "clone_mode"
+        """
+        machines = [dict(machine, advanced=dict(machine.get("advanced", {}))) for machine in machines]
         for machine in machines:
+            # VMIDs may come as strings from the frontend, like the other advanced settings
+            advanced = machine["advanced"]
+            if advanced.get("vmid") is None:
+                advanced.pop("vmid", None)
+                continue
             try:
-                result = self.deploy_single_machine(machine)
-                results.append({
-                    "machine_id": machine["id"],
-                    "machine_name": machine["name"],
-                    "status": "success" if result["success"] else "error",
-                    "message": result["message"],
-                    "output": result.get("output", "")
-                })
-            except Exception as e:
-                results.append({
-                    "machine_id": machine["id"],
-                    "machine_name": machine["name"],
-                    "status": "error",
-                    "message": f"Deployment failed: {str(e)}",
-                    "output": ""
-                })
-                
-        return results
+                advanced["vmid"] = int(advanced["vmid"])
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid VMID for {machine.get('name')}: {advanced['vmid']}")
+        default_node = self.config_manager.proxmox.node
+        if self.placement is not None:
+            placements = self.placement.place([self._placement_demand(machine) for machine in machines],
+                                              default_node)
+            for machine in machines:
+                placement = placements[machine["id"]]
+                machine["advanced"]["node"] = placement["node"]
+                logging.info(f"Placing {machine['name']} on {placement['node']} ({placement['reason']})")
+        else:
+            for machine in machines:
+                machine["advanced"].setdefault("node", default_node)
+        if self.clone_modes is not None:
+            for machine in machines:
+                template_type = self._get_template_type(machine)
+                if template_type not in ("linux-vm", "windows-vm"):
+                    continue
+                advanced = machine["advanced"]
+                choice = self.clone_modes.resolve(self._template_name(machine, template_type), advanced["node"],
+                                                  advanced.get("clone_mode") or clone_mode)
+                advanced["clone_mode"] = choice["mode"]
+                if choice["storage"]:
+                    # A linked clone stays on the storage of the template's disks
+                    advanced["storage_pool"] = choice["storage"]
+        self._reserve_vmids(machines)
+        return machines
+
+    @staticmethod
+    def _template_name(machine, template_type):
+        """Container template file or VM template a machine is created from"""
+        if template_type == "vm-pack":
+            return machine.get("group", {}).get("os_version", "")
+        os_version = machine.get("advanced", {}).get("os_version", "")
+        if template_type == "windows-vm":
+            return WINDOWS_TEMPLATES.get(os_version, WINDOWS_TEMPLATES["2019"])
+        return os_version
+
+    def _placement_demand(self, machine):
+        """Resources, storage and template a machine needs on its node"""
+        advanced = machine["advanced"]
+        perf = advanced.get("perf", "medium")
+        template_type = self._get_template_type(machine)
+        if template_type == "vm-pack":
+            count = machine.get("group", {}).get("count", 1)
+            cores, memory, disk = 2 * count, 2048 * count, 20 * count
+        else:
+            cores, memory, disk = (self._get_cores_from_perf(perf), self._get_memory_from_perf(perf),
+                                   self._get_disk_from_perf(perf))
+            count = 1
+        return {
+            "id": machine["id"],
+            "cores": int(advanced.get("cores", cores // count)) * count,
+            "memory": int(advanced.get("memory", memory // count)) * count,
+            "disk": disk,
+            "storage": advanced.get("storage_pool", "local-lvm"),
+            "template": self._template_name(machine, template_type),
+            "template_kind": "vm" if template_type in ("linux-vm", "windows-vm") else "ct",
+            "node": advanced.get("node")
+        }
+
+    def _reserve_vmids(self, machines):
+        """Give the machines without a VMID distinct free ones, packs a contiguous range"""
+        # Containers the warm pool can serve keep the VMID of the pooled container
+        pending = [machine for machine in machines
+                   if "vmid" not in machine["advanced"] and not self._pool_eligible(machine)]
+        if not pending:
+            return
+        used = self._get_proxmox_vmids()
+        used.update(int(vmid) for vmids in self._workspace_index().values() for vmid in vmids)
+        used.update(machine["advanced"]["vmid"] + offset for machine in machines
+                    if "vmid" in machine["advanced"]
+                    for offset in range(int(machine.get("group", {}).get("count", 1))))
+        for machine in pending:
+            count = int(machine.get("group", {}).get("count", 1)) if machine["baseType"] == "vmPack" else 1
+            free = [vmid for vmid in range(MIN_VMID, MAX_VMID - count + 2)
+                    if not any(vmid + offset in used for offset in range(count))]
+            # Single machines get a random VMID like the per-machine lookup, packs the first range
+            start = (random.choice(free) if count == 1 else free[0]) if free else None
+            if start is None:
+                # Left to the per-machine lookup and its fallbacks
+                logging.error(f"No free VMID range of {count} left in {MIN_VMID}-{MAX_VMID}")
+                continue
+            machine["advanced"]["vmid"] = start
+            used.update(range(start, start + count))
 
     def deploy_single_machine(self, machine):
-        """Deploy a single machine using Terraform"""
+        """Deploy a single machine using Terraform, once the operations queued on its workspace are done"""
+        machine = self.prepare_batch([machine])[0]
+        return self._schedule(machine["id"], "deploy", lambda: self._deploy_workspace(machine), machine["id"])
+
+    def _schedule(self, workspace, kind, function, target):
+        """Run function through the operation scheduler, which waits for the workspace's earlier operations"""
+        if self.scheduler is None:
+            return function()
+        return self.scheduler.run(workspace, kind, function, target)
+
+    def _deploy_workspace(self, machine):
+        """Create the deployment directory of a machine and run Terraform in it"""
+        if self._pool_eligible(machine):
+            result = self._deploy_from_pool(machine)
+            if result is not None:
+                return result
+        
         machine_id = machine["id"]
         machine_name = machine["name"]
         base_type = machine["baseType"]
@@ -72,21 +243,26 @@ class DeploymentService:
         
         # Copy template files to deployment directory
         self._copy_template_files(template_dir, deployment_dir)
+        self._write_backend_config(deployment_dir, machine_id)
         
-        # Generate terraform.tfvars file
-        tfvars_content = self._generate_tfvars(machine)
-        tfvars_path = f"{deployment_dir}/terraform.tfvars"
-        
-        with open(tfvars_path, 'w') as f:
-            f.write(tfvars_content)
-        
-        # Save machine configuration for future reference
-        config_path = f"{deployment_dir}/machine_config.json"
-        with open(config_path, 'w') as f:
-            json.dump(machine, f, indent=2)
+        # Generate terraform.tfvars file and save machine configuration for future reference
+        tfvars = self._build_tfvars(machine)
+        self._write_workspace_files(deployment_dir, machine, tfvars)
         
         # Run Terraform
-        result = self._run_terraform(deployment_dir, machine_name)
+        started_at = time.time()
+        timings = []
+        result = self._run_terraform(deployment_dir, machine_name, timings, workload=self._workload(machine))
+        if not result["success"] and tfvars.get("full_clone") is False and \
+                LINKED_CLONE_ERROR.search(result.get("output", "")):
+            # Proxmox refused the linked clone, the workspace is applied again with a full copy
+            logging.warning(f"Linked clone of {machine_name} refused, retrying with a full clone")
+            machine["advanced"]["clone_mode"] = "full"
+            tfvars["full_clone"] = True
+            self._write_workspace_files(deployment_dir, machine, tfvars)
+            result = self._run_terraform(deployment_dir, machine_name, timings, run_init=False,
+                                         workload=self._workload(machine))
+        self._record_history("deploy", machine, started_at, timings, result)
         
         # If deployment was successful, add to tracking
         if result["success"]:
@@ -99,37 +275,69 @@ class DeploymentService:
         
         return result
 
-    def _start_vm_via_proxmox_api(self, vm_id):
-        """Start a container (CT) using Proxmox API via proxmoxer (always use /lxc endpoint)"""
-        try:
-            from proxmoxer import ProxmoxAPI
-            import urllib3
-            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    def _pool_eligible(self, machine):
+        """
+        True for containers the warm pool may serve: without a chosen VMID, and without
+        an SSH key, which Proxmox only installs when it creates the container
+        """
+        if self.warm_pool is None or self._get_template_type(machine) != "linux-ct":
+            return False
+        advanced = machine.get("advanced", {})
+        return "vmid" not in advanced and not advanced.get("sshKey") and \
+            self.warm_pool.serves(advanced.get("os_version", ""))
 
-            proxmox_server = self.config_manager.get("PROXMOX_SERVER")
-            proxmox_token = self.config_manager.get("PVEAPITOKEN")
-            proxmox_node = self.config_manager.get("NODE")
+    def _deploy_from_pool(self, machine):
+        """
+        Adopt a stopped container of the warm pool, configured through the Proxmox API, instead of creating one
+        :return: deployment result, None when the pool has none ready or the container refused the configuration
+        """
+        claimed = self.warm_pool.claim(machine["advanced"].get("os_version", ""))
+        if claimed is None:
+            logging.info(f"Warm pool empty for {machine['name']}, creating it with Terraform")
+            return None
+        vmid, node = claimed
+        pooled = dict(machine, advanced=dict(machine["advanced"], vmid=vmid, node=node, provisioner="warm-pool"))
+        tfvars = self._build_tfvars(pooled)
+        started_at = time.time()
+        try:
+            self.warm_pool.configure(vmid, node, tfvars)
+        except Exception as e:
+            logging.warning(f"Warm pool container {vmid} refused the configuration of {machine['name']}, "
+                            f"creating it with Terraform: {e}")
+            return None
+        
+        machine["advanced"].update(pooled["advanced"])
+        ip_address = tfvars.get("ip_address") or "dhcp"
+        result = {
+            "success": True,
+            "message": f"✅ {machine['name']} adopted from the warm pool (ID: {vmid}, node: {node})",
+            # Same outputs as the linux-ct template, which tracking reads
+            "output": f'ct_id = {vmid}\nct_ip_address = "{ip_address}"\nct_name = "{tfvars["vm_name"]}"\n'
+                      f'ct_node = "{node}"'
+        }
+        self._record_history("deploy", machine, started_at,
+                             [{"phase": "pool", "seconds": round(time.time() - started_at, 3), "exit_code": 0}],
+                             result)
+        self.tracking_service.add_deployed_machine(machine, result)
+        return result
 
-            if not all([proxmox_server, proxmox_token, proxmox_node]):
-                logging.error("Missing Proxmox configuration for CT start")
-                return False
+    def _write_workspace_files(self, deployment_dir, machine, tfvars):
+        """Write the terraform.tfvars of a workspace and the machine configuration it was built from"""
+        with open(f"{deployment_dir}/terraform.tfvars", 'w') as f:
+            f.write(self._render_tfvars(tfvars))
+        with open(f"{deployment_dir}/machine_config.json", 'w') as f:
+            json.dump(machine, f, indent=2)
 
-            # Parse token: user@realm!tokenid=tokenvalue
+    def _start_vm_via_proxmox_api(self, vm_id, node=None):
+        """Start a container (CT) using Proxmox API via proxmoxer (always use /lxc endpoint), on its node"""
+        try:
+            # Credentials are parsed once by the config manager
             try:
-                user_realm, token_rest = proxmox_token.split("!", 1)
-                token_name, token_value = token_rest.split("=", 1)
-            except Exception as e:
-                logging.error(f"Invalid Proxmox token format: {proxmox_token} ({e})")
+                proxmox_node = node or self.proxmox_client.node
+                proxmox = self.proxmox_client.api
+            except ValueError as e:
+                logging.error(f"Proxmox configuration error for CT start: {e}")
                 return False
-
-            try:
-                proxmox = ProxmoxAPI(
-                    proxmox_server,
-                    user=user_realm,
-                    token_name=token_name,
-                    token_value=token_value,
-                    verify_ssl=False
-                )
             except Exception as e:
                 logging.error(f"Failed to connect to Proxmox API: {e}")
                 return False
@@ -170,6 +378,13 @@ class DeploymentService:
         else:
             raise ValueError(f"Unknown machine type: {base_type}")
 
+    def _workload(self, machine):
+        """Template type of a machine, None when its configuration does not tell"""
+        try:
+            return self._get_template_type(machine)
+        except (KeyError, ValueError):
+            return None
+
     def _copy_template_files(self, template_dir, deployment_dir):
         """Copy Terraform template files to deployment directory"""
         if not os.path.exists(template_dir):
@@ -215,67 +430,44 @@ class DeploymentService:
         else:
             logging.error(f"Modules link not created: {modules_link}")
 
-    def _find_next_available_vmid(self):
-        """Find a random available VMID between 5000-7000"""
+    def _write_backend_config(self, deployment_dir, workspace):
+        """Point the workspace at the built-in HTTP state backend, when one is configured"""
+        backend_config = self.state_store.backend_config(workspace) if self.state_store else None
+        if backend_config:
+            with open(f"{deployment_dir}/backend.tf", 'w') as f:
+                f.write(backend_config)
+
+    def _get_proxmox_vmids(self):
+        """Collect the VMIDs of every VM and container on every node"""
+        existing_vmids = set()
         try:
-            # Random VMID range as requested
-            MIN_VMID = 5000
-            MAX_VMID = 7000
-            
-            # Get existing VMIDs from Proxmox API
-            existing_vmids = set()
+            nodes_response = self.proxmox_client.request("GET", "/nodes")
             
-            try:
-                import requests
-                import urllib3
-                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            if nodes_response.status_code == 200:
+                nodes = nodes_response.json().get("data", [])
                 
-                proxmox_server = self.config_manager.get("PROXMOX_SERVER")
-                proxmox_token = self.config_manager.get("PVEAPITOKEN")
-                proxmox_node = self.config_manager.get("NODE")
-                
-                if proxmox_server and proxmox_token and proxmox_node:
-                    # Parse token
-                    token_parts = proxmox_token.split("!")
-                    if len(token_parts) == 2:
-                        token_id = token_parts[0]
-                        token_secret = token_parts[1].split("=")[1]
-                        headers = {
-                            "Authorization": f"PVEAPIToken={token_id}={token_secret}"
-                        }
-                        
-                        # Get all VMs from all nodes
-                        nodes_url = f"https://{proxmox_server}:8006/api2/json/nodes"
-                        nodes_response = requests.get(nodes_url, headers=headers, verify=False, timeout=10)
-                        
-                        if nodes_response.status_code == 200:
-                            nodes = nodes_response.json().get("data", [])
+                for node in nodes:
+                    node_name = node.get("node")
+                    if node_name:
+                        # Get VMs and CTs from this node
+                        for vm_type in ["qemu", "lxc"]:
+                            vm_response = self.proxmox_client.request("GET", f"/nodes/{node_name}/{vm_type}")
                             
-                            for node in nodes:
-                                node_name = node.get("node")
-                                if node_name:
-                                    # Get VMs from this node
-                                    vms_url = f"https://{proxmox_server}:8006/api2/json/nodes/{node_name}/qemu"
-                                    vms_response = requests.get(vms_url, headers=headers, verify=False, timeout=10)
-                                    
-                                    if vms_response.status_code == 200:
-                                        vms = vms_response.json().get("data", [])
-                                        for vm in vms:
-                                            if "vmid" in vm:
-                                                existing_vmids.add(int(vm["vmid"]))
-                                    
-                                    # Get containers from this node
-                                    ct_url = f"https://{proxmox_server}:8006/api2/json/nodes/{node_name}/lxc"
-                                    ct_response = requests.get(ct_url, headers=headers, verify=False, timeout=10)
-                                    
-                                    if ct_response.status_code == 200:
-                                        containers = ct_response.json().get("data", [])
-                                        for container in containers:
-                                            if "vmid" in container:
-                                                existing_vmids.add(int(container["vmid"]))
-                                    
-            except Exception as e:
-                logging.warning(f"Could not query Proxmox API for existing VMIDs: {e}")
+                            if vm_response.status_code == 200:
+                                vms = vm_response.json().get("data", [])
+                                for vm in vms:
+                                    if "vmid" in vm:
+                                        existing_vmids.add(int(vm["vmid"]))
+                                        
+        except Exception as e:
+            logging.warning(f"Could not query Proxmox API for existing VMIDs: {e}")
+        return existing_vmids
+
+    def _find_next_available_vmid(self):
+        """Find a random available VMID between 5000-7000"""
+        try:
+            # Get existing VMIDs from Proxmox API
+            existing_vmids = self._get_proxmox_vmids()
             
             # Also check local deployment directories for VMIDs
             if os.path.exists(self.deployments_base_path):
@@ -324,49 +516,7 @@ class DeploymentService:
         """Find a range of available VMIDs for VM packs in range 5000-7000"""
         try:
             # Get existing VMIDs
-            existing_vmids = set()
-            
-            try:
-                import requests
-                import urllib3
-                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-                
-                proxmox_server = self.config_manager.get("PROXMOX_SERVER")
-                proxmox_token = self.config_manager.get("PVEAPITOKEN")
-                proxmox_node = self.config_manager.get("NODE")
-                
-                if proxmox_server and proxmox_token and proxmox_node:
-                    token_parts = proxmox_token.split("!")
-                    if len(token_parts) == 2:
-                        token_id = token_parts[0]
-                        token_secret = token_parts[1].split("=")[1]
-                        headers = {
-                            "Authorization": f"PVEAPIToken={token_id}={token_secret}"
-                        }
-                        
-                        # Get all VMs from all nodes
-                        nodes_url = f"https://{proxmox_server}:8006/api2/json/nodes"
-                        nodes_response = requests.get(nodes_url, headers=headers, verify=False, timeout=10)
-                        
-                        if nodes_response.status_code == 200:
-                            nodes = nodes_response.json().get("data", [])
-                            
-                            for node in nodes:
-                                node_name = node.get("node")
-                                if node_name:
-                                    # Get VMs and CTs from this node
-                                    for vm_type in ["qemu", "lxc"]:
-                                        vm_url = f"https://{proxmox_server}:8006/api2/json/nodes/{node_name}/{vm_type}"
-                                        vm_response = requests.get(vm_url, headers=headers, verify=False, timeout=10)
-                                        
-                                        if vm_response.status_code == 200:
-                                            vms = vm_response.json().get("data", [])
-                                            for vm in vms:
-                                                if "vmid" in vm:
-                                                    existing_vmids.add(int(vm["vmid"]))
-                                    
-            except Exception as e:
-                logging.warning(f"Could not query Proxmox API for VM pack VMIDs: {e}")
+            existing_vmids = self._get_proxmox_vmids()
             
             # Check local deployments
             if os.path.exists(self.deployments_base_path):
@@ -412,14 +562,14 @@ class DeploymentService:
             logging.error(f"Error finding VMID range for pack: {e}")
             return 5000
 
-    def _generate_tfvars(self, machine):
-        """Generate terraform.tfvars content based on machine configuration"""
+    def _build_tfvars(self, machine, vmid=None):
+        """
+        Terraform variables of a machine
+        :param vmid: VMID (first VMID for a vm-pack) to keep, a free one is looked up when None
+        """
         base_type = machine["baseType"]
         advanced = machine.get("advanced", {})
         
-        # Find next available VMID
-        next_vmid = self._find_next_available_vmid()
-        
         # Sanitize VM name for container compatibility (alphanumeric and hyphens only)
         vm_name = machine["name"].replace(" ", "-").replace("_", "-")
         # Remove any non-alphanumeric characters except hyphens
@@ -431,17 +581,18 @@ class DeploymentService:
         vm_name = vm_name[:64]
         
         # Common variables
+        proxmox = self.config_manager.proxmox
         tfvars = {
-            "proxmox_server": self.config_manager.get("PROXMOX_SERVER"),
-            "proxmox_token": self.config_manager.get("PVEAPITOKEN"),
-            "proxmox_node": self.config_manager.get("NODE"),
+            "proxmox_server": proxmox.server,
+            "proxmox_token": proxmox.api_token,
+            "proxmox_node": advanced.get("node") or proxmox.node,
         }
         
         # Add vm_name and vm_id only for non-vmPack types
         if base_type != "vmPack":
             tfvars.update({
                 "vm_name": vm_name,
-                "vm_id": advanced.get("vmid", next_vmid),
+                "vm_id": advanced["vmid"] if "vmid" in advanced else vmid or self._find_next_available_vmid(),
             })
         
         # Type-specific variables
@@ -477,14 +628,8 @@ class DeploymentService:
                 
         elif base_type in ["windowsServer", "windows10"]:
             os_version = advanced.get("os_version", "2019")
-            template_map = {
-                "2016": "windows-server-2016-template",
-                "2019": "windows-server-2019-template", 
-                "2022": "windows-server-2022-template"
-            }
-            
             tfvars.update({
-                "template_name": template_map.get(os_version, "windows-server-2019-template"),
+                "template_name": WINDOWS_TEMPLATES.get(os_version, WINDOWS_TEMPLATES["2019"]),
                 "cores": self._get_cores_from_perf(advanced.get("perf", "medium")),
                 "memory": self._get_memory_from_perf(advanced.get("perf", "medium")),
                 "disk_size": self._get_disk_from_perf(advanced.get("perf", "medium")),
@@ -500,7 +645,10 @@ class DeploymentService:
             os_version = group.get("os_version", "")
             
             # For VM packs, find a range of available VMIDs
-            start_vmid = advanced.get("vmid", self._find_vmid_range_for_pack(vm_count))
+            if "vmid" in advanced:
+                start_vmid = advanced["vmid"]
+            else:
+                start_vmid = vmid or self._find_vmid_range_for_pack(vm_count)
             
             tfvars.update({
                 "template_name": os_version,
@@ -520,15 +668,35 @@ class DeploymentService:
                 "ssh_keys": advanced.get("sshKey", ""),
             })
         
-        # Convert to terraform.tfvars format
+        # Optional settings, also changeable in place through the Proxmox config API
+        for key in ("cores", "memory", "swap"):
+            if key in advanced:
+                tfvars[key] = int(advanced[key])
+        if "onboot" in advanced:
+            tfvars["start_on_boot"] = bool(advanced["onboot"])
+        if "tags" in advanced:
+            tags = advanced["tags"]
+            tfvars["tags"] = ";".join(tags) if isinstance(tags, list) else str(tags)
+        if "storage_pool" in advanced:
+            tfvars["storage_pool"] = advanced["storage_pool"]
+        # Machines deployed before clone modes existed keep the templates' default full clone
+        if "clone_mode" in advanced and self._get_template_type(machine) in ("linux-vm", "windows-vm"):
+            tfvars["full_clone"] = advanced["clone_mode"] != "linked"
+
+        return tfvars
+
+    @staticmethod
+    def _render_tfvars(tfvars):
+        """Convert to terraform.tfvars format"""
         tfvars_lines = []
         for key, value in tfvars.items():
             if isinstance(value, str):
                 tfvars_lines.append(f'{key} = "{value}"')
-            elif isinstance(value, (int, float)):
-                tfvars_lines.append(f'{key} = {value}')
             elif isinstance(value, bool):
+                # bool first: it is also an int
                 tfvars_lines.append(f'{key} = {str(value).lower()}')
+            elif isinstance(value, (int, float)):
+                tfvars_lines.append(f'{key} = {value}')
             elif isinstance(value, list):
                 formatted_list = '[' + ', '.join(f'"{item}"' for item in value) + ']'
                 tfvars_lines.append(f'{key} = {formatted_list}')
@@ -550,58 +718,54 @@ class DeploymentService:
         perf_map = {"low": 20, "medium": 40, "high": 80}
         return perf_map.get(perf, 40)
 
-    def _run_terraform(self, deployment_dir, machine_name):
-        """Run Terraform commands in the deployment directory"""
+    def _run_terraform(self, deployment_dir, machine_name, timings=None, run_init=True, workload=None):
+        """
+        Run Terraform commands in the deployment directory, appending each phase duration to timings
+        :param workload: template type of the machine, the latency class of the runs in the concurrency limiter
+        """
         try:
-            # Change to deployment directory
-            original_cwd = os.getcwd()
-            os.chdir(deployment_dir)
-            
-            # Run terraform init
-            init_result = subprocess.run(
-                ["terraform", "init"],
-                capture_output=True,
-                text=True,
-                timeout=300
-            )
-            
-            if init_result.returncode != 0:
-                return {
-                    "success": False,
-                    "message": f"❌ Terraform init failed for {machine_name}",
-                    "output": self._clean_terraform_output(init_result.stderr)
-                }
-            
-            # Run terraform plan
-            plan_result = subprocess.run(
-                ["terraform", "plan"],
-                capture_output=True,
-                text=True,
-                timeout=300
-            )
-            
-            if plan_result.returncode != 0:
-                return {
-                    "success": False,
-                    "message": f"❌ Terraform plan failed for {machine_name}",
-                    "output": self._clean_terraform_output(plan_result.stderr)
-                }
-            
-            # Run terraform apply
-            apply_result = subprocess.run(
-                ["terraform", "apply", "-auto-approve"],
-                capture_output=True,
-                text=True,
-                timeout=600
-            )
-            
-            if apply_result.returncode != 0:
-                return {
-                    "success": False,
-                    "message": f"❌ Terraform apply failed for {machine_name}",
-                    "output": self._clean_terraform_output(apply_result.stderr)
-                }
-            
+            # Commands get the deployment directory as cwd: os.chdir is
+            # process wide and not safe once requests run in threads
+            with inflight_operations.track("terraform"):
+                # Run terraform init, an initialized workspace can skip it
+                if run_init:
+                    init_args = ["init", "-input=false"]
+                    # A redeployed workspace moves its local state to the HTTP backend
+                    if os.path.exists(f"{deployment_dir}/backend.tf") and \
+                            os.path.exists(f"{deployment_dir}/terraform.tfstate"):
+                        init_args.append("-force-copy")
+                    init_result = run_terraform_phase("init", init_args, deployment_dir, timeout=300,
+                                                      timings=timings, workload=workload)
+
+                    if init_result.returncode != 0:
+                        return {
+                            "success": False,
+                            "message": f"❌ Terraform init failed for {machine_name}",
+                            "output": self._clean_terraform_output(init_result.stderr)
+                        }
+
+                # Run terraform plan
+                plan_result = run_terraform_phase("plan", ["plan", *self.lock_args], deployment_dir, timeout=300,
+                                                  timings=timings, workload=workload)
+
+                if plan_result.returncode != 0:
+                    return {
+                        "success": False,
+                        "message": f"❌ Terraform plan failed for {machine_name}",
+                        "output": self._clean_terraform_output(plan_result.stderr)
+                    }
+
+                # Run terraform apply
+                apply_result = run_terraform_phase("apply", ["apply", "-auto-approve", *self.lock_args],
+                                                   deployment_dir, timeout=600, timings=timings, workload=workload)
+
+                if apply_result.returncode != 0:
+                    return {
+                        "success": False,
+                        "message": f"❌ Terraform apply failed for {machine_name}",
+                        "output": self._clean_terraform_output(apply_result.stderr)
+                    }
+
             # Extract and format deployment summary
             cleaned_output = self._clean_terraform_output(apply_result.stdout)
             summary = self._extract_deployment_summary(cleaned_output, machine_name)
@@ -626,9 +790,6 @@ class DeploymentService:
                 "message": f"💥 Terraform deployment error for {machine_name}: {str(e)}",
                 "output": str(e)
             }
-        finally:
-            # Always return to original directory
-            os.chdir(original_cwd)
 
     def list_deployments(self):
         """List all current deployments"""
@@ -649,54 +810,238 @@ class DeploymentService:
         return deployments
 
     def destroy_machine(self, machine_id):
-        """Destroy a deployed machine using terraform destroy"""
-        deployment_dir = f"{self.deployments_base_path}/{machine_id}"
-        
-        if not os.path.exists(deployment_dir):
+        """Destroy the deployment holding a machine (the whole vm-pack for one of its members)"""
+        report = self.destroy_machines([machine_id])
+        if not report["results"]:
             return {
                 "success": False,
                 "message": f"Deployment not found for machine {machine_id}"
             }
-        
+        result = report["results"][0]
+        return {key: result[key] for key in ("success", "message", "output")}
+
+    def destroy_machines(self, targets):
+        """
+        Destroy the workspaces holding the targets, and the containers adopted from the
+        warm pool, in parallel through the operation scheduler, then forget their machines
+        in a single tracking update
+        :param targets: machine IDs, pack IDs, or "all"
+        :return: dict with the per-workspace "results", the "removed" machine IDs
+                 and the "unresolved" targets
+        """
+        workspaces, unresolved = self.resolve_workspaces(targets)
+        operations = {workspace: (partial(self._destroy_workspace, workspace), machine_ids)
+                      for workspace, machine_ids in workspaces.items()}
+        # Adopted containers have no workspace, the operation is queued under their machine ID
+        adopted = self._adopted_machines()
+        for machine_id in (list(adopted) if targets == "all" else unresolved):
+            if machine_id in adopted:
+                operations[machine_id] = (partial(self._destroy_adopted, adopted[machine_id]), {machine_id})
+        unresolved = [target for target in unresolved if target not in operations]
+
+        if self.scheduler is None:
+            outcomes = {key: function() for key, (function, _) in operations.items()}
+        else:
+            futures = {key: self.scheduler.submit(key, "destroy", function, key)[1]
+                       for key, (function, _) in operations.items()}
+            outcomes = {key: future.result() for key, future in futures.items()}
+
+        results = []
+        for key, result in outcomes.items():
+            result.update(workspace=key, machine_ids=sorted(operations[key][1]))
+            results.append(result)
+        removed = [machine_id for result in results if result["success"] for machine_id in result["machine_ids"]]
+        if removed:
+            self.tracking_service.remove_machines(removed)
+        return {"results": results, "removed": removed, "unresolved": unresolved}
+
+    def _adopted_machines(self):
+        """
+        :return: dict machine ID -> tracked machine, for the containers adopted from the warm pool
+        """
+        if self.warm_pool is None:
+            return {}
+        return {machine["id"]: machine for machine in self.tracking_service.get_deployed_machines()
+                if machine.get("provisioner") == "warm-pool"}
+
+    def _destroy_adopted(self, machine):
+        """Delete a container adopted from the warm pool through the Proxmox API"""
+        node = machine.get("node") or self.proxmox_client.node
+        if not self.warm_pool.destroy(int(machine["id"]), node):
+            return {
+                "success": False,
+                "message": f"❌ Could not destroy {machine['name']} on {node}",
+                "output": ""
+            }
+        return {
+            "success": True,
+            "message": f"🗑️  Successfully destroyed {machine['name']}",
+            "output": ""
+        }
+
+    def resolve_workspaces(self, targets):
+        """
+        Map machine IDs, pack IDs or "all" to the Terraform workspaces holding them.
+        vm-pack members are tracked under their own VMID but share the pack's workspace,
+        and single machines are tracked under their VMID but deployed under their original ID.
+        :return: (dict workspace -> set of tracked machine IDs, list of unresolved targets)
+        """
+        index = self._workspace_index()
+        by_vmid = {vmid: workspace for workspace, vmids in index.items() for vmid in vmids}
+        owners = self.tracked_workspaces(self.tracking_service.get_deployed_machines(), index)
+
+        if targets == "all":
+            targets = list(index)
+        workspaces = {}
+        unresolved = []
+        for target in targets:
+            target = str(target)
+            workspace = target if target in index else owners.get(target) or by_vmid.get(target)
+            if workspace is None:
+                unresolved.append(target)
+            else:
+                workspaces.setdefault(workspace, set())
+        for machine_id, workspace in owners.items():
+            if workspace in workspaces:
+                workspaces[workspace].add(machine_id)
+        return workspaces, unresolved
+
+    def tracked_workspaces(self, machines, index=None):
+        """
+        :return: dict tracked machine ID -> workspace holding it, for the machines whose workspace exists
+        """
+        index = self._workspace_index() if index is None else index
+        by_vmid = {vmid: workspace for workspace, vmids in index.items() for vmid in vmids}
+        owners = {}
+        for machine in machines:
+            machine_id = machine["id"]
+            workspace = machine.get("pack_id") or by_vmid.get(machine_id) or machine_id
+            if workspace in index:
+                owners[machine_id] = workspace
+        return owners
+
+    def _workspace_index(self):
+        """
+        :return: dict deployment directory name -> VMIDs (as str) its tfvars create
+        """
+        return {workspace: {str(vmid) for vmid in self.tfvars_vmids(tfvars)}
+                for workspace, tfvars in self.workspace_tfvars().items()}
+
+    def workspace_tfvars(self):
+        """
+        :return: dict deployment directory name -> its parsed terraform.tfvars (empty if missing)
+        """
+        workspaces = {}
+        if not os.path.exists(self.deployments_base_path):
+            return workspaces
+        for workspace in os.listdir(self.deployments_base_path):
+            deployment_dir = os.path.join(self.deployments_base_path, workspace)
+            if os.path.isdir(deployment_dir):
+                workspaces[workspace] = self._read_tfvars(os.path.join(deployment_dir, "terraform.tfvars"))
+        return workspaces
+
+    def workspace_workload(self, workspace):
+        """
+        :return: template type of the machine a workspace deploys, None if unknown
+        """
+        machine = self._load_machine_config(os.path.join(self.deployments_base_path, workspace))
+        return self._workload(machine) if machine else None
+
+    @staticmethod
+    def tfvars_vmids(tfvars):
+        """VMIDs created by a workspace: vm_id, or the start_vmid range of a vm-pack"""
+        if tfvars.get("start_vmid", "").isdigit() and tfvars.get("vm_count", "").isdigit():
+            first = int(tfvars["start_vmid"])
+            return list(range(first, first + int(tfvars["vm_count"])))
+        if tfvars.get("vm_id", "").isdigit():
+            return [int(tfvars["vm_id"])]
+        return []
+
+    def _destroy_workspace(self, workspace):
+        """Run terraform destroy in a deployment directory and remove it on success"""
+        deployment_dir = f"{self.deployments_base_path}/{workspace}"
+        if not os.path.isdir(deployment_dir):
+            # Destroyed by an operation queued before this one
+            return {
+                "success": False,
+                "message": f"Deployment not found for {workspace}",
+                "output": ""
+            }
+        started_at = time.time()
+        timings = []
         try:
-            original_cwd = os.getcwd()
-            os.chdir(deployment_dir)
-            
+            machine = self._load_machine_config(deployment_dir) or {"id": workspace}
             # Run terraform destroy
-            destroy_result = subprocess.run(
-                ["terraform", "destroy", "-auto-approve"],
-                capture_output=True,
-                text=True,
-                timeout=600
+            with inflight_operations.track("terraform"):
+                destroy_result = run_terraform_phase("destroy", ["destroy", "-auto-approve", *self.lock_args],
+                                                     deployment_dir, timeout=600, timings=timings,
+                                                     workload=self._workload(machine))
+            self._record_history(
+                "destroy", machine, started_at, timings,
+                {"success": destroy_result.returncode == 0,
+                 "output": self._clean_terraform_output(destroy_result.stdout)}
             )
             
             if destroy_result.returncode != 0:
                 return {
                     "success": False,
-                    "message": f"❌ Terraform destroy failed for {machine_id}",
+                    "message": f"❌ Terraform destroy failed for {workspace}",
                     "output": self._clean_terraform_output(destroy_result.stderr)
                 }
             
-            # Remove deployment directory
+            # Remove deployment directory, and its state versions when the backend keeps them
+            backend_managed = os.path.exists(f"{deployment_dir}/backend.tf")
             shutil.rmtree(deployment_dir)
-            
-            # Remove from tracking
-            self.tracking_service.remove_machine(machine_id)
+            if backend_managed and self.state_store:
+                self.state_store.delete(workspace)
             
             return {
                 "success": True,
-                "message": f"🗑️  Successfully destroyed {machine_id}",
+                "message": f"🗑️  Successfully destroyed {workspace}",
                 "output": self._clean_terraform_output(destroy_result.stdout)
             }
             
         except Exception as e:
             return {
                 "success": False,
-                "message": f"Error destroying {machine_id}: {str(e)}",
+                "message": f"Error destroying {workspace}: {str(e)}",
                 "output": str(e)
             }
-        finally:
-            os.chdir(original_cwd) 
+
+    @staticmethod
+    def _load_machine_config(deployment_dir):
+        """Machine configuration saved next to a deployment, None if missing"""
+        config_path = f"{deployment_dir}/machine_config.json"
+        if not os.path.exists(config_path):
+            return None
+        with open(config_path, 'r') as f:
+            return json.load(f)
+
+    def _record_history(self, operation, machine, started_at, timings, result):
+        """Append a Terraform run, with its phase durations, to the performance history"""
+        try:
+            try:
+                template_type = self._get_template_type(machine)
+            except (KeyError, ValueError):
+                template_type = None
+            advanced = machine.get("advanced", {})
+            output = result.get("output", "") or ""
+            self.history.record({
+                "started_at": round(started_at, 3),
+                "operation": operation,
+                "machine_id": machine.get("id"),
+                "machine_name": machine.get("name"),
+                "base_type": machine.get("baseType"),
+                "template_type": template_type,
+                "perf": advanced.get("perf", "medium"),
+                "count": machine.get("group", {}).get("count", 1),
+                "success": bool(result.get("success")),
+                "total_seconds": round(time.time() - started_at, 3),
+                "phases": timings,
+                "resources": parse_resource_counts(output) if result.get("success") else None
+            })
+        except Exception as e:
+            logging.warning(f"Could not record Terraform history: {e}")
 
     def _clean_terraform_output(self, output):
         """Clean up Terraform output by removing ANSI color codes and improving readability"""
@@ -730,7 +1075,7 @@ class DeploymentService:
             }
             
             # Look for resource creation information
-            for line in lines:
+            for index, line in enumerate(lines):
                 if "Resources:" in line:
                     # Extract number of resources created
                     match = re.search(r'(\d+) added', line)
@@ -742,7 +1087,7 @@ class DeploymentService:
                     # Parse outputs to extract useful information
                     in_outputs = True
                     current_output = ""
-                    for output_line in lines[lines.index(line):]:
+                    for output_line in lines[index:]:
                         if output_line.strip() == "":
                             break
                         if "=" in output_line and not output_line.startswith(" "):
@@ -802,59 +1147,219 @@ class DeploymentService:
         return message.strip() 
     
     def update_machine(self, machine_id, updated_config):
-        """Update an existing machine using its terraform state"""
+        """
+        Update an existing machine, doing only what the changed fields need: nothing,
+        a Proxmox config change for hot-pluggable fields, or a Terraform plan and apply
+        :return: dict with success, message, the "mode" used and the tfvars "changes"
+        """
         try:
-            deployment_dir = f"{self.deployments_base_path}/{machine_id}"
-            
-            if not os.path.exists(deployment_dir):
+            workspaces, _ = self.resolve_workspaces([machine_id])
+            adopted = self._adopted_machines().get(str(machine_id)) if not workspaces else None
+            if adopted is not None:
+                return self._schedule(
+                    adopted["id"], "update", lambda: self._update_adopted(adopted["id"], updated_config), machine_id
+                )
+            if not workspaces:
                 return {
                     "success": False,
                     "message": f"Deployment directory not found for machine {machine_id}"
                 }
+            workspace, machine_ids = next(iter(workspaces.items()))
+            return self._schedule(
+                workspace, "update",
+                lambda: self._update_workspace(workspace, machine_ids, machine_id, updated_config), machine_id
+            )
+        except Exception as e:
+            logging.error(f"Error updating machine {machine_id}: {e}")
+            return {
+                "success": False,
+                "message": f"Error updating machine: {str(e)}"
+            }
+
+    def _update_workspace(self, workspace, machine_ids, machine_id, updated_config):
+        """Apply a machine update to its workspace, see update_machine"""
+        try:
+            deployment_dir = f"{self.deployments_base_path}/{workspace}"
             
-            # Load existing machine config
-            config_path = f"{deployment_dir}/machine_config.json"
-            if os.path.exists(config_path):
-                with open(config_path, 'r') as f:
-                    existing_config = json.load(f)
-                
-                # Merge updated config with existing config
-                merged_config = {**existing_config, **updated_config}
-                
-                # Save updated config
-                with open(config_path, 'w') as f:
-                    json.dump(merged_config, f, indent=2)
-                
-                # Generate new terraform.tfvars
-                tfvars_content = self._generate_tfvars(merged_config)
-                tfvars_path = f"{deployment_dir}/terraform.tfvars"
-                
-                with open(tfvars_path, 'w') as f:
-                    f.write(tfvars_content)
-                
-                # Run terraform apply to update the machine
-                result = self._run_terraform(deployment_dir, merged_config["name"])
-                
-                if result["success"]:
-                    # Update tracking with new config
-                    self.tracking_service.add_deployed_machine(merged_config, result)
-                    
-                    return {
-                        "success": True,
-                        "message": f"✅ Successfully updated {merged_config['name']}",
-                        "output": result.get("output", "")
-                    }
-                else:
-                    return result
-            else:
+            # Load existing machine config, gone if a queued destroy ran first
+            existing_config = self._load_machine_config(deployment_dir)
+            if existing_config is None:
                 return {
                     "success": False,
                     "message": f"Machine configuration not found for {machine_id}"
                 }
+
+            # Merge updated config with existing config, the workspace keeps its ID
+            merged_config = {**existing_config, **updated_config, "id": existing_config.get("id", workspace)}
+
+            # Keep the VMID: a new one would mean a full cluster scan and a replaced guest
+            tfvars_path = f"{deployment_dir}/terraform.tfvars"
+            current_tfvars = self._read_tfvars(tfvars_path)
+            vmid_key = "start_vmid" if merged_config["baseType"] == "vmPack" else "vm_id"
+            kept_vmid = int(current_tfvars[vmid_key]) if current_tfvars.get(vmid_key, "").isdigit() else None
+            # Keep the node, storage and clone mode too: changing them would replace the guest
+            kept = {
+                "node": current_tfvars.get("proxmox_node"),
+                "storage_pool": current_tfvars.get("storage_pool"),
+                "clone_mode": {"true": "full", "false": "linked"}.get(current_tfvars.get("full_clone"))
+            }
+            merged_config["advanced"] = dict(merged_config.get("advanced", {}))
+            for key, value in kept.items():
+                if value and not merged_config["advanced"].get(key):
+                    merged_config["advanced"][key] = value
+            tfvars = self._build_tfvars(merged_config, kept_vmid)
+            tfvars_content = self._render_tfvars(tfvars)
+            changes = self._diff_tfvars(current_tfvars, self._parse_tfvars(tfvars_content))
+
+            template_type = self._get_template_type(merged_config)
+            mode = "terraform"
+            if not changes:
+                mode = "none"
+            elif set(changes) <= HOT_FIELDS[template_type].keys() and \
+                    self._apply_hot_changes(tfvars, template_type, changes):
+                mode = "hot"
+
+            # Save updated config and variables, Terraform then sees no difference for hot changes
+            with open(f"{deployment_dir}/machine_config.json", 'w') as f:
+                json.dump(merged_config, f, indent=2)
+            with open(tfvars_path, 'w') as f:
+                f.write(tfvars_content)
+
+            if mode != "terraform":
+                self.tracking_service.update_machines_config(machine_ids, updated_config)
+                message = f"✅ Successfully updated {merged_config['name']}" if changes else \
+                    f"No change to apply to {merged_config['name']}"
+                return {"success": True, "message": message, "mode": mode, "changes": changes}
+
+            # Run terraform plan and apply to update the machine
+            started_at = time.time()
+            timings = []
+            result = self._run_terraform(deployment_dir, merged_config["name"], timings,
+                                         run_init=not os.path.isdir(f"{deployment_dir}/.terraform"),
+                                         workload=template_type)
+            self._record_history("update", merged_config, started_at, timings, result)
+
+            if not result["success"]:
+                return dict(result, mode=mode, changes=changes)
+
+            # Update tracking with new config
+            self.tracking_service.add_deployed_machine(merged_config, result)
+            return {
+                "success": True,
+                "message": f"✅ Successfully updated {merged_config['name']}",
+                "output": result.get("output", ""),
+                "mode": mode,
+                "changes": changes
+            }
                 
         except Exception as e:
             logging.error(f"Error updating machine {machine_id}: {e}")
             return {
                 "success": False,
                 "message": f"Error updating machine: {str(e)}"
-            } 
\ No newline at end of file
+            }
+
+    def _update_adopted(self, machine_id, updated_config):
+        """
+        Update a container adopted from the warm pool: without a workspace, only the
+        fields the Proxmox config API changes in place are accepted
+        """
+        machine = self._adopted_machines().get(machine_id)
+        if machine is None:
+            return {
+                "success": False,
+                "message": f"Machine {machine_id} is no longer tracked"
+            }
+        config = machine["config"]
+        merged_config = {**config, **updated_config, "id": config["id"]}
+        # The container keeps its VMID and node
+        merged_config["advanced"] = dict(merged_config.get("advanced", {}), **{
+            key: config["advanced"][key] for key in ("vmid", "node", "provisioner") if key in config["advanced"]
+        })
+        tfvars = self._build_tfvars(merged_config)
+        changes = self._diff_tfvars(self._parse_tfvars(self._render_tfvars(self._build_tfvars(config))),
+                                    self._parse_tfvars(self._render_tfvars(tfvars)))
+        if changes and not (set(changes) <= CT_HOT_FIELDS.keys()):
+            return {
+                "success": False,
+                "message": f"{merged_config['name']} was adopted from the warm pool: only "
+                           f"{', '.join(sorted(CT_HOT_FIELDS))} can change, redeploy it for other changes",
+                "mode": "none",
+                "changes": changes
+            }
+        if changes and not self._apply_hot_changes(tfvars, "linux-ct", changes):
+            return {
+                "success": False,
+                "message": f"❌ Proxmox refused the update of {merged_config['name']}",
+                "mode": "hot",
+                "changes": changes
+            }
+        self.tracking_service.update_machines_config([machine_id], {key: merged_config[key] for key in updated_config})
+        message = f"✅ Successfully updated {merged_config['name']}" if changes else \
+            f"No change to apply to {merged_config['name']}"
+        return {"success": True, "message": message, "mode": "hot" if changes else "none", "changes": changes}
+
+    @staticmethod
+    def _parse_tfvars(content):
+        """terraform.tfvars content as a dict of raw values, strings unquoted"""
+        tfvars = {}
+        for line in content.splitlines():
+            key, separator, value = line.partition("=")
+            if separator:
+                value = value.strip()
+                if len(value) >= 2 and value[0] == value[-1] == '"':
+                    value = value[1:-1]
+                tfvars[key.strip()] = value
+        return tfvars
+
+    def _read_tfvars(self, path):
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return self._parse_tfvars(f.read())
+
+    @staticmethod
+    def _diff_tfvars(current, new):
+        """
+        :return: dict variable -> {"from", "to"} of the variables that differ,
+                 provider settings excluded since they do not change the guest
+        """
+        return {
+            key: {"from": current.get(key), "to": new.get(key)}
+            for key in current.keys() | new.keys()
+            if key not in PROVIDER_FIELDS and current.get(key) != new.get(key)
+        }
+
+    def _apply_hot_changes(self, tfvars, template_type, changes):
+        """
+        Change hot-pluggable settings of the running guests through the Proxmox config API
+        :return: True if every guest accepted the change
+        """
+        try:
+            params = {}
+            for key in changes:
+                value = tfvars.get(key)
+                if value is None or key not in HOT_FIELDS[template_type]:
+                    # A removed setting has no value to push, only Terraform can reset it
+                    logging.info(f"{key} cannot be changed through Proxmox, falling back to Terraform")
+                    return False
+                params[HOT_FIELDS[template_type][key]] = int(value) if isinstance(value, bool) else value
+            if template_type == "vm-pack":
+                vmids = range(int(tfvars["start_vmid"]), int(tfvars["start_vmid"]) + int(tfvars["vm_count"]))
+            else:
+                vmids = [tfvars["vm_id"]]
+            guest_type = "lxc" if template_type in ("linux-ct", "vm-pack") else "qemu"
+
+            node = tfvars.get("proxmox_node") or self.proxmox_client.node
+            for vmid in vmids:
+                response = self.proxmox_client.request("PUT", f"/nodes/{node}/{guest_type}/{vmid}/config",
+                                                       data=params)
+                if response.status_code != 200:
+                    logging.warning(f"Proxmox refused the config change of {vmid} ({response.status_code}), "
+                                    f"falling back to Terraform")
+                    return False
+            logging.info(f"Applied {', '.join(params)} to {len(vmids)} guests without Terraform")
+            return True
+        except Exception as e:
+            logging.warning(f"Could not apply the config change through Proxmox, falling back to Terraform: {e}")
+            return False
@@ -3,6 +3,7 @@ import json
 import logging
 from datetime import datetime
 from pathlib import Path
+from infrastructure.data.shared_state import file_lock, atomic_write_json
 
 class DeploymentTrackingService:
     def __init__(self, config_manager):
@@ -15,9 +16,9 @@ class DeploymentTrackingService:
     
     def _initialize_tracking_file(self):
         """Initialize the tracking file if it doesn't exist"""
-        if not os.path.exists(self.tracking_file):
-            with open(self.tracking_file, 'w') as f:
-                json.dump({"machines": []}, f, indent=2)
+        with file_lock(self.tracking_file):
+            if not os.path.exists(self.tracking_file):
+                atomic_write_json(self.tracking_file, {"machines": []})
     
     def _load_deployed_machines(self):
         """Load deployed machines from the tracking file"""
@@ -30,25 +31,25 @@ class DeploymentTrackingService:
             return []
     
     def _save_deployed_machines(self, machines):
-        """Save deployed machines to the tracking file"""
+        """Save deployed machines to the tracking file (caller holds the file lock)"""
         try:
-            with open(self.tracking_file, 'w') as f:
-                json.dump({"machines": machines}, f, indent=2)
+            atomic_write_json(self.tracking_file, {"machines": machines})
         except Exception as e:
             logging.error(f"Error saving deployed machines: {e}")
     
     def add_deployed_machine(self, machine_config, deployment_result):
         """Add a successfully deployed machine to tracking"""
         try:
-            machines = self._load_deployed_machines()
-            
-            # Check if this is a vm-pack deployment
-            if machine_config.get("baseType") == "vmPack":
-                self._add_vmpack_machines(machines, machine_config, deployment_result)
-            else:
-                self._add_single_machine(machines, machine_config, deployment_result)
-            
-            self._save_deployed_machines(machines)
+            with file_lock(self.tracking_file):
+                machines = self._load_deployed_machines()
+
+                # Check if this is a vm-pack deployment
+                if machine_config.get("baseType") == "vmPack":
+                    self._add_vmpack_machines(machines, machine_config, deployment_result)
+                else:
+                    self._add_single_machine(machines, machine_config, deployment_result)
+
+                self._save_deployed_machines(machines)
             
         except Exception as e:
             logging.error(f"Error adding deployed machine to tracking: {e}")
@@ -102,6 +103,10 @@ class DeploymentTrackingService:
                     if clean_mac:
                         vm_macs.append(clean_mac)
             
+            # Drop the entries these containers replace in a single pass
+            pack_ids = {str(vmid) for vmid in vm_ids}
+            machines[:] = [m for m in machines if m["id"] not in pack_ids]
+            
             # Create entries for each container
             for i in range(len(vm_ids)):
                 if i < len(vm_ids):
@@ -124,15 +129,13 @@ class DeploymentTrackingService:
                         "ip_address": ip,
                         "mac_address": mac,
                         "status": "deployed",
+                        "node": machine_config.get("advanced", {}).get("node"),
                         "terraform_state_path": f"deployments/{machine_config['id']}/terraform.tfstate",
                         "config": individual_config,
                         "deployment_result": deployment_result,
                         "pack_id": machine_config["id"]  # Reference to original pack
                     }
                     
-                    # Remove existing machine with same ID if it exists
-                    machines[:] = [m for m in machines if m["id"] != str(vmid)]
-                    
                     # Add the new machine
                     machines.append(deployed_machine)
                     logging.info(f"Added container to tracking: {name} (ID: {vmid})")
@@ -177,11 +180,17 @@ class DeploymentTrackingService:
                 "deployment_time": datetime.now().isoformat(),
                 "ip_address": ip_address,
                 "status": "deployed",
+                "node": machine_config.get("advanced", {}).get("node"),
+                "clone_mode": machine_config.get("advanced", {}).get("clone_mode"),
                 "terraform_state_path": f"deployments/{id_to_use}/terraform.tfstate",
                 "config": updated_config,
                 "deployment_result": deployment_result
             }
             
+            # Containers adopted from the warm pool have no Terraform workspace
+            if machine_config.get("advanced", {}).get("provisioner"):
+                deployed_machine["provisioner"] = machine_config["advanced"]["provisioner"]
+            
             # Remove existing machine with same ID if it exists
             machines[:] = [m for m in machines if m["id"] != id_to_use]
             
@@ -221,12 +230,11 @@ class DeploymentTrackingService:
             # Look for IP addresses in the output
             import re
             ip_pattern = r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b'
-            ip_matches = re.findall(ip_pattern, output)
-            if ip_matches:
-                # Return the first valid IP that's not localhost
-                for ip in ip_matches:
-                    if not ip.startswith("127.") and not ip.startswith("0."):
-                        return ip
+            # Return the first valid IP that's not localhost, without scanning the rest of the output
+            for ip_match in re.finditer(ip_pattern, output):
+                ip = ip_match.group(0)
+                if not ip.startswith("127.") and not ip.startswith("0."):
+                    return ip
             
             return "Unknown"
         except Exception as e:
@@ -248,17 +256,18 @@ class DeploymentTrackingService:
     def update_machine_status(self, machine_id, status, ip_address=None):
         """Update the status of a deployed machine"""
         try:
-            machines = self._load_deployed_machines()
-            
-            for machine in machines:
-                if machine["id"] == machine_id:
-                    machine["status"] = status
-                    machine["last_updated"] = datetime.now().isoformat()
-                    if ip_address:
-                        machine["ip_address"] = ip_address
-                    break
-            
-            self._save_deployed_machines(machines)
+            with file_lock(self.tracking_file):
+                machines = self._load_deployed_machines()
+
+                for machine in machines:
+                    if machine["id"] == machine_id:
+                        machine["status"] = status
+                        machine["last_updated"] = datetime.now().isoformat()
+                        if ip_address:
+                            machine["ip_address"] = ip_address
+                        break
+
+                self._save_deployed_machines(machines)
             logging.info(f"Updated machine status: {machine_id} -> {status}")
             
         except Exception as e:
@@ -267,14 +276,44 @@ class DeploymentTrackingService:
     def remove_machine(self, machine_id):
         """Remove a machine from tracking (when destroyed)"""
         try:
-            machines = self._load_deployed_machines()
-            machines = [m for m in machines if m["id"] != machine_id]
-            self._save_deployed_machines(machines)
+            with file_lock(self.tracking_file):
+                machines = self._load_deployed_machines()
+                machines = [m for m in machines if m["id"] != machine_id]
+                self._save_deployed_machines(machines)
             logging.info(f"Removed machine from tracking: {machine_id}")
             
         except Exception as e:
             logging.error(f"Error removing machine from tracking: {e}")
     
+    def remove_machines(self, machine_ids):
+        """Remove several machines from tracking in a single update"""
+        machine_ids = set(machine_ids)
+        try:
+            with file_lock(self.tracking_file):
+                machines = self._load_deployed_machines()
+                machines = [m for m in machines if m["id"] not in machine_ids]
+                self._save_deployed_machines(machines)
+            logging.info(f"Removed {len(machine_ids)} machines from tracking")
+            
+        except Exception as e:
+            logging.error(f"Error removing machines from tracking: {e}")
+    
+    def update_machines_config(self, machine_ids, config_changes):
+        """Merge configuration changes into several tracked machines, their IDs kept"""
+        machine_ids = set(machine_ids)
+        try:
+            with file_lock(self.tracking_file):
+                machines = self._load_deployed_machines()
+                for machine in machines:
+                    if machine["id"] in machine_ids:
+                        config = machine.setdefault("config", {})
+                        config.update({key: value for key, value in config_changes.items() if key != "id"})
+                        machine["last_updated"] = datetime.now().isoformat()
+                self._save_deployed_machines(machines)
+            
+        except Exception as e:
+            logging.error(f"Error updating tracked machines config: {e}")
+    
     def get_terraform_state_path(self, machine_id):
         """Get the terraform state path for a machine"""
         machine = self.get_machine_by_id(machine_id)
@@ -0,0 +1,142 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from infrastructure.data.terraform_utils import run_terraform_phase
+
+# Range the deployment service allocates VMIDs from: unknown guests there were created by us
+MANAGED_VMIDS = range(5000, 7001)
+POWER_STATES = ("running", "stopped")
+
+
+class DriftService:
+    """
+    Compare one snapshot of the cluster with the tracked machines and the
+    stored configuration of every deployment, without running Terraform
+    """
+
+    def __init__(self, cluster_inventory, tracking_service, deployment_service):
+        self.cluster_inventory = cluster_inventory
+        self.tracking_service = tracking_service
+        self.deployment_service = deployment_service
+
+    def detect(self, plan=False, parallel=4):
+        """
+        :param plan: also run terraform plan -refresh-only in the flagged workspaces
+        :return: dict with the "missing", "orphaned" and "divergent" machines,
+                 the flagged "workspaces" and a "summary", None if Proxmox could not be reached
+        """
+        self.cluster_inventory.invalidate()
+        guests = self.cluster_inventory.get_guests()
+        if guests is None:
+            return None
+
+        workspaces = self.deployment_service.workspace_tfvars()
+        tracked = {machine["id"]: machine for machine in self.tracking_service.get_deployed_machines()}
+        owners = self.deployment_service.tracked_workspaces(tracked.values())
+
+        expected = {}  # vmid -> (workspace, tfvars)
+        for workspace, tfvars in workspaces.items():
+            for vmid in self.deployment_service.tfvars_vmids(tfvars):
+                expected[vmid] = (workspace, tfvars)
+
+        missing = []
+        orphaned = []
+        divergent = []
+        for vmid, (workspace, tfvars) in sorted(expected.items()):
+            machine = tracked.get(str(vmid))
+            guest = guests.get(vmid)
+            if guest is None:
+                missing.append({"vmid": vmid, "workspace": workspace, "tracked": machine is not None})
+                continue
+            differences = self._differences(guest, tfvars, machine)
+            if differences:
+                divergent.append({"vmid": vmid, "workspace": workspace, "name": guest.get("name"),
+                                  "differences": differences})
+
+        for machine_id, machine in sorted(tracked.items()):
+            vmid = int(machine_id) if machine_id.isdigit() else None
+            # Containers adopted from the warm pool are managed without a workspace
+            if machine_id in owners or (machine.get("provisioner") == "warm-pool" and vmid in guests):
+                continue
+            orphaned.append({"vmid": vmid, "machine_id": machine_id, "name": machine.get("name"),
+                             "reason": "tracked without deployment", "exists": vmid in guests})
+        tracked_vmids = {int(machine_id) for machine_id in tracked if machine_id.isdigit()}
+        for vmid, guest in sorted(guests.items()):
+            if vmid in MANAGED_VMIDS and vmid not in expected and vmid not in tracked_vmids:
+                orphaned.append({"vmid": vmid, "machine_id": None, "name": guest.get("name"),
+                                 "reason": "guest without deployment", "exists": True})
+
+        flagged = sorted({item["workspace"] for item in missing + divergent})
+        report = {
+            "checked_at": time.time(),
+            "summary": {
+                "guests": len(guests),
+                "deployments": len(workspaces),
+                "tracked": len(tracked),
+                "missing": len(missing),
+                "orphaned": len(orphaned),
+                "divergent": len(divergent)
+            },
+            "missing": missing,
+            "orphaned": orphaned,
+            "divergent": divergent,
+            "workspaces": flagged
+        }
+        if plan and flagged:
+            report["plans"] = self._refresh_plans(flagged, parallel)
+        return report
+
+    @staticmethod
+    def _differences(guest, tfvars, machine):
+        """
+        :return: list of {"field", "expected", "actual"} between a live guest and its stored configuration
+        """
+        differences = []
+
+        def compare(field, expected, actual):
+            if expected is not None and actual is not None and expected != actual:
+                differences.append({"field": field, "expected": expected, "actual": actual})
+
+        compare("node", tfvars.get("proxmox_node"), guest.get("node"))
+        if tfvars.get("cores", "").isdigit():
+            compare("cores", int(tfvars["cores"]), guest.get("maxcpu"))
+        if tfvars.get("memory", "").isdigit() and guest.get("maxmem") is not None:
+            compare("memory", int(tfvars["memory"]), int(guest["maxmem"]) // (1024 * 1024))
+        if machine is None:
+            differences.append({"field": "tracking", "expected": "tracked", "actual": "untracked"})
+        elif machine.get("status") in POWER_STATES:
+            compare("status", machine["status"], guest.get("status"))
+        return differences
+
+    def _refresh_plans(self, workspaces, parallel):
+        """
+        Run terraform plan -refresh-only in each workspace
+        :return: dict workspace -> {"drifted", "exit_code", "output"}
+        """
+        def refresh(workspace):
+            deployment_dir = os.path.join(self.deployment_service.deployments_base_path, workspace)
+            if not os.path.isdir(os.path.join(deployment_dir, ".terraform")):
+                return {"drifted": None, "exit_code": None, "output": "Workspace is not initialized"}
+            try:
+                # Read-only, no need to queue behind a running apply for the workspace lock
+                result = run_terraform_phase(
+                    "refresh", ["plan", "-refresh-only", "-detailed-exitcode", "-input=false", "-no-color",
+                                "-lock=false"],
+                    deployment_dir, timeout=300, workload=self.deployment_service.workspace_workload(workspace)
+                )
+            except Exception as e:
+                logging.warning(f"Refresh plan of {workspace} failed: {e}")
+                return {"drifted": None, "exit_code": None, "output": str(e)}
+            # -detailed-exitcode: 0 no changes, 1 error, 2 changes
+            output = result.stdout if result.returncode != 1 else result.stderr
+            return {
+                "drifted": {0: False, 2: True}.get(result.returncode),
+                "exit_code": result.returncode,
+                "output": output[-4000:]
+            }
+
+        with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(workspaces))),
+                                thread_name_prefix="drift-plan") as executor:
+            return dict(zip(workspaces, executor.map(refresh, workspaces)))
@@ -2,9 +2,11 @@ import os
 import subprocess
 import json
 import logging
+import re
 import requests
 import urllib3
 from datetime import datetime
+from infrastructure.data.proxmox_client import ProxmoxClient
 
 # Disable SSL warnings for Proxmox API calls
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -13,41 +15,25 @@ class HealthCheckService:
     def __init__(self, config_manager):
         self.config_manager = config_manager
         self.base_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.proxmox_client = ProxmoxClient(config_manager)
     
-    def get_machine_ip_from_proxmox(self, machine_id, vm_id):
-        """Get machine IP address from Proxmox API"""
+    def get_machine_ip_from_proxmox(self, machine_id, vm_id, node=None):
+        """Get machine IP address from Proxmox API, on the machine's node (the configured one by default)"""
         try:
-            proxmox_server = self.config_manager.get("PROXMOX_SERVER")
-            proxmox_token = self.config_manager.get("PVEAPITOKEN")
-            proxmox_node = self.config_manager.get("NODE")
-            
-            if not all([proxmox_server, proxmox_token, proxmox_node]):
-                logging.error("Missing Proxmox configuration")
-                return None
-            
-            # Parse token
-            token_parts = proxmox_token.split("!")
-            if len(token_parts) != 2:
-                logging.error("Invalid Proxmox token format")
+            try:
+                proxmox_node = node or self.proxmox_client.node
+            except ValueError as e:
+                logging.error(f"Proxmox configuration error: {e}")
                 return None
             
-            token_id = token_parts[0]
-            token_secret = token_parts[1].split("=")[1]
-            
-            headers = {
-                "Authorization": f"PVEAPIToken={token_id}={token_secret}"
-            }
-            
             # Try to get VM info first
-            vm_url = f"https://{proxmox_server}:8006/api2/json/nodes/{proxmox_node}/qemu/{vm_id}/status/current"
-            vm_response = requests.get(vm_url, headers=headers, verify=False, timeout=10)
+            vm_response = self.proxmox_client.request("GET", f"/nodes/{proxmox_node}/qemu/{vm_id}/status/current")
             
             if vm_response.status_code == 200:
                 vm_data = vm_response.json().get("data", {})
                 
                 # Try to get agent info for IP
-                agent_url = f"https://{proxmox_server}:8006/api2/json/nodes/{proxmox_node}/qemu/{vm_id}/agent/network-get-interfaces"
-                agent_response = requests.get(agent_url, headers=headers, verify=False, timeout=10)
+                agent_response = self.proxmox_client.request("GET", f"/nodes/{proxmox_node}/qemu/{vm_id}/agent/network-get-interfaces")
                 
                 if agent_response.status_code == 200:
                     agent_data = agent_response.json().get("data", {})
@@ -60,15 +46,13 @@ class HealthCheckService:
                         }
             
             # Try container if VM didn't work
-            ct_url = f"https://{proxmox_server}:8006/api2/json/nodes/{proxmox_node}/lxc/{vm_id}/status/current"
-            ct_response = requests.get(ct_url, headers=headers, verify=False, timeout=10)
+            ct_response = self.proxmox_client.request("GET", f"/nodes/{proxmox_node}/lxc/{vm_id}/status/current")
             
             if ct_response.status_code == 200:
                 ct_data = ct_response.json().get("data", {})
                 
                 # Get container config for network info
-                config_url = f"https://{proxmox_server}:8006/api2/json/nodes/{proxmox_node}/lxc/{vm_id}/config"
-                config_response = requests.get(config_url, headers=headers, verify=False, timeout=10)
+                config_response = self.proxmox_client.request("GET", f"/nodes/{proxmox_node}/lxc/{vm_id}/config")
                 
                 ip_address = None
                 if config_response.status_code == 200:
@@ -76,8 +60,7 @@ class HealthCheckService:
                     ip_address = self._extract_ip_from_ct_config(config_data)
                 # Fallback: Try /interfaces endpoint if config did not yield a valid IP
                 if not ip_address or ip_address.lower() in ("dhcp", "static"):
-                    interfaces_url = f"https://{proxmox_server}:8006/api2/json/nodes/{proxmox_node}/lxc/{vm_id}/interfaces"
-                    interfaces_response = requests.get(interfaces_url, headers=headers, verify=False, timeout=10)
+                    interfaces_response = self.proxmox_client.request("GET", f"/nodes/{proxmox_node}/lxc/{vm_id}/interfaces")
                     if interfaces_response.status_code == 200:
                         interfaces_data = interfaces_response.json().get("data", {})
                         ip_address = self._extract_ip_from_lxc_interfaces(interfaces_data)
@@ -215,16 +198,12 @@ class HealthCheckService:
         """Get machine IP address from Terraform state"""
         try:
             deployment_dir = os.path.join(self.base_path, "deployments", machine_id)
-            state_file = os.path.join(deployment_dir, "terraform.tfstate")
+            state_data = self._read_terraform_state(deployment_dir)
             
-            if not os.path.exists(state_file):
-                logging.warning(f"Terraform state file not found for machine {machine_id}")
+            if state_data is None:
+                logging.warning(f"Terraform state not found for machine {machine_id}")
                 return None
             
-            # Read terraform state
-            with open(state_file, 'r') as f:
-                state_data = json.load(f)
-            
             # Extract IP from state
             ip_address = self._extract_ip_from_terraform_state(state_data)
             
@@ -241,6 +220,27 @@ class HealthCheckService:
             logging.error(f"Error getting machine IP from Terraform: {e}")
             return None
     
+    def _read_terraform_state(self, deployment_dir):
+        """Terraform state of a deployment, from the HTTP backend its backend.tf names or the local file"""
+        backend_file = os.path.join(deployment_dir, "backend.tf")
+        if os.path.exists(backend_file):
+            with open(backend_file, 'r') as f:
+                match = re.search(r'^\s*address\s*=\s*"([^"]+)"', f.read(), re.MULTILINE)
+            if match:
+                # Same credentials as the terraform processes
+                response = requests.get(
+                    match.group(1),
+                    auth=(os.getenv("TF_HTTP_USERNAME", ""), os.getenv("TF_HTTP_PASSWORD", "")),
+                    timeout=10
+                )
+                return response.json() if response.status_code == 200 else None
+        
+        state_file = os.path.join(deployment_dir, "terraform.tfstate")
+        if not os.path.exists(state_file):
+            return None
+        with open(state_file, 'r') as f:
+            return json.load(f)
+    
     def _extract_ip_from_terraform_state(self, state_data):
         """Extract IP address from Terraform state"""
         try:
@@ -306,7 +306,7 @@ class HealthCheckService:
             logging.error(f"Error checking SSH on {ip_address}: {e}")
             return False
     
-    def comprehensive_health_check(self, machine_id, vm_id):
+    def comprehensive_health_check(self, machine_id, vm_id, node=None):
         """Perform a comprehensive health check on a machine"""
         try:
             health_info = {
@@ -321,7 +321,7 @@ class HealthCheckService:
             }
             
             # Try to get IP from Proxmox first
-            proxmox_info = self.get_machine_ip_from_proxmox(machine_id, vm_id)
+            proxmox_info = self.get_machine_ip_from_proxmox(machine_id, vm_id, node)
             if proxmox_info:
                 health_info.update(proxmox_info)
             else:
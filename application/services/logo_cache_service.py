@@ -0,0 +1,94 @@
+import hashlib
+import logging
+import os
+import posixpath
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from infrastructure.data.metrics import CACHE_REQUESTS
+
+
+class LogoCacheService:
+    """Local on-disk cache of app logos, keyed by app name and remote size/mtime"""
+
+    def __init__(self, sftp_pool, base_path, cache_dir, max_bytes=50 * 1024 * 1024, stat_ttl=60):
+        self.sftp_pool = sftp_pool
+        self.base_path = base_path
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stat_ttl = stat_ttl
+        self.index = {}  # app name -> {"etag": ..., "path": ..., "checked_at": ...}
+        self.files = OrderedDict()  # path -> size, least recently used first
+        self.lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_existing_files()
+
+    def _load_existing_files(self):
+        """Adopt the logos cached by a previous run, oldest first"""
+        paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                 if name.endswith('.png')]
+        for path in sorted(paths, key=os.path.getmtime):
+            self.files[path] = os.path.getsize(path)
+        self._evict()
+
+    def get_logo(self, app_name):
+        """Return (local path, etag) of an app logo, downloading it only if it changed"""
+        if not app_name or app_name.startswith('.'):
+            raise ValueError(f"Invalid app name: {app_name}")
+
+        with self.lock:
+            entry = self.index.get(app_name)
+            if entry and time.monotonic() - entry["checked_at"] < self.stat_ttl and entry["path"] in self.files:
+                # Other workers share the directory and may have evicted the file
+                if os.path.exists(entry["path"]):
+                    self.files.move_to_end(entry["path"])
+                    CACHE_REQUESTS.labels("logo", "hit").inc()
+                    return entry["path"], entry["etag"]
+                del self.files[entry["path"]]
+
+        remote_path = posixpath.join(self.base_path, app_name, 'logo.png')
+        with self.sftp_pool.session() as sftp:
+            attr = sftp.stat(remote_path)
+            etag = hashlib.sha256(f"{app_name}:{attr.st_size}:{attr.st_mtime}".encode()).hexdigest()[:32]
+            path = os.path.join(self.cache_dir, f"{etag}.png")
+            if os.path.exists(path):
+                CACHE_REQUESTS.labels("logo", "revalidated").inc()
+            else:
+                CACHE_REQUESTS.labels("logo", "miss").inc()
+                self._download(sftp, remote_path, path)
+
+        with self.lock:
+            self.index[app_name] = {"etag": etag, "path": path, "checked_at": time.monotonic()}
+            self.files[path] = os.path.getsize(path)
+            self.files.move_to_end(path)
+            self._evict(keep=path)
+        return path, etag
+
+    def _download(self, sftp, remote_path, path):
+        """Download next to the final file and rename, so concurrent readers never see a partial logo"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        os.close(fd)
+        try:
+            sftp.get(remote_path, tmp_path)
+            os.replace(tmp_path, path)
+            logging.info(f"Cached logo {remote_path}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _evict(self, keep=None):
+        """Remove least recently used logos until the cache fits in max_bytes (lock held)"""
+        total = sum(self.files.values())
+        for path in list(self.files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= self.files.pop(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+
+STRATEGIES = ("spread", "binpack", "none")
+
+
+class PlacementService:
+    """
+    Choose the node of every machine of a deployment batch from one cluster
+    snapshot: a node is eligible when it is online, has the machine's template
+    and storage, and its uncommitted CPU, memory and disk fit the machine.
+    "spread" picks the eligible node with the most free memory left,
+    "binpack" the one with the least, "none" keeps the configured node.
+    """
+
+    def __init__(self, cluster_inventory, proxmox_client, strategy="spread",
+                 cpu_overcommit=4.0, memory_overcommit=1.0, template_ttl=300):
+        """
+        :param cpu_overcommit: vCPUs committed per physical core before a node counts as full
+        :param memory_overcommit: memory committed per byte of RAM before a node counts as full
+        :param template_ttl: seconds the container templates of a node are cached
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown placement strategy: {strategy}")
+        self.cluster_inventory = cluster_inventory
+        self.proxmox_client = proxmox_client
+        self.strategy = strategy
+        self.cpu_overcommit = cpu_overcommit
+        self.memory_overcommit = memory_overcommit
+        self.template_ttl = template_ttl
+        self.templates = {}  # node -> (loaded at, set of vztmpl file names or None if unknown)
+        self.lock = threading.Lock()
+
+    def place(self, demands, default_node):
+        """
+        :param demands: list of dicts with "id", "cores", "memory" (MB), "disk" (GB), "storage",
+                        "template", "template_kind" ("ct" or "vm") and an optional pinned "node"
+        :return: dict id -> {"node", "reason"}, in the order the machines were placed
+        """
+        if self.strategy == "none":
+            return {demand["id"]: {"node": demand.get("node") or default_node, "reason": "configured node"}
+                    for demand in demands}
+        snapshot = self.cluster_inventory.get_snapshot()
+        if not snapshot or not snapshot["nodes"]:
+            logging.warning("Cluster snapshot unavailable, every machine goes to the configured node")
+            return {demand["id"]: {"node": demand.get("node") or default_node, "reason": "cluster snapshot unavailable"}
+                    for demand in demands}
+
+        free = self._free_resources(snapshot)
+        placements = {}
+        # Pinned machines first so their resources are taken, then the largest ones while the choice is widest
+        ordered = sorted(demands, key=lambda demand: (not demand.get("node"), -demand["memory"], -demand["cores"]))
+        for demand in ordered:
+            if demand.get("node"):
+                node, reason = demand["node"], "pinned"
+            else:
+                candidates = [node for node in free if self._fits(demand, node, free[node], snapshot)]
+                if candidates:
+                    pick = max if self.strategy == "spread" else min
+                    node = pick(candidates, key=lambda candidate: (free[candidate]["memory"], candidate))
+                    reason = self.strategy
+                else:
+                    node, reason = default_node, "no eligible node with enough free resources"
+                    logging.warning(f"No node fits {demand['id']}, using the configured node {default_node}")
+            if node in free:
+                free[node]["cores"] -= demand["cores"]
+                free[node]["memory"] -= demand["memory"] << 20
+                storage = free[node]["storages"].get(demand["storage"])
+                if storage is not None:
+                    storage["avail"] -= demand["disk"] << 30
+            placements[demand["id"]] = {"node": node, "reason": reason}
+        return placements
+
+    def _free_resources(self, snapshot):
+        """
+        :return: dict online node -> {"cores", "memory" (bytes), "storages"} not committed to its guests
+        """
+        free = {}
+        for node, summary in snapshot["nodes"].items():
+            if summary["status"] != "online":
+                continue
+            free[node] = {
+                "cores": summary["maxcpu"] * self.cpu_overcommit,
+                "memory": summary["maxmem"] * self.memory_overcommit,
+                "storages": {name: dict(storage) for name, storage in snapshot["storages"].get(node, {}).items()
+                             if storage["status"] == "available"},
+                "known_storages": node in snapshot["storages"]
+            }
+        # Stopped guests count too: they get their resources back when started
+        for guest in snapshot["guests"].values():
+            if guest["node"] in free and not guest["template"]:
+                free[guest["node"]]["cores"] -= guest["maxcpu"] or 0
+                free[guest["node"]]["memory"] -= guest["maxmem"] or 0
+        return free
+
+    def _fits(self, demand, node, free, snapshot):
+        if free["cores"] < demand["cores"] or free["memory"] < demand["memory"] << 20:
+            return False
+        if free["known_storages"]:
+            storage = free["storages"].get(demand["storage"])
+            if storage is None or storage["avail"] < demand["disk"] << 30:
+                return False
+        if not demand.get("template"):
+            return True
+        if demand["template_kind"] == "vm":
+            # Clones need the template VM on the target node, unless no node is known to have it
+            nodes = {guest["node"] for guest in snapshot["guests"].values()
+                     if guest["template"] and guest["name"] == demand["template"]}
+            return not nodes or node in nodes
+        templates = self._node_templates(node)
+        return templates is None or demand["template"] in templates
+
+    def _node_templates(self, node):
+        """
+        :return: set of the container template file names on the node's local storage, None if unknown
+        """
+        with self.lock:
+            cached = self.templates.get(node)
+            if cached and time.monotonic() - cached[0] < self.template_ttl:
+                return cached[1]
+        try:
+            content = self.proxmox_client.get(f"/nodes/{node}/storage/local/content", content="vztmpl") or []
+            templates = {item["volid"].split("/", 1)[-1] for item in content if "volid" in item}
+        except Exception as e:
+            logging.warning(f"Could not list the container templates of {node}: {e}")
+            templates = None
+        with self.lock:
+            self.templates[node] = (time.monotonic(), templates)
+        return templates
@@ -0,0 +1,121 @@
+import fcntl
+import logging
+import threading
+import time
+
+# Guest counters reported as totals since boot, stored as per second rates
+GUEST_COUNTERS = ('netin', 'netout', 'diskread', 'diskwrite')
+GUEST_GAUGES = ('cpu', 'maxcpu', 'mem', 'maxmem', 'disk', 'maxdisk')
+
+
+class ProxmoxMetricsCollector:
+    """
+    Sample node and guest metrics from Proxmox into a TimeSeriesStore.
+
+    Only one worker process collects: it holds an exclusive lock and
+    periodically snapshots the store, the other workers read that snapshot.
+    """
+
+    def __init__(self, proxmox_client, store, interval=10, node_interval=60, snapshot_interval=60):
+        self.proxmox_client = proxmox_client
+        self.store = store
+        self.interval = interval
+        self.node_interval = node_interval
+        self.snapshot_interval = snapshot_interval
+        self.counters = {}  # series key -> (timestamp, counter values)
+        self.nodes_collected_at = 0
+        self.saved_at = 0
+        self.lock_file = None
+        self.thread = None
+
+    @property
+    def is_leader(self):
+        return self.lock_file is not None
+
+    def start(self):
+        if self.interval <= 0 or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._loop, name="proxmox-metrics", daemon=True)
+        self.thread.start()
+
+    def query(self, key, start, end, step=None):
+        """
+        :return: points of a series, None if it is unknown
+        """
+        if not self.is_leader:
+            self.store.load_if_changed()
+        return self.store.query(key, start, end, step)
+
+    def keys(self):
+        if not self.is_leader:
+            self.store.load_if_changed()
+        return self.store.keys()
+
+    def _loop(self):
+        while True:
+            started = time.monotonic()
+            try:
+                if self.is_leader or self._acquire_leadership():
+                    self.collect_once()
+                    if time.monotonic() - self.saved_at > self.snapshot_interval:
+                        self.store.prune()
+                        self.store.save()
+                        self.saved_at = time.monotonic()
+            except Exception as e:
+                logging.warning(f"Proxmox metrics collection failed: {e}")
+            time.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+    def _acquire_leadership(self):
+        lock_file = open(f"{self.store.snapshot_path}.collector.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self.lock_file = lock_file
+        # Resume from the history left by the previous collector
+        self.store.load_if_changed()
+        logging.info("This worker now collects the Proxmox metrics")
+        return True
+
+    def collect_once(self):
+        resources = self.proxmox_client.get("/cluster/resources") or []
+        now = time.time()
+        running = set()
+        for resource in resources:
+            if resource.get("type") in ("qemu", "lxc") and resource.get("status") == "running":
+                running.add(self._add_guest(resource, now))
+        self.counters = {key: value for key, value in self.counters.items() if key in running}
+
+        if time.monotonic() - self.nodes_collected_at >= self.node_interval:
+            for resource in resources:
+                if resource.get("type") == "node" and resource.get("status") == "online":
+                    self._add_node(resource["node"])
+            self.nodes_collected_at = time.monotonic()
+
+    def _add_node(self, node):
+        """Append the node RRD points (one per minute) not stored yet"""
+        key = f"node/{node}"
+        last_time = self.store.last_time(key)
+        points = self.proxmox_client.get(f"/nodes/{node}/rrddata", timeframe="hour", cf="AVERAGE") or []
+        for point in points:
+            timestamp = point.pop("time", None)
+            # The last RRD point may still be incomplete (null values)
+            if timestamp is None or timestamp <= last_time or any(value is None for value in point.values()):
+                continue
+            self.store.add(key, timestamp, point)
+
+    def _add_guest(self, resource, now):
+        key = f"{resource['type']}/{resource['vmid']}"
+        sample = {field: resource.get(field, 0) for field in GUEST_GAUGES}
+        counters = [resource.get(field, 0) for field in GUEST_COUNTERS]
+        previous = self.counters.get(key)
+        self.counters[key] = (now, counters)
+        if previous is None or now <= previous[0]:
+            return key
+        elapsed = now - previous[0]
+        for field, value, previous_value in zip(GUEST_COUNTERS, counters, previous[1]):
+            # A counter going backwards means the guest restarted
+            sample[field] = max(0, value - previous_value) / elapsed
+        self.store.add(key, now, sample)
+        return key
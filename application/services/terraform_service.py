@@ -1,31 +1,18 @@
 import os
 import subprocess
-import re
-from proxmoxer import ProxmoxAPI
+from infrastructure.data.proxmox_client import ProxmoxClient
 
 
 class TerraformService:
     def __init__(self, config_manager):
-        proxmox_server = config_manager.get('PROXMOX_SERVER')
-        pve_api_token = config_manager.get('PVEAPITOKEN')
-        
-        # Correctly parse the Proxmox API Token string
-        user_part, token_part = pve_api_token.split('!')
-        token_name, token_value = token_part.split('=')
-
-        self.proxmox = ProxmoxAPI(
-            proxmox_server,
-            user=user_part,
-            token_name=token_name,
-            token_value=token_value,
-            verify_ssl=False  # Consider using a proper certificate in production
-        )
-        self.node = config_manager.get('NODE')
+        # Credentials are parsed by the config manager, the client is built on first use
+        self.proxmox_client = ProxmoxClient(config_manager)
 
     def get_templates(self):
         """Fetches a list of all templates (QEMU VMs and LXC containers)."""
-        all_vms = self.proxmox.nodes(self.node).qemu.get()
-        all_lxc = self.proxmox.nodes(self.node).lxc.get()
+        proxmox_node = self.proxmox_client.api.nodes(self.proxmox_client.node)
+        all_vms = proxmox_node.qemu.get()
+        all_lxc = proxmox_node.lxc.get()
 
         templates_qemu = [vm['name'] for vm in all_vms if vm.get('template')]
         templates_lxc = [ct['name'] for ct in all_lxc if ct.get('template')]
@@ -34,7 +21,7 @@ class TerraformService:
 
     def get_bridges(self):
         """Fetches a list of all network bridges."""
-        network_devices = self.proxmox.nodes(self.node).network.get()
+        network_devices = self.proxmox_client.api.nodes(self.proxmox_client.node).network.get()
         bridges = [dev['iface'] for dev in network_devices if dev['type'] == 'bridge']
         return bridges
 
@@ -74,10 +61,11 @@ class TerraformService:
             raise ValueError("Invalid case for state file generation")
 
     @staticmethod
-    def run_terraform_command(terraform_script_path, state_file_name):
+    def run_terraform_command(terraform_script_path, state_file_name, lock_timeout=300):
         state_file = f"States/{state_file_name}"
         try:
-            command = f'cd /root/SecurifyStack/TerraformCode/{terraform_script_path} && terraform init && terraform plan && terraform apply -state={state_file} -auto-approve'
+            # A held state lock is waited for, never forced: the holder may really be running
+            command = f'cd /root/SecurifyStack/TerraformCode/{terraform_script_path} && terraform init && terraform plan -lock-timeout={lock_timeout}s && terraform apply -state={state_file} -lock-timeout={lock_timeout}s -auto-approve'
             process = subprocess.Popen(
                 command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             output, error = process.communicate()
@@ -91,36 +79,5 @@ class TerraformService:
             return e.output.decode('utf-8'), e.stderr.decode('utf-8')
 
     @staticmethod
-    def unlock_terraform_state(terraform_script_path, lock_id):
-        try:
-            command = f'cd /root/SecurifyStack/TerraformCode/{terraform_script_path} && terraform force-unlock -force {lock_id}'
-            process = subprocess.Popen(
-                command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            output, error = process.communicate()
-
-            if process.returncode != 0:
-                raise subprocess.CalledProcessError(
-                    process.returncode, command, output=output, stderr=error)
-
-            return output.decode('utf-8'), None
-        except subprocess.CalledProcessError as e:
-            return e.output.decode('utf-8'), e.stderr.decode('utf-8')
-
-    @staticmethod
-    def handle_terraform_command(terraform_script_path, state_file_name):
-        output, error = TerraformService.run_terraform_command(
-            terraform_script_path, state_file_name)
-
-        if error and 'Error acquiring the state lock' in error:
-            lock_id_match = re.search(r'ID: +([a-f0-9-]+)', error)
-            if lock_id_match:
-                lock_id = lock_id_match.group(1)
-                unlock_output, unlock_error = TerraformService.unlock_terraform_state(
-                    terraform_script_path, lock_id)
-                if unlock_error:
-                    return None, f"Failed to unlock state: {unlock_error}"
-
-                output, error = TerraformService.run_terraform_command(
-                    terraform_script_path, state_file_name)
-
-        return output, error
+    def handle_terraform_command(terraform_script_path, state_file_name, lock_timeout=300):
+        return TerraformService.run_terraform_command(terraform_script_path, state_file_name, lock_timeout)
@@ -0,0 +1,166 @@
+import logging
+import re
+
+ROLES_WINDOWS_SERVER = frozenset(['ADDS', 'DNS', 'DHCP', 'IIS'])
+ROLES_LINUX_SERVER = frozenset(['Web Server', 'Database', 'File Server'])
+OS_VERSIONS_WINDOWS_SERVER = frozenset(['2016', '2019', '2022'])
+OS_VERSIONS_LINUX_SERVER = frozenset([
+    'debian-12.4.0-amd64-netinst.iso',
+    'debian-12.5.0-amd64-netinst.iso',
+    'noble-server-cloudimg-amd64.img',
+    'ubuntu-24.04-desktop-amd64.iso',
+    'debian-12-standard_12.2-1_amd64.tar.zst',
+    'ubuntu-20.04-standard_20.04-1_amd64.tar.gz',
+    'ubuntu-24.04-standard_24.04-2_amd64.tar.zst'
+])
+CLONE_MODES = frozenset(['full', 'linked'])
+IP_PATTERN = re.compile(
+    r'^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$'
+)
+
+
+def is_valid_ip(ip):
+    return IP_PATTERN.match(ip) is not None
+
+
+class ValidationService:
+    """
+    Validate a topology before it is deployed, against itself, the live
+    Proxmox guests and the tracked machines
+    """
+
+    def __init__(self, cluster_inventory, tracking_service):
+        self.cluster_inventory = cluster_inventory
+        self.tracking_service = tracking_service
+
+    def validate(self, machines):
+        """
+        :return: dict with "valid", the flat "errors" list, the per-machine
+                 "machine_errors" and "warnings"
+        """
+        errors = []
+        machine_errors = []
+        warnings = []
+        if not machines:
+            errors.append('No machines defined.')
+
+        guests = self.cluster_inventory.get_guests() if machines else {}
+        if guests is None:
+            guests = {}
+            warnings.append('Proxmox inventory unavailable, VMIDs were not checked against existing guests.')
+        tracked_vmids, tracked_ips = self._tracked_index() if machines else ({}, {})
+
+        vmid_owners = {}
+        ip_owners = {}
+        for idx, m in enumerate(machines):
+            base_type = m.get('baseType') or (m.get('id', '').split('-')[0])
+            name = m.get('name') or m.get('id')
+            adv = m.get('advanced', {})
+            issues = []
+
+            def add(field, code, message):
+                issues.append({'field': field, 'code': code, 'message': f'{name}: {message}'})
+
+            # VMID, only an explicit one can collide: otherwise a free one is allocated at deploy time
+            vmid = adv.get('vmid')
+            if vmid is not None and (not isinstance(vmid, int) or isinstance(vmid, bool) or vmid <= 0 or vmid >= 10000):
+                add('vmid', 'invalid', 'Invalid or missing VMID.')
+            elif vmid is not None:
+                count = m.get('group', {}).get('count') if base_type == 'vmPack' else 1
+                span = count if isinstance(count, int) and 1 <= count <= 10 else 1
+                for candidate in range(vmid, vmid + span):
+                    if candidate in vmid_owners:
+                        add('vmid', 'duplicate', f'Duplicate VMID ({candidate}).')
+                    vmid_owners[candidate] = idx
+                    guest = guests.get(candidate)
+                    if guest is not None:
+                        add('vmid', 'conflict',
+                            f"VMID {candidate} is already used by {guest['name']} on node {guest['node']}.")
+                    elif candidate in tracked_vmids:
+                        add('vmid', 'conflict',
+                            f'VMID {candidate} is already used by deployed machine {tracked_vmids[candidate]}.')
+            # Name
+            if not name or not isinstance(name, str) or not name.strip():
+                add('name', 'required', 'Name is required.')
+            # IP (only require for static mode)
+            if base_type != 'vmPack' and adv.get('ip_mode', 'dhcp') == 'static':
+                ip = adv.get('ip_address')
+                if not ip or not isinstance(ip, str) or not is_valid_ip(ip):
+                    add('ip_address', 'invalid', 'Invalid or missing IP address.')
+                else:
+                    if ip in ip_owners:
+                        add('ip_address', 'duplicate', f'Duplicate IP ({ip}).')
+                    ip_owners[ip] = idx
+                    if ip in tracked_ips:
+                        add('ip_address', 'conflict',
+                            f'IP {ip} is already assigned to deployed machine {tracked_ips[ip]}.')
+            # OS Version
+            os_version = adv.get('os_version') if isinstance(adv.get('os_version'), str) else None
+            if base_type == 'windowsServer' and os_version not in OS_VERSIONS_WINDOWS_SERVER:
+                add('os_version', 'invalid', 'Invalid or missing Windows Server OS version.')
+            if base_type == 'linuxServer' and os_version not in OS_VERSIONS_LINUX_SERVER:
+                add('os_version', 'invalid', 'Invalid or missing Linux Server OS version.')
+            # Clone mode, only VMs are cloned from a template
+            clone_mode = adv.get('clone_mode')
+            if clone_mode is not None and (not isinstance(clone_mode, str) or clone_mode not in CLONE_MODES):
+                add('clone_mode', 'invalid', 'Clone mode must be "full" or "linked".')
+            # Roles
+            roles = m.get('roles', [])
+            if not isinstance(roles, list) or not all(isinstance(role, str) for role in roles):
+                add('roles', 'invalid', 'Roles must be a list of role names.')
+            elif base_type == 'windowsServer' and not ROLES_WINDOWS_SERVER.issuperset(roles):
+                add('roles', 'invalid', 'Invalid roles selected.')
+            elif base_type == 'linuxServer' and not ROLES_LINUX_SERVER.issuperset(roles):
+                add('roles', 'invalid', 'Invalid roles selected.')
+            # VM Pack count
+            if base_type == 'vmPack':
+                count = m.get('group', {}).get('count')
+                if not isinstance(count, int) or count < 1 or count > 10:
+                    add('group.count', 'invalid', 'VM Pack count must be 1-10.')
+            # VLANs
+            vlans = m.get('vlans', [])
+            if vlans:
+                if not isinstance(vlans, list):
+                    add('vlans', 'invalid', 'VLANs must be a list.')
+                else:
+                    seen_vlans = set()
+                    for v in vlans:
+                        if not v or (not isinstance(v, (str, int))):
+                            add('vlans', 'invalid', 'VLANs must be non-empty strings or numbers.')
+                            continue
+                        if v in seen_vlans:
+                            add('vlans', 'duplicate', f'Duplicate VLAN ({v}).')
+                        seen_vlans.add(v)
+
+            if issues:
+                machine_errors.append({'index': idx, 'name': name, 'errors': issues})
+                errors.extend(issue['message'] for issue in issues)
+
+        return {
+            'valid': not errors,
+            'errors': errors,
+            'machine_errors': machine_errors,
+            'warnings': warnings
+        }
+
+    def _tracked_index(self):
+        """
+        :return: (vmid -> machine name, ip -> machine name) of the tracked machines
+        """
+        vmids = {}
+        ips = {}
+        try:
+            machines = self.tracking_service.get_deployed_machines()
+        except Exception as e:
+            logging.warning(f"Could not load tracked machines for validation: {e}")
+            return vmids, ips
+        for machine in machines:
+            name = machine.get('name')
+            config = machine.get('config', {})
+            for vmid in (machine.get('id'), config.get('vm_id')):
+                if isinstance(vmid, int) or (isinstance(vmid, str) and vmid.isdigit()):
+                    vmids[int(vmid)] = name
+            for ip in (machine.get('ip_address'), config.get('advanced', {}).get('ip_address')):
+                if isinstance(ip, str) and is_valid_ip(ip):
+                    ips[ip] = name
+        return vmids, ips
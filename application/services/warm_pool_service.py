@@ -0,0 +1,280 @@
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from infrastructure.data.shared_state import atomic_write_json, file_lock
+
+POOL_PREFIX = "pool-"
+# Pool containers are created small, claims grow their disk to the requested size
+POOL_DISK_SIZE = 20
+# Claims and creations older than this belong to a worker that died
+STALE_SECONDS = 900
+
+
+def template_slug(template):
+    """Hostname part naming the template of a pool container"""
+    name = template.split(".tar")[0].lower()
+    return re.sub(r'[^a-z0-9]+', '-', name).strip('-')[:63 - len(POOL_PREFIX)]
+
+
+class WarmPoolService:
+    """
+    Keep size stopped containers per template, created ahead of time in a
+    reserved VMID range, so that a deployment adopts one through the config
+    API instead of waiting for a container to be created. Claims are shared
+    by the worker processes through a state file; only one worker refills.
+    """
+
+    def __init__(self, proxmox_client, state_file, templates, size=0, vmids=range(8000, 8500), node=None,
+                 storage="local-lvm", interval=60, task_timeout=300):
+        """
+        :param templates: container template files kept in the pool
+        :param size: stopped containers kept per template, 0 disables the pool
+        :param vmids: VMIDs reserved to the pool, adopted containers keep theirs
+        :param node: node the pool lives on, None for the configured node
+        """
+        self.proxmox_client = proxmox_client
+        self.state_file = state_file
+        self.templates = {template_slug(template): template for template in templates}
+        self.size = size
+        self.vmids = vmids
+        self.pool_node = node
+        self.storage = storage
+        self.interval = interval
+        self.task_timeout = task_timeout
+        self.lock_file = None
+        self.thread = None
+        self.wake = threading.Event()
+
+    @property
+    def node(self):
+        return self.pool_node or self.proxmox_client.node
+
+    def serves(self, template):
+        """True when claims for this container template can be served"""
+        return self.size > 0 and template_slug(template) in self.templates
+
+    def claim(self, template):
+        """
+        Take a ready container of the template out of the pool
+        :return: (vmid, node), None when the pool has none ready
+        """
+        with file_lock(self.state_file):
+            state = self._load()
+            busy = set(state["claimed"]) | set(state["creating"])
+            ready = [vmid for vmid, guest in sorted(self._pool_guests().items())
+                     if guest["template"] == template and guest["status"] == "stopped" and str(vmid) not in busy]
+            if not ready:
+                return None
+            vmid = ready[0]
+            state["claimed"][str(vmid)] = time.time()
+            atomic_write_json(self.state_file, state)
+        self.wake.set()
+        return vmid, self.node
+
+    def configure(self, vmid, node, tfvars):
+        """
+        Give a claimed container the hostname, network, resources and disk size of the
+        machine's Terraform variables, the container leaves the pool for good.
+        Raises on a refused change, the container is then destroyed.
+        """
+        try:
+            bridge = tfvars.get("network_bridge", "vmbr0")
+            if tfvars.get("network_config") == "dhcp" or not tfvars.get("ip_address"):
+                ip = "ip=dhcp"
+            else:
+                ip = f"ip={tfvars['ip_address']}/{tfvars.get('subnet_mask', '24')},gw={tfvars.get('gateway', '')}"
+            net0 = f"name=eth0,bridge={bridge},{ip}"
+            if tfvars.get("network_tag"):
+                net0 += f",tag={tfvars['network_tag']}"
+            params = {"hostname": tfvars["vm_name"], "net0": net0, "nameserver": tfvars.get("nameserver", "8.8.8.8")}
+            for key, parameter in (("cores", "cores"), ("memory", "memory"), ("swap", "swap"),
+                                   ("start_on_boot", "onboot"), ("tags", "tags")):
+                if key in tfvars:
+                    value = tfvars[key]
+                    params[parameter] = int(value) if isinstance(value, bool) else value
+            response = self.proxmox_client.request("PUT", f"/nodes/{node}/lxc/{vmid}/config", data=params)
+            response.raise_for_status()
+
+            if int(tfvars.get("disk_size", POOL_DISK_SIZE)) > POOL_DISK_SIZE:
+                response = self.proxmox_client.request("PUT", f"/nodes/{node}/lxc/{vmid}/resize",
+                                                       data={"disk": "rootfs", "size": f"{tfvars['disk_size']}G"})
+                response.raise_for_status()
+                self._wait_task(node, response.json().get("data"))
+        except Exception:
+            self.destroy(vmid, node)
+            raise
+        finally:
+            self._forget(vmid)
+
+    def destroy(self, vmid, node):
+        """
+        Stop and delete a container through the API
+        :return: True once it is gone
+        """
+        try:
+            status = self.proxmox_client.get(f"/nodes/{node}/lxc/{vmid}/status/current") or {}
+            if status.get("status") == "running":
+                response = self.proxmox_client.request("POST", f"/nodes/{node}/lxc/{vmid}/status/stop")
+                response.raise_for_status()
+                self._wait_task(node, response.json().get("data"))
+            response = self.proxmox_client.request("DELETE", f"/nodes/{node}/lxc/{vmid}", params={"purge": 1})
+            response.raise_for_status()
+            self._wait_task(node, response.json().get("data"))
+            return True
+        except Exception as e:
+            logging.error(f"Could not destroy container {vmid} on {node}: {e}")
+            return False
+
+    def status(self):
+        """
+        :return: dict template -> {"ready", "creating"} and the pool settings
+        """
+        state = self._load()
+        counts = {template: {"ready": 0, "creating": 0} for template in self.templates.values()}
+        try:
+            guests = self._pool_guests()
+        except Exception as e:
+            logging.warning(f"Could not list the warm pool: {e}")
+            guests = {}
+        for vmid, guest in guests.items():
+            if guest["template"] in counts and str(vmid) not in state["claimed"]:
+                counts[guest["template"]]["creating" if str(vmid) in state["creating"] else "ready"] += 1
+        return {"size": self.size, "node": self.node, "vmids": [self.vmids.start, self.vmids.stop - 1],
+                "templates": counts}
+
+    def start(self):
+        if self.size <= 0 or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._loop, name="warm-pool", daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                if self.lock_file is not None or self._acquire_leadership():
+                    self.refill_once()
+            except Exception as e:
+                logging.warning(f"Warm pool refill failed: {e}")
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+    def _acquire_leadership(self):
+        lock_file = open(f"{self.state_file}.refill.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self.lock_file = lock_file
+        logging.info("This worker now refills the warm pool")
+        return True
+
+    def refill_once(self):
+        """
+        Create the containers missing from each template's pool, one at a time
+        :return: number of containers created
+        """
+        created = 0
+        for template in self.templates.values():
+            with file_lock(self.state_file):
+                state = self._load()
+                resources = self.proxmox_client.get("/cluster/resources", type="vm") or []
+                available = [vmid for vmid, guest in self._pool_guests(resources).items()
+                             if guest["template"] == template and str(vmid) not in state["claimed"]]
+                missing = self.size - len(available)
+                used = {int(resource["vmid"]) for resource in resources if "vmid" in resource}
+                used.update(int(vmid) for vmid in state["claimed"])
+                vmids = [vmid for vmid in self.vmids if vmid not in used][:max(0, missing)]
+                for vmid in vmids:
+                    state["creating"][str(vmid)] = time.time()
+                atomic_write_json(self.state_file, state)
+            if missing > len(vmids):
+                logging.error(f"Warm pool range {self.vmids.start}-{self.vmids.stop - 1} is full")
+            for vmid in vmids:
+                try:
+                    self._create(vmid, template)
+                    created += 1
+                except Exception as e:
+                    logging.error(f"Could not create warm pool container {vmid} from {template}: {e}")
+                    self.destroy(vmid, self.node)
+                finally:
+                    self._forget(vmid)
+        if created:
+            logging.info(f"Warm pool refilled with {created} containers")
+        return created
+
+    def _create(self, vmid, template):
+        node = self.node
+        response = self.proxmox_client.request("POST", f"/nodes/{node}/lxc", data={
+            "vmid": vmid,
+            "hostname": POOL_PREFIX + template_slug(template),
+            "ostemplate": f"local:vztmpl/{template}",
+            "storage": self.storage,
+            "rootfs": f"{self.storage}:{POOL_DISK_SIZE}",
+            "cores": 1,
+            "memory": 1024,
+            "swap": 512,
+            "net0": "name=eth0,bridge=vmbr0,ip=dhcp",
+            "nameserver": "8.8.8.8",
+            "password": "rootroot",
+            "unprivileged": 1,
+            "tags": "warm-pool",
+            "start": 0
+        }, timeout=60)
+        response.raise_for_status()
+        self._wait_task(node, response.json().get("data"))
+
+    def _wait_task(self, node, upid):
+        """Wait for a Proxmox task, raises if it fails or outlasts task_timeout"""
+        if not upid:
+            return
+        deadline = time.monotonic() + self.task_timeout
+        while True:
+            status = self.proxmox_client.get(f"/nodes/{node}/tasks/{upid}/status") or {}
+            if status.get("status") == "stopped":
+                if status.get("exitstatus") != "OK":
+                    raise RuntimeError(f"Task {upid} failed: {status.get('exitstatus')}")
+                return
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Task {upid} still running after {self.task_timeout}s")
+            time.sleep(1)
+
+    def _pool_guests(self, resources=None):
+        """
+        :param resources: guests of /cluster/resources, read fresh from the cluster when None
+        :return: dict vmid -> {"template", "status"} of the pool containers
+        """
+        if resources is None:
+            resources = self.proxmox_client.get("/cluster/resources", type="vm") or []
+        guests = {}
+        for resource in resources:
+            vmid = int(resource.get("vmid", 0))
+            name = resource.get("name") or ""
+            if vmid in self.vmids and resource.get("type") == "lxc" and name.startswith(POOL_PREFIX):
+                template = self.templates.get(name[len(POOL_PREFIX):])
+                if template:
+                    guests[vmid] = {"template": template, "status": resource.get("status")}
+        return guests
+
+    def _forget(self, vmid):
+        """Drop a container from the claimed and creating lists"""
+        with file_lock(self.state_file):
+            state = self._load()
+            state["claimed"].pop(str(vmid), None)
+            state["creating"].pop(str(vmid), None)
+            atomic_write_json(self.state_file, state)
+
+    def _load(self):
+        state = {"claimed": {}, "creating": {}}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as f:
+                state.update(json.load(f))
+        now = time.time()
+        for key in ("claimed", "creating"):
+            state[key] = {vmid: at for vmid, at in state[key].items() if now - at < STALE_SECONDS}
+        return state
@@ -0,0 +1,349 @@
+"""
+End-to-end benchmark of the fleet endpoints against a fake Proxmox API and a
+fake terraform binary.
+
+For every fleet size, a copy of the repository is started in production mode
+and driven at every concurrency level through the scenarios:
+
+- deploy:  POST /deploy-machines, one request per machine
+- health:  GET /machine-health/<id> for every machine
+- boot:    POST /boot-all-machines, guests stopped before each request
+- refresh: POST /refresh-ips
+
+    python -m benchmarks.e2e --fleet-sizes 10,50 --concurrency 1,8 --output results.json
+    python -m benchmarks.e2e --compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fake_proxmox import FakeProxmoxServer, ProxmoxState
+from infrastructure.data.terraform_history import PERCENTILES, percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("deploy", "health", "boot", "refresh")
+FIRST_VMID = 5000
+
+# Runtime state of a checkout that must not leak into the benchmarked copy
+IGNORED = shutil.ignore_patterns(
+    ".git", "__pycache__", "benchmarks", "deployments", "downloaded_apps", ".env", "*.lock", "*.db",
+    "deployed_machines.json", "config.json*", "install_jobs.json", "revoked_sessions.json*",
+    "stats_timeseries.json*", "terraform_history.jsonl*", "metrics",
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def summarize(latencies):
+    """
+    :return: mean, max and percentiles of latencies, in milliseconds
+    """
+    if not latencies:
+        return {}
+    values = sorted(latency * 1000 for latency in latencies)
+    summary = {f"p{rank}": round(percentile(values, rank), 2) for rank in PERCENTILES}
+    summary.update({"mean": round(sum(values) / len(values), 2), "max": round(values[-1], 2)})
+    return summary
+
+
+class Backend:
+    """
+    Copy of the repository served by gunicorn, with the fake terraform on PATH
+    """
+
+    def __init__(self, proxmox_port, args):
+        self.directory = tempfile.mkdtemp(prefix="securify-bench-")
+        self.root = os.path.join(self.directory, "backend")
+        self.port = free_port()
+        self.args = args
+        self.proxmox_port = proxmox_port
+        self.process = None
+        self.log = None
+
+    def start(self):
+        from cryptography.fernet import Fernet
+        from infrastructure.data.token import SessionTokenManager
+
+        shutil.copytree(REPO_ROOT, self.root, ignore=IGNORED)
+        master_key = Fernet.generate_key().decode()
+        with open(os.path.join(self.root, ".env"), "w") as f:
+            f.write("\n".join([
+                f"MASTER_KEY={master_key}",
+                "PROXMOX_SERVER=127.0.0.1",
+                f"PROXMOX_PORT={self.proxmox_port}",
+                "NODE=pve",
+                "PVEAPITOKEN=root@pam!bench=00000000-0000-0000-0000-000000000000",
+                "LDAPS_SERVER=127.0.0.1",
+                "LDAPS_SERVER_PORT=636",
+            ]) + "\n")
+
+        bin_dir = os.path.join(self.directory, "bin")
+        os.makedirs(bin_dir)
+        shim = os.path.join(bin_dir, "terraform")
+        with open(shim, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(REPO_ROOT, "benchmarks", "fake_terraform.py")}" "$@"\n')
+        os.chmod(shim, 0o755)
+
+        env = dict(os.environ)
+        env.update({
+            "PATH": f"{bin_dir}{os.pathsep}{env.get('PATH', '')}",
+            "BACKEND_HOST": "127.0.0.1",
+            "BACKEND_PORT": str(self.port),
+            "TFSTATE_PORT": str(free_port()),
+            "BACKEND_WORKERS": str(self.args.workers),
+            "BACKEND_THREADS": str(self.args.threads),
+            "BACKEND_TIMEOUT": "600",
+            "FAKE_TF_INIT_SECONDS": str(self.args.tf_init),
+            "FAKE_TF_PLAN_SECONDS": str(self.args.tf_plan),
+            "FAKE_TF_APPLY_SECONDS": str(self.args.tf_apply),
+            "FAKE_TF_DESTROY_SECONDS": str(self.args.tf_destroy),
+            "FAKE_TF_FAIL_RATE": str(self.args.tf_fail_rate),
+        })
+        self.log = open(os.path.join(self.directory, "backend.log"), "w")
+        self.process = subprocess.Popen([sys.executable, "main.py", "--production"], cwd=self.root, env=env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+
+        self.token = SessionTokenManager(master_key.encode()).issue("benchmark")
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Backend exited, see {self.log.name}")
+            try:
+                if requests.get(f"{self.url}/metrics", timeout=1).status_code == 200:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Backend did not start, see {self.log.name}")
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.log is not None:
+            self.log.close()
+        if self.args.keep:
+            print(f"Kept {self.directory}", file=sys.stderr)
+        else:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class Driver:
+    """
+    Sends requests from a pool of threads, one HTTP session per thread
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.local = threading.local()
+
+    def call(self, method, path, body=None):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            session.headers["Authorization"] = f"Bearer {self.backend.token}"
+        started = time.perf_counter()
+        try:
+            status = session.request(method, f"{self.backend.url}{path}", json=body, timeout=3600).status_code
+        except requests.RequestException:
+            status = None
+        return time.perf_counter() - started, status
+
+    def run(self, calls, concurrency, before_each=None):
+        """
+        :param calls: list of (method, path, body)
+        :return: wall time, list of (latency, status)
+        """
+        def task(call):
+            if before_each:
+                before_each()
+            return self.call(*call)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(task, calls))
+        return time.perf_counter() - started, outcomes
+
+
+def machine(index):
+    vmid = FIRST_VMID + index
+    return {
+        "id": f"bench-{vmid}",
+        "name": f"bench-{vmid}",
+        "baseType": "linuxServer",
+        "advanced": {"type": "ct", "os_version": "debian-12-standard", "perf": "low", "vmid": vmid},
+    }
+
+
+def scenario_calls(scenario, fleet_size, repeat):
+    if scenario == "deploy":
+        return [("POST", "/deploy-machines", {"machines": [machine(index)]}) for index in range(fleet_size)]
+    if scenario == "health":
+        return [("GET", f"/machine-health/{FIRST_VMID + index}", None) for index in range(fleet_size)]
+    if scenario == "boot":
+        return [("POST", "/boot-all-machines", None)] * repeat
+    return [("POST", "/refresh-ips", None)] * repeat
+
+
+def run_scenario(driver, proxmox, scenario, fleet_size, concurrency, repeat):
+    def stop_guests():
+        for guest in proxmox.state.list_guests(guest_type="lxc"):
+            proxmox.state.guests[guest["vmid"]]["status"] = "stopped"
+
+    before_each = stop_guests if scenario == "boot" else None
+
+    calls = scenario_calls(scenario, fleet_size, repeat)
+    elapsed, outcomes = driver.run(calls, concurrency, before_each)
+    latencies = [latency for latency, _ in outcomes]
+    errors = sum(1 for _, status in outcomes if status is None or status >= 400)
+    # Fleet-wide requests process every machine
+    machines = len(calls) if scenario in ("deploy", "health") else len(calls) * fleet_size
+    return {
+        "scenario": scenario,
+        "fleet_size": fleet_size,
+        "concurrency": concurrency,
+        "requests": len(calls),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(calls) / elapsed, 3),
+        "machines_per_second": round(machines / elapsed, 3),
+        "latency_ms": summarize(latencies),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def benchmark(args):
+    proxmox = FakeProxmoxServer(("127.0.0.1", 0), ProxmoxState(guests=args.existing_guests),
+                                args.proxmox_latency_ms / 1000, args.proxmox_jitter_ms / 1000,
+                                args.proxmox_error_rate).start()
+    results = []
+    try:
+        for fleet_size in args.fleet_sizes:
+            for concurrency in args.concurrency:
+                # Fresh tracking file and deployments for every run
+                backend = Backend(proxmox.port, args).start()
+                try:
+                    driver = Driver(backend)
+                    for scenario in args.scenarios:
+                        result = run_scenario(driver, proxmox, scenario, fleet_size, concurrency, args.repeat)
+                        print(json.dumps(result), file=sys.stderr)
+                        results.append(result)
+                finally:
+                    backend.stop()
+                with proxmox.state.lock:
+                    for vmid in [vmid for vmid in proxmox.state.guests if vmid >= FIRST_VMID]:
+                        del proxmox.state.guests[vmid]
+    finally:
+        proxmox.shutdown()
+
+    options = {key: value for key, value in vars(args).items() if key not in ("output", "compare", "keep")}
+    return {
+        "revision": git_revision(),
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "options": options,
+        "proxmox_requests": proxmox.requests,
+        "results": results,
+    }
+
+
+def compare(before_path, after_path):
+    """
+    Print the p50/p95 latency and throughput changes between two result files
+    """
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def key(result):
+        return result["scenario"], result["fleet_size"], result["concurrency"]
+
+    previous = {key(result): result for result in before["results"]}
+    print(f"{'scenario':<10}{'fleet':>7}{'conc':>6}  {'p50 ms':^24}  {'p95 ms':^24}  {'machines/s':^24}")
+    for result in after["results"]:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        cells = []
+        for new_value, old_value in ((result["latency_ms"]["p50"], old["latency_ms"]["p50"]),
+                                     (result["latency_ms"]["p95"], old["latency_ms"]["p95"]),
+                                     (result["machines_per_second"], old["machines_per_second"])):
+            change = (new_value - old_value) / old_value * 100 if old_value else 0
+            cells.append(f"{old_value:>9.1f} → {new_value:<7.1f}{change:+4.0f}%")
+        print(f"{result['scenario']:<10}{result['fleet_size']:>7}{result['concurrency']:>6}  " + "  ".join(cells))
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fleet-sizes", type=int_list, default=[10])
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4])
+    parser.add_argument("--scenarios", type=lambda value: value.split(","), default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=3, help="requests of the fleet-wide scenarios")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=8, help="threads per worker")
+    parser.add_argument("--existing-guests", type=int, default=200, help="guests already on the fake cluster")
+    parser.add_argument("--proxmox-latency-ms", type=float, default=5)
+    parser.add_argument("--proxmox-jitter-ms", type=float, default=5)
+    parser.add_argument("--proxmox-error-rate", type=float, default=0)
+    parser.add_argument("--tf-init", type=float, default=0.5, help="seconds")
+    parser.add_argument("--tf-plan", type=float, default=0.3, help="seconds")
+    parser.add_argument("--tf-apply", type=float, default=1.0, help="seconds")
+    parser.add_argument("--tf-destroy", type=float, default=0.5, help="seconds")
+    parser.add_argument("--tf-fail-rate", type=float, default=0)
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the backend copies and logs")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = json.dumps(benchmark(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
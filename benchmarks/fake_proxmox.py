@@ -0,0 +1,341 @@
+"""
+Local stand-in for the Proxmox VE API, answering the calls the backend makes
+with a configurable latency, error rate and number of existing guests.
+
+Guests that do not exist yet are created as stopped containers on first
+access, so machines "deployed" by the fake terraform can be booted and
+health-checked afterwards.
+
+    python -m benchmarks.fake_proxmox --port 8006 --latency-ms 20 --guests 500
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import ssl
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+GUEST_IP_PREFIX = os.getenv("FAKE_GUEST_IP_PREFIX", "127.77")
+
+CT_TEMPLATES = ("debian-12-standard_12.2-1_amd64.tar.zst", "ubuntu-24.04-standard_24.04-2_amd64.tar.zst")
+GUEST_PATH = re.compile(r"^/nodes/(?P<node>[^/]+)/(?P<type>qemu|lxc)/(?P<vmid>\d+)(?P<rest>/.*)?$")
+
+
+def guest_ip(vmid, prefix=GUEST_IP_PREFIX):
+    """
+    Deterministic address of a guest, shared with the fake terraform
+    """
+    vmid = int(vmid)
+    return f"{prefix}.{vmid // 256 % 256}.{vmid % 256}"
+
+
+class ProxmoxState:
+    """
+    Nodes and guests of the fake cluster
+    """
+
+    def __init__(self, nodes=("pve",), guests=0, first_vmid=100, ip_prefix=GUEST_IP_PREFIX):
+        self.nodes = list(nodes)
+        self.ip_prefix = ip_prefix
+        self.guests = {}
+        self.lock = threading.Lock()
+        for index in range(guests):
+            vmid = first_vmid + index
+            self.guests[vmid] = self._new_guest(vmid, "lxc" if index % 2 else "qemu",
+                                                self.nodes[index % len(self.nodes)], "running")
+
+    def _new_guest(self, vmid, guest_type, node, status="stopped"):
+        return {"vmid": vmid, "type": guest_type, "node": node, "status": status,
+                "name": f"guest-{vmid}", "ip": guest_ip(vmid, self.ip_prefix)}
+
+    def guest(self, vmid, guest_type, node):
+        """
+        :return: the guest, created as a stopped container when unknown, None for a missing VM
+        """
+        with self.lock:
+            guest = self.guests.get(vmid)
+            if guest is None and guest_type == "lxc":
+                guest = self.guests[vmid] = self._new_guest(vmid, "lxc", node)
+            if guest is None or guest["type"] != guest_type:
+                return None
+            return guest
+
+    def list_guests(self, node=None, guest_type=None):
+        with self.lock:
+            return [dict(guest) for guest in self.guests.values()
+                    if (node is None or guest["node"] == node) and (guest_type is None or guest["type"] == guest_type)]
+
+
+class ProxmoxHandler(BaseHTTPRequestHandler):
+    """
+    Routes /api2/json requests to the cluster state
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "pve-api-daemon/3.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method):
+        options = self.server.options
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+
+        delay = options.latency + random.uniform(0, options.jitter)
+        if delay:
+            time.sleep(delay)
+        self.server.count(method)
+
+        url = urlsplit(self.path)
+        path = url.path[len("/api2/json"):] if url.path.startswith("/api2/json") else url.path
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        params.update({key: values[-1] for key, values in parse_qs(body).items()})
+
+        if random.random() < options.error_rate:
+            self._reply(500, None, "injected error")
+            return
+        try:
+            status, data = self._route(method, path, params)
+        except Exception as e:
+            status, data = 500, None
+            self._reply(status, data, str(e))
+            return
+        self._reply(status, data)
+
+    def _reply(self, status, data, message=None):
+        payload = {"data": data}
+        if message:
+            payload["message"] = message
+        raw = json.dumps(payload).encode("utf-8")
+        self.send_response(status, message)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _route(self, method, path, params):
+        state = self.server.state
+        if path == "/version":
+            return 200, {"version": "8.2.2", "release": "8.2"}
+        if path == "/nodes":
+            return 200, [self._node_summary(node) for node in state.nodes]
+        if path == "/cluster/resources":
+            return 200, self._cluster_resources(params.get("type"))
+
+        match = GUEST_PATH.match(path)
+        if match:
+            return self._guest(method, match, params)
+
+        parts = path.strip("/").split("/")
+        if len(parts) >= 2 and parts[0] == "nodes" and parts[1] in state.nodes:
+            node = parts[1]
+            rest = "/".join(parts[2:])
+            if rest == "lxc" and method == "POST":
+                vmid = int(params["vmid"])
+                with state.lock:
+                    guest = state.guests[vmid] = state._new_guest(vmid, "lxc", node)
+                    guest["name"] = params.get("hostname", guest["name"])
+                    guest["config"] = {key: value for key, value in params.items() if key in ("cores", "memory")}
+                return 200, f"UPID:{node}:0000{vmid}:0:{int(time.time()):08X}:vzcreate:{vmid}:root@pam:"
+            if rest.startswith("tasks/") and rest.endswith("/status"):
+                return 200, {"status": "stopped", "exitstatus": "OK"}
+            if rest in ("qemu", "lxc"):
+                return 200, [self._guest_summary(guest) for guest in state.list_guests(node, rest)]
+            if rest == "status":
+                return 200, self._node_summary(node)
+            if rest == "rrddata":
+                return 200, self._rrddata()
+            if rest == "storage":
+                return 200, [{"storage": "local-lvm", "type": "lvmthin", "active": 1,
+                              "total": 500 << 30, "used": 120 << 30, "avail": 380 << 30}]
+            if rest == "storage/local/content":
+                return 200, [{"volid": f"local:vztmpl/{template}", "content": "vztmpl"} for template in CT_TEMPLATES]
+            if rest == "network":
+                return 200, [{"iface": "vmbr0", "type": "bridge", "active": 1}]
+        return 501, None
+
+    def _guest(self, method, match, params):
+        vmid = int(match.group("vmid"))
+        guest_type = match.group("type")
+        rest = (match.group("rest") or "").strip("/")
+        guest = self.server.state.guest(vmid, guest_type, match.group("node"))
+        if guest is None:
+            return 500, None
+
+        if rest == "status/current":
+            return 200, self._guest_summary(guest)
+        if rest in ("status/start", "status/stop", "status/shutdown", "status/reboot") and method == "POST":
+            guest["status"] = "stopped" if rest in ("status/stop", "status/shutdown") else "running"
+            return 200, f"UPID:{guest['node']}:0000{vmid}:0:{int(time.time()):08X}:{rest[7:]}:{vmid}:root@pam:"
+        if rest == "config":
+            if method == "PUT" or method == "POST":
+                guest.setdefault("config", {}).update(params)
+                guest["name"] = params.get("hostname", guest["name"])
+                return 200, None
+            config = {"hostname": guest["name"], "memory": 2048, "cores": 2,
+                      "net0": f"name=eth0,bridge=vmbr0,ip={guest['ip']}/24,type=veth"}
+            config.update(guest.get("config", {}))
+            return 200, config
+        if rest == "resize" and method == "PUT":
+            return 200, f"UPID:{guest['node']}:0000{vmid}:0:{int(time.time()):08X}:resize:{vmid}:root@pam:"
+        if rest == "interfaces":
+            if guest["status"] != "running":
+                return 500, None
+            return 200, [{"name": "lo", "inet": "127.0.0.1/8"},
+                         {"name": "eth0", "inet": f"{guest['ip']}/24", "hwaddr": "bc:24:11:00:00:01"}]
+        if rest == "agent/network-get-interfaces":
+            if guest["status"] != "running":
+                return 500, None
+            return 200, {"result": [{"name": "eth0", "ip-addresses": [
+                {"ip-address-type": "ipv4", "ip-address": guest["ip"], "prefix": 24}]}]}
+        if rest == "" and method == "DELETE":
+            with self.server.state.lock:
+                self.server.state.guests.pop(vmid, None)
+            return 200, f"UPID:{guest['node']}:0000{vmid}:0:{int(time.time()):08X}:vzdestroy:{vmid}:root@pam:"
+        return 501, None
+
+    @staticmethod
+    def _guest_summary(guest):
+        running = guest["status"] == "running"
+        config = guest.get("config", {})
+        cores = int(config.get("cores", 2))
+        return {"vmid": guest["vmid"], "name": guest["name"], "status": guest["status"],
+                "type": guest["type"], "node": guest["node"], "template": int(guest.get("template", 0)),
+                "cpu": random.random() * 0.3 if running else 0, "cpus": cores, "maxcpu": cores,
+                "mem": (512 << 20) if running else 0, "maxmem": int(config.get("memory", 2048)) << 20,
+                "disk": 4 << 30, "maxdisk": 20 << 30,
+                "netin": random.randint(0, 1 << 30), "netout": random.randint(0, 1 << 30),
+                "diskread": 0, "diskwrite": 0, "uptime": 3600 if running else 0}
+
+    @staticmethod
+    def _node_summary(node):
+        return {"node": node, "status": "online", "cpu": random.random() * 0.5, "maxcpu": 32,
+                "mem": 48 << 30, "maxmem": 128 << 30, "disk": 200 << 30, "maxdisk": 1 << 40, "uptime": 86400}
+
+    def _cluster_resources(self, resource_type):
+        state = self.server.state
+        resources = []
+        if resource_type in (None, "node"):
+            for node in state.nodes:
+                summary = self._node_summary(node)
+                summary.update({"type": "node", "id": f"node/{node}"})
+                resources.append(summary)
+        if resource_type in (None, "vm"):
+            for guest in state.list_guests():
+                summary = self._guest_summary(guest)
+                summary["id"] = f"{guest['type']}/{guest['vmid']}"
+                resources.append(summary)
+        if resource_type in (None, "storage"):
+            for node in state.nodes:
+                resources.append({"type": "storage", "id": f"storage/{node}/local-lvm", "node": node,
+                                  "storage": "local-lvm", "plugintype": "lvmthin", "status": "available", "shared": 0,
+                                  "content": "images,rootdir", "maxdisk": 500 << 30, "disk": 120 << 30})
+        return resources
+
+    @staticmethod
+    def _rrddata():
+        now = int(time.time()) // 60 * 60
+        return [{"time": now - 60 * index, "cpu": random.random() * 0.5, "maxcpu": 32,
+                 "memused": 48 << 30, "memtotal": 128 << 30, "netin": 1e6, "netout": 1e6}
+                for index in range(70, 0, -1)]
+
+
+class FakeProxmoxServer(ThreadingHTTPServer):
+    """
+    HTTPS server with a throwaway self-signed certificate
+    """
+
+    daemon_threads = True
+    request_queue_size = 512
+
+    def __init__(self, address, state, latency=0.0, jitter=0.0, error_rate=0.0):
+        super().__init__(address, ProxmoxHandler)
+        self.state = state
+        self.options = argparse.Namespace(latency=latency, jitter=jitter, error_rate=error_rate)
+        self.requests = {}
+        self.requests_lock = threading.Lock()
+        self.socket = _tls_context().wrap_socket(self.socket, server_side=True)
+
+    def count(self, method):
+        with self.requests_lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-proxmox", daemon=True).start()
+        return self
+
+
+def _tls_context():
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fake-proxmox")])
+    now = datetime.datetime.utcnow()
+    certificate = (x509.CertificateBuilder()
+                   .subject_name(name).issuer_name(name)
+                   .public_key(key.public_key())
+                   .serial_number(x509.random_serial_number())
+                   .not_valid_before(now - datetime.timedelta(days=1))
+                   .not_valid_after(now + datetime.timedelta(days=30))
+                   .sign(key, hashes.SHA256()))
+
+    directory = tempfile.mkdtemp(prefix="fake-proxmox-")
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as file:
+        file.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as file:
+        file.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                     serialization.NoEncryption()))
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Proxmox VE API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8006)
+    parser.add_argument("--nodes", default="pve", help="comma separated node names")
+    parser.add_argument("--guests", type=int, default=0, help="guests existing at startup")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    state = ProxmoxState(args.nodes.split(","), args.guests)
+    server = FakeProxmoxServer((args.host, args.port), state, args.latency_ms / 1000,
+                               args.jitter_ms / 1000, args.error_rate)
+    print(f"Fake Proxmox API listening on https://{args.host}:{server.port}/api2/json")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
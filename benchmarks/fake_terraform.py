@@ -0,0 +1,260 @@
+"""
+Stand-in for the terraform binary: sleeps for a configurable time per phase
+and prints the output a real run of the repository's templates would print.
+
+Phase durations, in seconds, come from FAKE_TF_INIT_SECONDS,
+FAKE_TF_PLAN_SECONDS, FAKE_TF_APPLY_SECONDS and FAKE_TF_DESTROY_SECONDS,
+FAKE_TF_FAIL_RATE is the probability of a failed apply, and
+FAKE_TF_NO_LINKED_CLONE=1 makes Proxmox refuse linked clones.
+
+A workspace with a backend.tf keeps its state behind the HTTP backend it
+names, locked for the whole plan, apply or destroy like Terraform does.
+"""
+
+import base64
+
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_proxmox import guest_ip  # noqa: E402 (run as a script, not as a module)
+
+DEFAULT_SECONDS = {"init": 0.5, "plan": 0.3, "apply": 1.0, "destroy": 0.5}
+TFVAR_LINE = re.compile(r'^\s*(\w+)\s*=\s*(.+?)\s*$')
+BACKEND_ADDRESS = re.compile(r'^\s*address\s*=\s*"([^"]+)"', re.MULTILINE)
+GREEN = "\x1b[32m"
+BOLD = "\x1b[1m"
+RESET = "\x1b[0m"
+
+
+def read_tfvars(path="terraform.tfvars"):
+    tfvars = {}
+    if not os.path.exists(path):
+        return tfvars
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            match = TFVAR_LINE.match(line)
+            if match:
+                tfvars[match.group(1)] = match.group(2).strip('"')
+    return tfvars
+
+
+def phase_seconds(phase):
+    value = os.getenv(f"FAKE_TF_{phase.upper()}_SECONDS")
+    return float(value) if value else DEFAULT_SECONDS[phase]
+
+
+def guests(tfvars):
+    """
+    :return: list of (vmid, name, kind) the workspace creates, kind being "ct", "vm" or "pack"
+    """
+    if "vm_count" in tfvars:
+        start = int(tfvars.get("start_vmid", 5000))
+        base_name = tfvars.get("base_name", "pack")
+        return [(start + index, f"{base_name}-{index + 1}", "pack") for index in range(int(tfvars["vm_count"]))]
+    kind = "vm"
+    if os.path.exists("outputs.tf"):
+        with open("outputs.tf", "r", encoding="utf-8") as file:
+            kind = "ct" if 'output "ct_id"' in file.read() else "vm"
+    return [(int(tfvars.get("vm_id", 5000)), tfvars.get("vm_name", "machine"), kind)]
+
+
+def mac(vmid):
+    return f"BC:24:11:{vmid // 65536 % 256:02X}:{vmid // 256 % 256:02X}:{vmid % 256:02X}"
+
+
+def render_list(name, values, quoted=True):
+    lines = [f"{name} = ["]
+    lines.extend(f'  "{value}",' if quoted else f"  {value}," for value in values)
+    lines.append("]")
+    return lines
+
+
+def outputs(created):
+    if created[0][2] == "pack":
+        vmids = [vmid for vmid, _, _ in created]
+        lines = []
+        lines += render_list("vm_ids", vmids, quoted=False)
+        lines += render_list("vm_ip_addresses", [guest_ip(vmid) for vmid in vmids])
+        lines += render_list("vm_mac_addresses", [mac(vmid) for vmid in vmids])
+        lines += render_list("vm_names", [name for _, name, _ in created])
+        return lines
+
+    vmid, name, kind = created[0]
+    prefix = "ct" if kind == "ct" else "vm"
+    return [
+        f"{prefix}_id = {vmid}",
+        f'{prefix}_ip_address = "{guest_ip(vmid)}"',
+        f'{prefix}_name = "{name}"',
+        f'{prefix}_node = "{read_tfvars().get("proxmox_node", "pve")}"',
+    ]
+
+
+def resource_type(kind):
+    return "proxmox_lxc" if kind in ("ct", "pack") else "proxmox_vm_qemu"
+
+
+class HttpBackend:
+    """
+    Client of the Terraform HTTP state backend, with the credentials of TF_HTTP_USERNAME and TF_HTTP_PASSWORD
+    """
+
+    def __init__(self, address):
+        self.address = address
+        credentials = f"{os.getenv('TF_HTTP_USERNAME', '')}:{os.getenv('TF_HTTP_PASSWORD', '')}"
+        self.authorization = "Basic " + base64.b64encode(credentials.encode()).decode()
+        self.lock_id = None
+
+    @classmethod
+    def from_workspace(cls):
+        if not os.path.exists("backend.tf"):
+            return None
+        with open("backend.tf", "r", encoding="utf-8") as file:
+            match = BACKEND_ADDRESS.search(file.read())
+        return cls(match.group(1)) if match else None
+
+    def request(self, method, data=None, query=""):
+        request = urllib.request.Request(self.address + query, data=data, method=method,
+                                         headers={"Authorization": self.authorization})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.read()
+
+    def lock(self, timeout):
+        info = {"ID": str(uuid.uuid4()), "Operation": "OperationTypeApply", "Who": f"fake@{os.getpid()}"}
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.request("LOCK", json.dumps(info).encode())
+                self.lock_id = info["ID"]
+                return True
+            except urllib.error.HTTPError as e:
+                if e.code not in (409, 423) or time.monotonic() >= deadline:
+                    holder = json.loads(e.read() or b"{}").get("ID")
+                    print(f"{BOLD}Error:{RESET} Error acquiring the state lock\n\nLock Info:\n  ID: {holder}",
+                          file=sys.stderr)
+                    return False
+                time.sleep(0.2)
+
+    def unlock(self):
+        if self.lock_id:
+            self.request("UNLOCK", json.dumps({"ID": self.lock_id}).encode())
+
+    def save(self, state):
+        query = f"?ID={self.lock_id}" if self.lock_id else ""
+        self.request("POST", json.dumps(state).encode(), query)
+
+
+def lock_timeout(argv):
+    for arg in argv:
+        if arg.startswith("-lock-timeout="):
+            return float(arg.split("=", 1)[1].rstrip("s"))
+    return 0
+
+
+def save_state(state, backend):
+    if backend:
+        backend.save(state)
+    else:
+        with open("terraform.tfstate", "w", encoding="utf-8") as file:
+            json.dump(state, file)
+
+
+def write_state(created, backend=None):
+    resources = [{
+        "mode": "managed",
+        "type": resource_type(kind),
+        "name": "machine",
+        "instances": [{"attributes": {"vmid": vmid, "hostname": name,
+                                      "network": [{"name": "eth0", "ip": f"{guest_ip(vmid)}/24"}]}}]
+    } for vmid, name, kind in created]
+    save_state({"version": 4, "terraform_version": "1.8.5", "serial": 1, "lineage": "fake",
+                "resources": resources}, backend)
+
+
+def init():
+    os.makedirs(".terraform", exist_ok=True)
+    print(f"\n{BOLD}Initializing the backend...{RESET}\n{BOLD}Initializing provider plugins...{RESET}")
+    print('- Finding telmate/proxmox versions matching "3.0.1-rc4"...')
+    print("- Installing telmate/proxmox v3.0.1-rc4...")
+    print(f"\n{BOLD}{GREEN}Terraform has been successfully initialized!{RESET}")
+    return 0
+
+
+def plan(created):
+    for vmid, name, kind in created:
+        print(f"  # {resource_type(kind)}.machine[\"{name}\"] will be created")
+        print(f'  + resource "{resource_type(kind)}" "machine" {{\n      + vmid = {vmid}\n    }}')
+    print(f"\n{BOLD}Plan:{RESET} {len(created)} to add, 0 to change, 0 to destroy.")
+    return 0
+
+
+def apply(created, backend=None):
+    if random.random() < float(os.getenv("FAKE_TF_FAIL_RATE", "0")):
+        print(f"{BOLD}Error:{RESET} 500 Internal Server Error: unable to create container", file=sys.stderr)
+        return 1
+    if os.getenv("FAKE_TF_NO_LINKED_CLONE") and read_tfvars().get("full_clone") == "false":
+        print(f"{BOLD}Error:{RESET} clone failed: Linked clone feature is not supported for drive 'scsi0'",
+              file=sys.stderr)
+        return 1
+    for vmid, name, kind in created:
+        print(f"{resource_type(kind)}.machine[\"{name}\"]: Creating...")
+        print(f"{resource_type(kind)}.machine[\"{name}\"]: Creation complete after 12s [id=pve/lxc/{vmid}]")
+    write_state(created, backend)
+    print(f"\n{BOLD}{GREEN}Apply complete! Resources: {len(created)} added, 0 changed, 0 destroyed.{RESET}\n")
+    print(f"{BOLD}{GREEN}Outputs:{RESET}\n")
+    print("\n".join(outputs(created)))
+    return 0
+
+
+def destroy(created, backend=None):
+    for _, name, kind in created:
+        print(f"{resource_type(kind)}.machine[\"{name}\"]: Destruction complete after 3s")
+    if backend:
+        backend.save({"version": 4, "terraform_version": "1.8.5", "serial": 2, "lineage": "fake", "resources": []})
+    elif os.path.exists("terraform.tfstate"):
+        os.remove("terraform.tfstate")
+    shutil.rmtree(".terraform", ignore_errors=True)
+    print(f"\n{BOLD}{GREEN}Destroy complete! Resources: {len(created)} destroyed.{RESET}")
+    return 0
+
+
+def main(argv):
+    command = argv[0] if argv else "version"
+    if command == "version":
+        print("Terraform v1.8.5\non linux_amd64")
+        return 0
+    if command not in ("init", "plan", "apply", "destroy"):
+        return 0  # validate, fmt, force-unlock...
+    if command == "apply" and "-destroy" in argv:
+        command = "destroy"
+
+    if command == "init":
+        time.sleep(phase_seconds(command))
+        return init()
+    backend = HttpBackend.from_workspace()
+    if backend and "-lock=false" not in argv and not backend.lock(lock_timeout(argv)):
+        return 1
+    try:
+        time.sleep(phase_seconds(command))
+        if "-refresh-only" in argv:
+            print(f"{BOLD}{GREEN}No changes.{RESET} Your infrastructure still matches the configuration.")
+            return 0
+        created = guests(read_tfvars())
+        if command == "plan":
+            return plan(created)
+        return {"apply": apply, "destroy": destroy}[command](created, backend)
+    finally:
+        if backend:
+            backend.unlock()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,114 @@
+"""
+Deterministic inputs for the micro-benchmarks, generated in memory
+"""
+
+import random
+
+ANSI_BOLD = "\x1b[1m"
+ANSI_GREEN = "\x1b[32m"
+ANSI_RESET = "\x1b[0m"
+
+LINUX_TEMPLATES = (
+    "debian-12-standard_12.2-1_amd64.tar.zst",
+    "ubuntu-24.04-standard_24.04-2_amd64.tar.zst",
+    "noble-server-cloudimg-amd64.img",
+)
+
+
+def ip(index):
+    return f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 254 + 1}"
+
+
+def mac(index):
+    return f"BC:24:11:{index // 65536 % 256:02X}:{index // 256 % 256:02X}:{index % 256:02X}"
+
+
+def vmpack_outputs(count, start_vmid=5000, base_name="pack"):
+    """
+    :return: the Outputs block of a vm-pack apply creating count containers
+    """
+    vmids = range(start_vmid, start_vmid + count)
+    lines = ["Outputs:", ""]
+    for name, values in (("vm_ids", [str(vmid) for vmid in vmids]),
+                         ("vm_ip_addresses", [f'"{ip(vmid)}"' for vmid in vmids]),
+                         ("vm_mac_addresses", [f'"{mac(vmid)}"' for vmid in vmids]),
+                         ("vm_names", [f'"{base_name}-{index + 1}"' for index in range(count)])):
+        lines.append(f"{name} = [")
+        lines.extend(f"  {value}," for value in values)
+        lines.append("]")
+    return "\n".join(lines)
+
+
+def terraform_apply_log(size, vm_count=20, seed=0):
+    """
+    Colored apply output of about size bytes: progress lines, the summary and the outputs
+    """
+    rng = random.Random(seed)
+    outputs = vmpack_outputs(vm_count)
+    lines = []
+    length = len(outputs)
+    while length < size:
+        index = rng.randrange(vm_count)
+        line = rng.choice((
+            f'{ANSI_BOLD}proxmox_lxc.machine["pack-{index + 1}"]: Still creating... [{rng.randrange(10, 600)}s elapsed]{ANSI_RESET}',
+            f'{ANSI_BOLD}proxmox_lxc.machine["pack-{index + 1}"]: Creating...{ANSI_RESET}',
+            f'  # proxmox_lxc.machine["pack-{index + 1}"] will be created',
+            f'      + network {{ + ip = "{ip(index)}/24" + bridge = "vmbr0" }}',
+            "",
+            "   ",
+        ))
+        lines.append(line)
+        length += len(line) + 1
+    lines.append(f"\n{ANSI_BOLD}{ANSI_GREEN}Apply complete! Resources: {vm_count} added, 0 changed, 0 destroyed.{ANSI_RESET}\n")
+    lines.append(outputs)
+    return "\n".join(lines)
+
+
+def machine(index, rng):
+    """
+    One machine of a Conceptify topology, of a random type
+    """
+    kind = rng.choice(("ct", "vm", "windows", "pack"))
+    advanced = {"vmid": 5000 + index, "perf": rng.choice(("low", "medium", "high")), "username": "admin"}
+    if kind == "pack":
+        return {"id": f"vmPack-{index}", "name": f"pack {index}", "baseType": "vmPack", "advanced": advanced,
+                "group": {"count": rng.randrange(2, 6), "os_version": rng.choice(LINUX_TEMPLATES)}}
+    if kind == "windows":
+        advanced.update({"os_version": rng.choice(("2016", "2019", "2022")), "roles": ["ADDS", "DNS"]})
+        return {"id": f"windowsServer-{index}", "name": f"win_{index}", "baseType": "windowsServer",
+                "advanced": advanced}
+    advanced.update({"type": kind, "os_version": rng.choice(LINUX_TEMPLATES), "sshKey": "ssh-ed25519 AAAA bench"})
+    if rng.random() < 0.5:
+        advanced.update({"ip_mode": "static", "ip_address": ip(index), "subnet_mask": "24"})
+    return {"id": f"linuxServer-{index}", "name": f"linux-{index}", "baseType": "linuxServer",
+            "advanced": advanced}
+
+
+def topology(count, seed=0):
+    rng = random.Random(seed)
+    return [machine(index, rng) for index in range(count)]
+
+
+def tracked_machines(count, first_vmid=20000):
+    """
+    Entries of a deployed_machines.json tracking file
+    """
+    return [{
+        "id": str(first_vmid + index),
+        "name": f"tracked-{index}",
+        "base_type": "linuxServer",
+        "deployment_time": "2026-01-01T00:00:00",
+        "ip_address": ip(first_vmid + index),
+        "status": "running",
+        "config": {"vm_id": first_vmid + index, "advanced": {"ip_address": ip(first_vmid + index)}},
+    } for index in range(count)]
+
+
+def lxc_interfaces(count):
+    """
+    /interfaces answer of a container with count veth interfaces before eth0
+    """
+    interfaces = [{"name": "lo", "inet": "127.0.0.1/8", "hwaddr": "00:00:00:00:00:00"}]
+    interfaces.extend({"name": f"veth{index}", "inet6": "fe80::1/64", "hwaddr": mac(index)} for index in range(count))
+    interfaces.append({"name": "eth0", "inet": "10.0.0.42/24", "hwaddr": mac(count)})
+    return interfaces
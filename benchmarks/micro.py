@@ -0,0 +1,211 @@
+"""
+Micro-benchmarks of the CPU-bound parsing and generation paths, compared
+against the timings stored in benchmarks/baseline.json.
+
+    python -m benchmarks.micro                     # run and flag regressions
+    python -m benchmarks.micro -k summary          # only matching benchmarks
+    python -m benchmarks.micro --update-baseline   # record new reference timings
+
+Exits with status 1 when a benchmark is slower than its baseline by more
+than the threshold.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+from application.services.deployment_service import DeploymentService
+from application.services.deployment_tracking_service import DeploymentTrackingService
+from application.services.health_check_service import HealthCheckService
+from application.services.validation_service import ValidationService
+from benchmarks import fixtures
+from infrastructure.data.settings import ProxmoxCredentials
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SIZES = (("100KB", 100 * 1024), ("1MB", 1024 * 1024), ("10MB", 10 * 1024 * 1024))
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Register a benchmark: the decorated function prepares the inputs and
+    returns the callable that is timed
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def service(cls, **attributes):
+    """
+    Service instance without its constructor, which reaches for files and Proxmox
+    """
+    instance = cls.__new__(cls)
+    instance.__dict__.update(attributes)
+    return instance
+
+
+class StaticInventory:
+    def __init__(self, guests):
+        self.guests = guests
+
+    def get_guests(self):
+        return self.guests
+
+
+class StaticTracking:
+    def __init__(self, machines):
+        self.machines = machines
+
+    def get_deployed_machines(self):
+        return self.machines
+
+
+def deployment_service():
+    credentials = ProxmoxCredentials.parse("127.0.0.1", "pve", "root@pam!bench=secret")
+    return service(DeploymentService, config_manager=SimpleNamespace(proxmox=credentials))
+
+
+@benchmark("generate_tfvars/10k-machines")
+def bench_generate_tfvars():
+    deployments = deployment_service()
+    machines = fixtures.topology(10000)
+    return lambda: [deployments._render_tfvars(deployments._build_tfvars(machine)) for machine in machines]
+
+
+def _register_log_benchmarks(label, size):
+    @benchmark(f"clean_terraform_output/{label}")
+    def bench_clean():
+        deployments = deployment_service()
+        log = fixtures.terraform_apply_log(size)
+        return lambda: deployments._clean_terraform_output(log)
+
+    @benchmark(f"extract_deployment_summary/{label}")
+    def bench_summary():
+        deployments = deployment_service()
+        cleaned = deployments._clean_terraform_output(fixtures.terraform_apply_log(size))
+        return lambda: deployments._extract_deployment_summary(cleaned, "pack")
+
+    @benchmark(f"extract_ip_from_result/{label}")
+    def bench_extract_ip():
+        tracking = service(DeploymentTrackingService)
+        # No named IP output: falls back to scanning the whole log
+        result = {"output": fixtures.terraform_apply_log(size).replace("vm_ip_addresses", "addresses")}
+        return lambda: tracking._extract_ip_from_result(result)
+
+
+for _label, _size in SIZES:
+    _register_log_benchmarks(_label, _size)
+
+
+@benchmark("add_vmpack_machines/500-into-10k")
+def bench_add_vmpack_machines():
+    tracking = service(DeploymentTrackingService)
+    tracked = fixtures.tracked_machines(10000)
+    pack = {"id": "vmPack-1", "name": "pack", "baseType": "vmPack"}
+    result = {"success": True, "output": fixtures.vmpack_outputs(500)}
+    return lambda: tracking._add_vmpack_machines(list(tracked), pack, result)
+
+
+@benchmark("extract_ip_from_lxc_interfaces/1k-interfaces")
+def bench_lxc_interfaces():
+    health = service(HealthCheckService)
+    interfaces = fixtures.lxc_interfaces(1000)
+    return lambda: health._extract_ip_from_lxc_interfaces(interfaces)
+
+
+@benchmark("validate_config/10k-machines")
+def bench_validate():
+    guests = {vmid: {"name": f"guest-{vmid}", "node": "pve", "type": "lxc"} for vmid in range(100, 5100)}
+    validation = ValidationService(StaticInventory(guests), StaticTracking(fixtures.tracked_machines(10000)))
+    machines = fixtures.topology(10000)
+    return lambda: validation.validate(machines)
+
+
+def measure(function, repeat, min_time):
+    """
+    :return: per-call seconds of each of the repeat samples, a sample looping
+             until it lasts at least min_time
+    """
+    started = time.perf_counter()
+    function()
+    single = time.perf_counter() - started
+    number = max(1, int(min_time / single)) if single > 0 else 1000
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter() - started) / number)
+    return samples
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get("benchmarks", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="pattern", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds of a sample")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # The services log every parsed line at INFO
+    logging.disable(logging.CRITICAL)
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<48}{'best':>12}{'median':>12}{'baseline':>12}{'change':>9}")
+    for name, setup in BENCHMARKS.items():
+        if args.pattern not in name:
+            continue
+        samples = measure(setup(), args.repeat, args.min_time)
+        best = min(samples)
+        results[name] = {"best": best, "median": statistics.median(samples)}
+        reference = baseline.get(name, {}).get("best")
+        change = ""
+        if reference:
+            ratio = best / reference - 1
+            change = f"{ratio:+.0%}"
+            if ratio > args.threshold:
+                regressions.append(name)
+                change += " !"
+        print(f"{name:<48}{best * 1000:>10.3f}ms{results[name]['median'] * 1000:>10.3f}ms"
+              f"{(reference or 0) * 1000:>10.3f}ms{change:>9}")
+
+    report = {"python": platform.python_version(), "machine": platform.machine(), "benchmarks": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        merged = dict(baseline, **results)
+        with open(args.baseline, "w") as f:
+            json.dump(dict(report, benchmarks=dict(sorted(merged.items()))), f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
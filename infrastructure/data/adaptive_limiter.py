@@ -0,0 +1,126 @@
+"""
+AIMD concurrency limits shared by every caller of this process: one budget
+for the backend's own Proxmox API calls, one for Terraform runs, which issue
+the heavy clone and create tasks
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from infrastructure.data.metrics import CONCURRENCY_IN_USE, CONCURRENCY_LIMIT, CONCURRENCY_WAIT
+
+
+class Permit:
+    """
+    Slot held by one call, which can report that the call saw an overloaded server
+    """
+
+    __slots__ = ("overloaded",)
+
+    def __init__(self):
+        self.overloaded = False
+
+    def drop(self):
+        """
+        Count the call as a congestion signal even though it did not raise
+        """
+        self.overloaded = True
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit raised by one slot per limit's worth of fast calls
+    (additive increase) and multiplied by backoff on an error or a call
+    slower than tolerance times the usual latency of its kind
+    (multiplicative decrease), at most once per round trip.
+    """
+
+    def __init__(self, name, max_limit, min_limit=1, backoff=0.7, tolerance=2.0, warmup=10):
+        """
+        :param tolerance: latency, relative to the average of the same kind of call, counted as congestion
+        :param warmup: calls of a kind before its latency counts, errors always do
+        """
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        # Start low and let additive increase find the capacity, the first calls set the latency reference
+        self.limit = float(max(min_limit, max_limit // 4))
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.warmup = warmup
+        self.in_use = 0
+        self.latencies = {}  # kind -> (samples, average seconds)
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+        CONCURRENCY_LIMIT.labels(name).set_function(lambda: self.limit)
+        CONCURRENCY_IN_USE.labels(name).set_function(lambda: self.in_use)
+
+    def configure(self, max_limit, min_limit=None):
+        """
+        Change the bounds, the current limit is clamped into them
+        """
+        with self.condition:
+            self.max_limit = max_limit
+            self.min_limit = min(self.min_limit if min_limit is None else min_limit, max_limit)
+            self.limit = float(max(self.min_limit, min(self.limit, max_limit)))
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, kind="default"):
+        """
+        Hold a slot for the duration of the block, waiting while the limit is reached.
+        An exception, or permit.drop(), counts as an error.
+        """
+        started = time.perf_counter()
+        with self.condition:
+            while self.in_use >= int(self.limit):
+                self.condition.wait()
+            self.in_use += 1
+        CONCURRENCY_WAIT.labels(self.name).observe(time.perf_counter() - started)
+
+        permit = Permit()
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield permit
+            failed = permit.overloaded
+        finally:
+            self._release(kind, time.perf_counter() - started, failed)
+
+    def _release(self, kind, elapsed, failed):
+        with self.condition:
+            samples, average = self.latencies.get(kind, (0, elapsed))
+            congested = failed or (samples >= self.warmup and elapsed > self.tolerance * average)
+            if not failed:
+                # Slow calls move the average too, slower than fast ones pull it back
+                weight = 0.02 if congested else 0.1
+                self.latencies[kind] = (samples + 1, average + weight * (elapsed - average))
+
+            now = time.monotonic()
+            if congested:
+                # One decrease per round trip: the calls started before it would report the same congestion
+                if now - self.last_decrease > average:
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                    self.last_decrease = now
+            elif self.in_use >= int(self.limit):
+                # Only a limit that was actually reached is worth raising
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self.in_use -= 1
+            self.condition.notify_all()
+
+    def state(self):
+        """
+        :return: dict with the current limit, its bounds and the slots in use
+        """
+        with self.condition:
+            return {
+                "limit": round(self.limit, 2),
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "in_use": self.in_use
+            }
+
+
+proxmox_limiter = AdaptiveLimiter("proxmox", max_limit=16, min_limit=2)
+terraform_limiter = AdaptiveLimiter("terraform", max_limit=8, min_limit=1)
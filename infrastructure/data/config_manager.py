@@ -1,72 +1,160 @@
 import os
 import json
+import threading
 from cryptography.fernet import Fernet, InvalidToken
 from dotenv import find_dotenv, set_key, load_dotenv
+from infrastructure.data.shared_state import file_lock, atomic_write_json
+from infrastructure.data.settings import ProxmoxCredentials, LdapSettings
 
 class ConfigManager:
+    # Settings grouped by consumer, each group has its own version counter
+    SECTIONS = {
+        'proxmox': ['PROXMOX_SERVER', 'PROXMOX_PORT', 'NODE', 'PVEAPITOKEN'],
+        'ldap': ['LDAPS_SERVER', 'LDAPS_SERVER_PORT', 'LDAPS_PORT', 'LDAPS_CERT', 'LDAPS_BASE_DN', 'LDAPS_USER_OU'],
+    }
+
     def __init__(self, config_path='infrastructure/persistence/config.json', env_path=None):
         self.config_path = config_path
         self.env_path = env_path if env_path else find_dotenv()
         self.secret_keys = ['PVEAPITOKEN', 'LDAPS_CERT', 'PROXMOX_SERVER', 'LDAPS_SERVER', 'LDAPS_BASE_DN']
-        
+
         if not self.env_path or not os.path.exists(self.env_path):
             raise FileNotFoundError("CRITICAL: .env file not found. The application cannot start without it.")
-        
+
         load_dotenv(dotenv_path=self.env_path)
 
         self.key = self._load_key()
         self.cipher = Fernet(self.key)
-        self.config = self._load_config()
+        self.lock = threading.Lock()
+        self.config_stamp = None
+        self.raw_config = {}
+        self.decrypted = {}
+        self.version = 0
+        self.section_versions = {section: 0 for section in self.SECTIONS}
+        self.typed_cache = {}
+        self._load_config()
 
     def _load_key(self):
         """Loads the encryption key from .env. Raises an error if not found."""
         key = os.getenv('MASTER_KEY')
         if key:
             return key.encode()
-        
+
         raise ValueError("CRITICAL: MASTER_KEY not found in .env file. The application cannot decrypt its configuration.")
 
     def _load_config(self):
-        """Loads and decrypts the config.json file."""
-        if not os.path.exists(self.config_path):
-            return {}
-        
-        with open(self.config_path, 'r') as f:
-            encrypted_config = json.load(f)
-
-        decrypted_config = {}
-        for key, value in encrypted_config.items():
-            if key in self.secret_keys:
-                if not value: # Handle empty secrets
-                    decrypted_config[key] = value
-                    continue
-                try:
-                    decrypted_config[key] = self.cipher.decrypt(value.encode()).decode()
-                except InvalidToken:
-                    raise ValueError(f"CRITICAL: Failed to decrypt '{key}' from config.json. The MASTER_KEY in your .env file may be incorrect or does not match this configuration.")
-            else:
-                decrypted_config[key] = value
-        return decrypted_config
+        """Loads the encrypted config.json file, secrets are decrypted on first access."""
+        stamp = self._config_stamp()
+        raw_config = {}
+        if stamp is not None:
+            with open(self.config_path, 'r') as f:
+                raw_config = json.load(f)
+
+        with self.lock:
+            if raw_config != self.raw_config:
+                changed = {key for key in set(raw_config) | set(self.raw_config)
+                           if raw_config.get(key) != self.raw_config.get(key)}
+                self.raw_config = raw_config
+                self.decrypted = {}
+                self.version += 1
+                for section, keys in self.SECTIONS.items():
+                    if changed.intersection(keys):
+                        self.section_versions[section] += 1
+            self.config_stamp = stamp
+
+    def _decrypt(self, key, value):
+        """Decrypts a secret once and keeps the clear value in memory."""
+        if key not in self.secret_keys or not value:  # Handle empty secrets
+            return value
+        if key not in self.decrypted:
+            try:
+                self.decrypted[key] = self.cipher.decrypt(value.encode()).decode()
+            except InvalidToken:
+                raise ValueError(f"CRITICAL: Failed to decrypt '{key}' from config.json. The MASTER_KEY in your .env file may be incorrect or does not match this configuration.")
+        return self.decrypted[key]
+
+    @property
+    def config(self):
+        """The whole decrypted configuration."""
+        self._reload_if_changed()
+        return {key: self._decrypt(key, value) for key, value in self.raw_config.items()}
+
+    def _config_stamp(self):
+        """Identifies the config.json revision on disk."""
+        try:
+            stat = os.stat(self.config_path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def _reload_if_changed(self):
+        """Picks up a config.json saved by another worker process."""
+        if self._config_stamp() != self.config_stamp:
+            self._load_config()
 
     def get(self, key, default=None):
         """Gets a value from config, falling back to environment variables."""
-        return self.config.get(key, os.getenv(key, default))
+        self._reload_if_changed()
+        if key in self.raw_config:
+            return self._decrypt(key, self.raw_config[key])
+        return os.getenv(key, default)
+
+    def section_version(self, section):
+        """Version counter of a settings section, bumped only when one of its keys changes."""
+        self._reload_if_changed()
+        return self.section_versions[section]
+
+    def _typed(self, section, build):
+        """Builds a typed settings object once per section version."""
+        version = self.section_version(section)
+        cached = self.typed_cache.get(section)
+        if cached is None or cached[0] != version:
+            cached = (version, build())
+            self.typed_cache[section] = cached
+        return cached[1]
+
+    @property
+    def proxmox(self):
+        """Parsed Proxmox credentials. Raises ValueError if missing or malformed."""
+        return self._typed('proxmox', lambda: ProxmoxCredentials.parse(
+            self.get('PROXMOX_SERVER'),
+            self.get('NODE'),
+            self.get('PVEAPITOKEN'),
+            self.get('PROXMOX_PORT', 8006)
+        ))
+
+    @property
+    def ldap(self):
+        """LDAPS settings used for user authentication."""
+        return self._typed('ldap', lambda: LdapSettings(
+            server=self.get('LDAPS_SERVER'),
+            port=int(self.get('LDAPS_SERVER_PORT') or self.get('LDAPS_PORT') or 636),
+            cert=self.get('LDAPS_CERT', 'infrastructure/persistence/certificats/ssrootca.cer'),
+            base_dn=self.get('LDAPS_BASE_DN'),
+            user_ou=self.get('LDAPS_USER_OU', '') or ''
+        ))
 
     def save_config(self, new_config):
         """Encrypts secrets and saves the entire configuration."""
-        full_config = self.config.copy()
-        full_config.update(new_config)
-
-        encrypted_config = {}
-        for key, value in full_config.items():
-            if key in self.secret_keys and value:
-                encrypted_config[key] = self.cipher.encrypt(value.encode()).decode()
-            else:
-                encrypted_config[key] = value
-        
-        with open(self.config_path, 'w') as f:
-            json.dump(encrypted_config, f, indent=4)
-        
-        # Reload the in-memory config
-        self.config = self._load_config()
-        return True 
\ No newline at end of file
+        with file_lock(self.config_path):
+            full_config = self.config.copy()
+            full_config.update(new_config)
+
+            encrypted_config = {}
+            for key, value in full_config.items():
+                if key in self.secret_keys and value:
+                    # Keep the stored ciphertext of unchanged secrets, so that
+                    # saving does not look like a change to version watchers
+                    previous = self.raw_config.get(key)
+                    if previous and self._decrypt(key, previous) == value:
+                        encrypted_config[key] = previous
+                    else:
+                        encrypted_config[key] = self.cipher.encrypt(value.encode()).decode()
+                else:
+                    encrypted_config[key] = value
+
+            atomic_write_json(self.config_path, encrypted_config, indent=4)
+
+            # Reload the in-memory config
+            self._load_config()
+        return True
@@ -0,0 +1,149 @@
+"""
+JSON documents stored on disk, parsed once and shared between requests
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, NamedTuple
+
+from infrastructure.data.metrics import CACHE_REQUESTS
+from infrastructure.data.shared_state import atomic_write_bytes, file_lock
+
+
+class DocumentValidationError(ValueError):
+    """
+    Raised when a document does not match its schema
+    """
+
+
+class Document(NamedTuple):
+    """
+    Parsed document with the raw bytes it was read from
+    """
+    data: Any
+    raw: bytes
+    etag: str
+    version: int
+
+
+SCHEMA_TYPES = {
+    "list": list,
+    "dict": dict,
+    "str": str,
+    "bool": bool,
+    "int": int,
+    "number": (int, float),
+}
+
+
+def validate(value, schema, path="$"):
+    """
+    Check value against a minimal schema:
+    {"type": ..., "items": schema, "required": {key: schema}, "optional": {key: schema}}
+    """
+    expected = SCHEMA_TYPES[schema["type"]]
+    # bool is an int subclass, do not let it pass as a number
+    if not isinstance(value, expected) or (isinstance(value, bool) and schema["type"] in ("int", "number")):
+        raise DocumentValidationError(f"{path}: expected {schema['type']}")
+    if "items" in schema:
+        for index, item in enumerate(value):
+            validate(item, schema["items"], f"{path}[{index}]")
+    for key, key_schema in schema.get("required", {}).items():
+        if key not in value:
+            raise DocumentValidationError(f"{path}: missing key '{key}'")
+        validate(value[key], key_schema, f"{path}.{key}")
+    for key, key_schema in schema.get("optional", {}).items():
+        if key in value:
+            validate(value[key], key_schema, f"{path}.{key}")
+
+
+class DocumentStore:
+    """
+    JSON file cached in memory until its mtime or size changes.
+    Writes are validated, atomic, and bump a version counter kept next to the file.
+    """
+
+    stores = {}
+    stores_lock = threading.Lock()
+
+    def __init__(self, path, schema=None):
+        self.path = path
+        self.version_path = f"{path}.version"
+        self.schema = schema
+        self.document = None
+        self.stamp = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path, schema=None):
+        """
+        :return: the store shared by every caller of this path
+        """
+        with cls.stores_lock:
+            store = cls.stores.get(path)
+            if store is None:
+                store = cls.stores[path] = cls(path, schema)
+            elif schema is not None:
+                store.schema = schema
+            return store
+
+    def read(self):
+        """
+        :return: Document, re-parsed only when the file changed
+        """
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size, self._version_stamp())
+        with self.lock:
+            if self.document is not None and stamp == self.stamp:
+                CACHE_REQUESTS.labels("document", "hit").inc()
+                return self.document
+        CACHE_REQUESTS.labels("document", "miss").inc()
+        with open(self.path, "rb") as file:
+            raw = file.read()
+        document = Document(
+            data=json.loads(raw),
+            raw=raw,
+            etag=hashlib.sha1(raw).hexdigest(),
+            version=self._read_version()
+        )
+        with self.lock:
+            self.document = document
+            self.stamp = stamp
+        return document
+
+    def write(self, raw, if_match=None):
+        """
+        Validate and replace the document
+        :param raw: JSON bytes
+        :param if_match: optional etag the current document must still have
+        :return: the new Document, None if if_match did not match
+        """
+        try:
+            data = json.loads(raw)
+        except ValueError as e:
+            raise DocumentValidationError(f"Invalid JSON: {e}") from e
+        if self.schema is not None:
+            validate(data, self.schema)
+
+        with file_lock(self.path):
+            if if_match is not None and os.path.exists(self.path) and self.read().etag != if_match:
+                return None
+            version = self._read_version() + 1
+            atomic_write_bytes(self.path, raw)
+            atomic_write_bytes(self.version_path, str(version).encode("utf-8"))
+        return self.read()
+
+    def _read_version(self):
+        try:
+            with open(self.version_path, "r", encoding="utf-8") as file:
+                return int(file.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _version_stamp(self):
+        try:
+            return os.stat(self.version_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,62 @@
+"""
+Bookkeeping of long running operations (Terraform runs) of this process,
+used to drain them before a worker shuts down
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from infrastructure.data.metrics import INFLIGHT_OPERATIONS
+
+
+class InflightOperations:
+    """
+    Count running operations and let shutdown wait for them
+    """
+
+    def __init__(self):
+        self.running = {}
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def track(self, name):
+        """
+        Mark an operation as running for the duration of the block
+        """
+        with self.condition:
+            self.running[name] = self.running.get(name, 0) + 1
+        INFLIGHT_OPERATIONS.labels(name).inc()
+        try:
+            yield
+        finally:
+            INFLIGHT_OPERATIONS.labels(name).dec()
+            with self.condition:
+                self.running[name] -= 1
+                if not self.running[name]:
+                    del self.running[name]
+                self.condition.notify_all()
+
+    def count(self):
+        """
+        :return: number of running operations
+        """
+        with self.condition:
+            return sum(self.running.values())
+
+    def wait_idle(self, timeout=None):
+        """
+        Block until no operation is running
+        :return: bool depend on if every operation finished in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+
+inflight_operations = InflightOperations()
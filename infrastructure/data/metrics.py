@@ -0,0 +1,372 @@
+"""
+Minimal Prometheus metrics: counters, gauges and histograms rendered in the
+text exposition format, aggregated across the worker processes
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+from infrastructure.data.shared_state import atomic_write_bytes, pid_alive
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base class: one value (or histogram) per combination of label values
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        """
+        :return: the child for these label values, created on first use
+        """
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """
+        :return: list of (labels tuple of (name, value), child state)
+        """
+        with self.lock:
+            children = list(self.children.items())
+        return [(tuple(zip(self.labelnames, key)), child.state()) for key, child in children]
+
+
+class _Value:
+    __slots__ = ("value", "function", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+    def set_function(self, function):
+        """
+        Compute the value on scrape, e.g. the length of a queue
+        """
+        self.function = function
+
+    def state(self):
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return self.value
+        return self.value
+
+
+class Counter(Metric):
+    """
+    Monotonic count of events
+    """
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, or is computed on scrape
+    """
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+class _HistogramValue:
+    __slots__ = ("upper_bounds", "counts", "sum", "lock")
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def state(self):
+        with self.lock:
+            return {"counts": list(self.counts), "sum": self.sum}
+
+
+class _Timer:
+    __slots__ = ("target", "started")
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.target.observe(time.perf_counter() - self.started)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values (durations, in seconds) in cumulative buckets
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.upper_bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.upper_bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+class MetricsRegistry:
+    """
+    Set of metrics of this process.
+
+    With a shared directory, each process periodically writes its samples
+    there and the exposition sums the samples of every live process.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.shared_dir = None
+
+    def _register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        """
+        :return: JSON-serializable samples of this process
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        data = {}
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception:
+                continue
+            data[metric.name] = [[list(map(list, labels)), state] for labels, state in samples]
+        return data
+
+    def share(self, directory, interval=5):
+        """
+        Start writing this process's samples to directory every interval seconds
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.shared_dir = directory
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.write_snapshot()
+
+        threading.Thread(target=loop, name="metrics-share", daemon=True).start()
+
+    def write_snapshot(self):
+        try:
+            path = os.path.join(self.shared_dir, f"metrics-{os.getpid()}.json")
+            atomic_write_bytes(path, json.dumps(self.snapshot()).encode("utf-8"))
+        except Exception:
+            pass
+
+    def _process_snapshots(self):
+        """
+        Live samples of this process and the last snapshot of every other live worker
+        """
+        snapshots = [self.snapshot()]
+        if not self.shared_dir:
+            return snapshots
+        for name in os.listdir(self.shared_dir):
+            if not (name.startswith("metrics-") and name.endswith(".json")):
+                continue
+            path = os.path.join(self.shared_dir, name)
+            pid = int(name[len("metrics-"):-len(".json")])
+            if pid == os.getpid():
+                continue
+            if not pid_alive(pid):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        """
+        :return: every metric in the Prometheus text exposition format
+        """
+        merged = {}
+        for snapshot in self._process_snapshots():
+            for name, samples in snapshot.items():
+                target = merged.setdefault(name, {})
+                for labels, state in samples:
+                    key = tuple(tuple(label) for label in labels)
+                    if isinstance(state, dict):
+                        current = target.get(key)
+                        if current is None:
+                            target[key] = {"counts": list(state["counts"]), "sum": state["sum"]}
+                        else:
+                            current["counts"] = [a + b for a, b in zip(current["counts"], state["counts"])]
+                            current["sum"] += state["sum"]
+                    else:
+                        target[key] = target.get(key, 0.0) + state
+
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, state in sorted(merged.get(metric.name, {}).items()):
+                if metric.kind == "histogram":
+                    cumulative = 0
+                    bounds = list(metric.upper_bounds) + [float("inf")]
+                    for bound, count in zip(bounds, state["counts"]):
+                        cumulative += count
+                        bucket_labels = labels + (("le", _format_value(float(bound))),)
+                        lines.append(f"{metric.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                    lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_value(state['sum'])}")
+                    lines.append(f"{metric.name}_count{_format_labels(labels)} {cumulative}")
+                else:
+                    lines.append(f"{metric.name}{_format_labels(labels)} {_format_value(state)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter(
+    "securify_http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = registry.histogram(
+    "securify_http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_REQUESTS_IN_PROGRESS = registry.gauge(
+    "securify_http_requests_in_progress", "HTTP requests being handled")
+TERRAFORM_PHASE_DURATION = registry.histogram(
+    "securify_terraform_phase_duration_seconds", "Duration of Terraform commands", ("phase", "result"))
+PROXMOX_REQUESTS = registry.counter(
+    "securify_proxmox_requests_total", "Proxmox API calls", ("method", "status"))
+PROXMOX_REQUEST_DURATION = registry.histogram(
+    "securify_proxmox_request_duration_seconds", "Proxmox API call latency", ("method",))
+LDAP_BINDS = registry.counter(
+    "securify_ldap_binds_total", "LDAP bind attempts", ("result",))
+LDAP_BIND_DURATION = registry.histogram(
+    "securify_ldap_bind_duration_seconds", "LDAP bind latency, cached binds excluded")
+SFTP_SESSIONS_OPENED = registry.counter(
+    "securify_sftp_sessions_opened_total", "SFTP sessions opened", ("result",))
+SFTP_CHECKOUTS = registry.counter(
+    "securify_sftp_checkouts_total", "SFTP sessions borrowed from the pool", ("result",))
+SFTP_POOL_SESSIONS = registry.gauge(
+    "securify_sftp_pool_sessions", "SFTP sessions of the pool", ("state",))
+SFTP_CHECKOUT_WAIT = registry.histogram(
+    "securify_sftp_checkout_wait_seconds", "Time spent waiting for a pooled SFTP session")
+CACHE_REQUESTS = registry.counter(
+    "securify_cache_requests_total", "Cache lookups", ("cache", "result"))
+INFLIGHT_OPERATIONS = registry.gauge(
+    "securify_inflight_operations", "Long-running operations in progress", ("name",))
+QUEUE_DEPTH = registry.gauge(
+    "securify_queue_depth", "Tasks waiting in background queues", ("queue",))
+CONCURRENCY_LIMIT = registry.gauge(
+    "securify_concurrency_limit", "Current adaptive concurrency limit", ("limiter",))
+CONCURRENCY_IN_USE = registry.gauge(
+    "securify_concurrency_in_use", "Calls holding an adaptive concurrency slot", ("limiter",))
+CONCURRENCY_WAIT = registry.histogram(
+    "securify_concurrency_wait_seconds", "Time spent waiting for an adaptive concurrency slot", ("limiter",))
@@ -0,0 +1,211 @@
+"""
+Scheduler of the operations run in Terraform workspaces: strictly one after
+the other on the same workspace, in parallel up to a limit across workspaces
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from infrastructure.data.metrics import QUEUE_DEPTH
+from infrastructure.data.shared_state import atomic_write_json, file_lock, pid_alive
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class OperationScheduler:
+    """
+    Each workspace has a FIFO queue, drained by one thread of a pool of
+    max_parallel threads, so a workspace never runs two operations at once.
+    Operations also hold a per-workspace file lock, which serializes them
+    with the other worker processes, and one of max_parallel slot files,
+    which caps the operations running on the whole server. Their states live in a shared JSON file
+    so that any worker can report the queue.
+    """
+
+    def __init__(self, state_file, lock_dir, max_parallel=4, keep_finished=100):
+        self.state_file = state_file
+        self.lock_dir = lock_dir
+        self.max_parallel = max_parallel
+        self.keep_finished = keep_finished
+        self.executor = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="operation")
+        self.queues = {}  # workspace -> deque of (operation id, function, future), for workspaces being drained
+        self.lock = threading.Lock()
+        os.makedirs(lock_dir, exist_ok=True)
+        QUEUE_DEPTH.labels("operations").set_function(
+            lambda: sum(len(queue) for queue in list(self.queues.values()))
+        )
+
+    def submit(self, workspace, kind, function, target=None):
+        """
+        Queue function to run in the workspace after the operations already queued there
+        :param kind: "deploy", "update", "destroy"...
+        :param target: machine or pack the operation was requested for
+        :return: (operation id, Future of the function's result)
+        """
+        operation_id = uuid.uuid4().hex
+        future = Future()
+        with file_lock(self.state_file):
+            state = self._load()
+            state[operation_id] = {
+                "workspace": workspace,
+                "kind": kind,
+                "target": target,
+                "status": "queued",
+                "pid": os.getpid(),
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None
+            }
+            self._prune(state)
+            atomic_write_json(self.state_file, state)
+
+        with self.lock:
+            queue = self.queues.get(workspace)
+            start_drain = queue is None
+            if start_drain:
+                queue = self.queues[workspace] = deque()
+            queue.append((operation_id, function, future))
+        if start_drain:
+            self.executor.submit(self._drain, workspace)
+        return operation_id, future
+
+    def run(self, workspace, kind, function, target=None):
+        """
+        Queue function and wait for its result
+        """
+        _, future = self.submit(workspace, kind, function, target)
+        return future.result()
+
+    def get(self, operation_id):
+        """
+        :return: the operation with its queue position, None if unknown
+        """
+        state = self._load()
+        if operation_id not in state:
+            return None
+        return self._public(operation_id, state)
+
+    def list_operations(self, workspace=None, active_only=False):
+        """
+        :return: operations, oldest first, with the queue position of the active ones
+        """
+        state = self._load()
+        operations = [self._public(operation_id, state) for operation_id, operation in state.items()
+                      if (workspace is None or operation["workspace"] == workspace)
+                      and (not active_only or operation["status"] in ACTIVE_STATUSES)]
+        return sorted(operations, key=lambda operation: operation["created_at"])
+
+    def _drain(self, workspace):
+        """
+        Run the queued operations of a workspace until its queue is empty.
+        Every future gets resolved, whatever fails around its operation.
+        """
+        while True:
+            with self.lock:
+                queue = self.queues[workspace]
+                if not queue:
+                    del self.queues[workspace]
+                    return
+                operation_id, function, future = queue.popleft()
+            try:
+                with file_lock(os.path.join(self.lock_dir, workspace)), self._server_slot():
+                    self._update_quietly(operation_id, status="running", started_at=time.time())
+                    result = function()
+            except Exception as e:
+                logging.error(f"Operation {operation_id} on {workspace} failed: {e}")
+                self._update_quietly(operation_id, status="error", message=str(e), finished_at=time.time())
+                future.set_exception(e)
+                continue
+            except BaseException:
+                # The drain thread is going away: fail what it will never run
+                with self.lock:
+                    pending = self.queues.pop(workspace, deque())
+                future.set_exception(RuntimeError("Operation interrupted"))
+                for _, _, pending_future in pending:
+                    pending_future.set_exception(RuntimeError("Operation interrupted"))
+                raise
+            success = not isinstance(result, dict) or result.get("success", True)
+            self._update_quietly(operation_id, status="done" if success else "error",
+                                 message=result.get("message") if isinstance(result, dict) else None,
+                                 finished_at=time.time())
+            future.set_result(result)
+
+    @contextmanager
+    def _server_slot(self, poll=0.5):
+        """
+        Hold one of the max_parallel slot files shared by every worker process,
+        waiting while all of them are held
+        """
+        while True:
+            for index in range(self.max_parallel):
+                slot_file = open(os.path.join(self.lock_dir, f".slot-{index}"), "a")
+                try:
+                    fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    slot_file.close()
+                    continue
+                try:
+                    yield
+                finally:
+                    fcntl.flock(slot_file, fcntl.LOCK_UN)
+                    slot_file.close()
+                return
+            time.sleep(poll)
+
+    def _update_quietly(self, operation_id, **fields):
+        """Record an operation's state, a failure to do so must not stop the queue"""
+        try:
+            self._update(operation_id, **fields)
+        except Exception as e:
+            logging.error(f"Could not record the state of operation {operation_id}: {e}")
+
+    def _update(self, operation_id, **fields):
+        with file_lock(self.state_file):
+            state = self._load()
+            if operation_id in state:
+                state[operation_id].update(fields)
+                atomic_write_json(self.state_file, state)
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file, 'r') as f:
+            state = json.load(f)
+        # Operations of a worker that died will never run
+        for operation in state.values():
+            if operation["status"] in ACTIVE_STATUSES and not pid_alive(operation["pid"]):
+                operation["status"] = "error"
+                operation["message"] = "Operation interrupted"
+        return state
+
+    def _prune(self, state):
+        """Forget the oldest finished operations beyond keep_finished"""
+        finished = sorted((operation["created_at"], operation_id) for operation_id, operation in state.items()
+                          if operation["status"] not in ACTIVE_STATUSES)
+        for _, operation_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del state[operation_id]
+
+    @staticmethod
+    def _public(operation_id, state):
+        """
+        Operation without its pid, with its position in the workspace queue:
+        0 is running or next to run, n has n operations to wait for
+        """
+        operation = state[operation_id]
+        public = {key: value for key, value in operation.items() if key != "pid"}
+        public["id"] = operation_id
+        if operation["status"] in ACTIVE_STATUSES:
+            public["position"] = sum(
+                1 for other in state.values()
+                if other["workspace"] == operation["workspace"] and other["status"] in ACTIVE_STATUSES
+                and other["created_at"] < operation["created_at"]
+            )
+        return public
@@ -0,0 +1,127 @@
+"""
+Long-lived Proxmox API client shared by the services
+"""
+
+import re
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from proxmoxer import ProxmoxAPI
+from requests.adapters import HTTPAdapter
+
+from infrastructure.data.adaptive_limiter import proxmox_limiter
+from infrastructure.data.metrics import PROXMOX_REQUESTS, PROXMOX_REQUEST_DURATION
+
+# Proxmox usually runs with a self-signed certificate
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def _record_response(response, *args, **kwargs):
+    """
+    requests response hook counting every Proxmox API call
+    """
+    method = response.request.method
+    PROXMOX_REQUESTS.labels(method, response.status_code).inc()
+    PROXMOX_REQUEST_DURATION.labels(method).observe(response.elapsed.total_seconds())
+
+
+class LimitedAdapter(HTTPAdapter):
+    """
+    Transport adapter sending every Proxmox call through the shared adaptive concurrency limit.
+    Timeouts, connection errors and 429/502/503/504 answers lower the limit.
+    """
+
+    OVERLOAD_STATUSES = (429, 502, 503, 504)
+
+    def send(self, request, **kwargs):
+        # Latency is compared between calls of the same method and path, VMIDs aside
+        kind = f"{request.method} {re.sub(r'/[0-9]+', '/#', urlsplit(request.url).path)}"
+        with proxmox_limiter.slot(kind) as permit:
+            response = super().send(request, **kwargs)
+            if response.status_code in self.OVERLOAD_STATUSES:
+                permit.drop()
+            return response
+
+
+class ProxmoxClient:
+    """
+    Proxmox API access with a persistent HTTP session.
+    The proxmoxer client is rebuilt only when the Proxmox settings change.
+    """
+
+    def __init__(self, config_manager, timeout=10):
+        self.config_manager = config_manager
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.hooks["response"].append(_record_response)
+        self.session.mount("https://", LimitedAdapter())
+        self._api = None
+        self._api_version = None
+
+    @property
+    def credentials(self):
+        """
+        :return: ProxmoxCredentials, raises ValueError if not configured
+        """
+        return self.config_manager.proxmox
+
+    @property
+    def node(self):
+        """
+        :return: configured default node
+        """
+        return self.credentials.node
+
+    @property
+    def api(self):
+        """
+        :return: proxmoxer client for the current credentials
+        """
+        version = self.config_manager.section_version('proxmox')
+        if self._api is None or self._api_version != version:
+            credentials = self.credentials
+            self._api = ProxmoxAPI(
+                credentials.server,
+                port=credentials.port,
+                user=credentials.user_realm,
+                token_name=credentials.token_name,
+                token_value=credentials.token_value,
+                verify_ssl=False
+            )
+            self._api._store["session"].hooks["response"].append(_record_response)
+            self._api._store["session"].mount("https://", LimitedAdapter())
+            self._api_version = version
+        return self._api
+
+    def request(self, method, path, timeout=None, **kwargs):
+        """
+        Raw API request on the shared session
+        :param path: API path below /api2/json, e.g. "/nodes"
+        :return: requests.Response
+        """
+        credentials = self.credentials
+        # Passed per request: REQUESTS_CA_BUNDLE would otherwise override session.verify
+        kwargs.setdefault("verify", self.session.verify)
+        try:
+            return self.session.request(
+                method,
+                f"{credentials.base_url}{path}",
+                headers=credentials.auth_headers,
+                timeout=timeout or self.timeout,
+                **kwargs
+            )
+        except requests.RequestException:
+            # Answered calls are counted by the response hook
+            PROXMOX_REQUESTS.labels(method.upper(), "error").inc()
+            raise
+
+    def get(self, path, **params):
+        """
+        GET an API path
+        :return: the "data" member of the response
+        """
+        response = self.request("GET", path, params=params or None)
+        response.raise_for_status()
+        return response.json().get("data")
@@ -0,0 +1,110 @@
+"""
+Production WSGI server: gunicorn with threaded workers, startup hooks and
+a graceful shutdown that drains running Terraform operations
+"""
+
+import fcntl
+import logging
+import threading
+
+from gunicorn.app.base import BaseApplication
+from werkzeug.serving import make_server
+
+from infrastructure.data.inflight import inflight_operations
+
+WORKER_STARTUP_HOOKS = []
+
+
+def on_worker_start(func):
+    """
+    Register a function to run once in every worker process at startup
+    (background threads must be started after the fork, not at import)
+    """
+    WORKER_STARTUP_HOOKS.append(func)
+    return func
+
+
+def run_startup_hooks():
+    """
+    Run every registered startup hook of this process
+    """
+    for hook in WORKER_STARTUP_HOOKS:
+        try:
+            hook()
+        except Exception as e:
+            logging.error(f"Startup hook {hook.__name__} failed: {e}", exc_info=True)
+
+
+def _post_fork(server, worker):
+    run_startup_hooks()
+
+
+def _worker_exit(server, worker):
+    pending = inflight_operations.count()
+    if pending:
+        logging.info(f"Worker {worker.pid} waiting for {pending} running operations")
+    if not inflight_operations.wait_idle(timeout=server.cfg.graceful_timeout):
+        logging.warning(f"Worker {worker.pid} exiting with operations still running")
+
+
+class DedicatedListener:
+    """
+    Serve a WSGI app on its own address, with its own threads, from one
+    worker process at a time: the workers wait on a file lock and the one
+    holding it binds the port, another one takes over if it exits. Requests
+    to this app are never stuck behind the worker threads of the main app.
+    """
+
+    def __init__(self, app, host, port, lock_path):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.lock_path = lock_path
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._serve, name=f"listener-{self.port}", daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        # Kept open for the life of the process, closing it would release the lock
+        lock_file = open(self.lock_path, "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            server = make_server(self.host, self.port, self.app, threaded=True)
+        except OSError as e:
+            logging.error(f"Could not listen on {self.host}:{self.port}: {e}")
+            lock_file.close()
+            return
+        logging.info(f"This worker now serves {self.host}:{self.port}")
+        server.serve_forever()
+
+
+class ProductionServer(BaseApplication):
+    """
+    Run the Flask app under gunicorn, configured from code
+    """
+
+    def __init__(self, app, host="0.0.0.0", port=5000, workers=4, threads=8,
+                 graceful_timeout=900, timeout=120):
+        self.application = app
+        self.options = {
+            "bind": f"{host}:{port}",
+            "workers": workers,
+            "threads": threads,
+            "worker_class": "gthread",
+            "graceful_timeout": graceful_timeout,
+            "timeout": timeout,
+            "post_fork": _post_fork,
+            "worker_exit": _worker_exit,
+        }
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
@@ -0,0 +1,71 @@
+"""
+Typed views over the configuration, parsed once per configuration version
+"""
+
+from typing import NamedTuple, Optional
+
+
+class ProxmoxCredentials(NamedTuple):
+    """
+    Proxmox connection settings with the API token already split
+    (``user@realm!token_name=token_value``)
+    """
+    server: str
+    node: str
+    user: str
+    realm: str
+    token_name: str
+    token_value: str
+    port: int = 8006
+
+    @classmethod
+    def parse(cls, server, node, api_token, port=8006):
+        """
+        :return: ProxmoxCredentials built from the raw PVEAPITOKEN string
+        :raise ValueError: if a setting is missing or the token is malformed
+        """
+        if not all([server, node, api_token]):
+            raise ValueError("Missing Proxmox configuration")
+        try:
+            user_realm, token_rest = api_token.split("!", 1)
+            token_name, token_value = token_rest.split("=", 1)
+            user, realm = user_realm.rsplit("@", 1)
+        except ValueError:
+            raise ValueError("Invalid Proxmox token format, expected user@realm!tokenid=secret")
+        return cls(server, node, user, realm, token_name, token_value, int(port))
+
+    @property
+    def user_realm(self):
+        """user@realm"""
+        return f"{self.user}@{self.realm}"
+
+    @property
+    def token_id(self):
+        """user@realm!token_name"""
+        return f"{self.user_realm}!{self.token_name}"
+
+    @property
+    def api_token(self):
+        """Full token, as expected by the Terraform provider"""
+        return f"{self.token_id}={self.token_value}"
+
+    @property
+    def auth_headers(self):
+        """Headers for a raw Proxmox API request"""
+        return {"Authorization": f"PVEAPIToken={self.api_token}"}
+
+    @property
+    def base_url(self):
+        """Root of the Proxmox JSON API"""
+        return f"https://{self.server}:{self.port}/api2/json"
+
+
+class LdapSettings(NamedTuple):
+    """
+    LDAPS settings used by the login route
+    """
+    server: Optional[str]
+    port: int
+    cert: Optional[str]
+    base_dn: Optional[str]
+    user_ou: str
@@ -1,16 +1,28 @@
 import paramiko
 import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
 from stat import S_ISDIR
 
-def connect_sftp():
+from infrastructure.data.metrics import SFTP_CHECKOUTS, SFTP_CHECKOUT_WAIT, SFTP_SESSIONS_OPENED, SFTP_POOL_SESSIONS
+
+def connect_sftp(keepalive=0):
     host = os.getenv("SFTP_HOST")
     port = int(os.getenv("SFTP_PORT", 22))
     username = os.getenv("SFTP_USER")
     password = os.getenv("SFTP_PASS")
 
     transport = paramiko.Transport((host, port))
-    transport.connect(username=username, password=password)
-    return paramiko.SFTPClient.from_transport(transport)
+    try:
+        transport.connect(username=username, password=password)
+        if keepalive:
+            transport.set_keepalive(keepalive)
+        return paramiko.SFTPClient.from_transport(transport)
+    except Exception:
+        transport.close()
+        raise
 
 def is_directory(sftp, path):
     try:
@@ -19,3 +31,116 @@ def is_directory(sftp, path):
         return False
 
 
+class SftpPool:
+    """
+    Bounded pool of SFTP sessions, so that requests reuse an authenticated
+    SSH transport instead of paying a key exchange each time
+    """
+
+    def __init__(self, max_size=4, idle_timeout=300, keepalive=30,
+                 checkout_timeout=30, health_check_after=15, connect=connect_sftp):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.connect = connect
+        self.idle = []  # (sftp, last_used) pairs, most recently used last
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.lock = threading.Lock()
+        SFTP_POOL_SESSIONS.labels("idle").set_function(lambda: len(self.idle))
+
+    @contextmanager
+    def session(self):
+        """
+        Borrow a session for the duration of the block.
+        The session goes back to the pool unless its transport died.
+        """
+        started = time.perf_counter()
+        acquired = self.slots.acquire(timeout=self.checkout_timeout)
+        SFTP_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+        if not acquired:
+            SFTP_CHECKOUTS.labels("timeout").inc()
+            raise TimeoutError("No SFTP session available")
+        sftp = None
+        SFTP_POOL_SESSIONS.labels("in_use").inc()
+        try:
+            sftp = self._checkout()
+            yield sftp
+        finally:
+            if sftp is not None:
+                self._checkin(sftp)
+            SFTP_POOL_SESSIONS.labels("in_use").dec()
+            self.slots.release()
+
+    def _checkout(self):
+        self._evict_idle()
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                sftp, last_used = self.idle.pop()
+            if self._is_healthy(sftp, last_used):
+                SFTP_CHECKOUTS.labels("reused").inc()
+                return sftp
+            self._close(sftp)
+        logging.info("Opening a new SFTP session")
+        try:
+            sftp = self.connect(keepalive=self.keepalive)
+        except Exception:
+            SFTP_SESSIONS_OPENED.labels("error").inc()
+            raise
+        SFTP_SESSIONS_OPENED.labels("success").inc()
+        SFTP_CHECKOUTS.labels("opened").inc()
+        return sftp
+
+    def _checkin(self, sftp):
+        if not sftp.get_channel().get_transport().is_active():
+            self._close(sftp)
+            return
+        try:
+            # Sessions are shared, do not leak the working directory
+            sftp.chdir(None)
+        except Exception:
+            self._close(sftp)
+            return
+        with self.lock:
+            self.idle.append((sftp, time.monotonic()))
+
+    def _is_healthy(self, sftp, last_used):
+        if not sftp.get_channel().get_transport().is_active():
+            return False
+        if time.monotonic() - last_used < self.health_check_after:
+            return True
+        try:
+            sftp.normalize(".")
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [sftp for sftp, last_used in self.idle if now - last_used > self.idle_timeout]
+            self.idle = [(sftp, last_used) for sftp, last_used in self.idle
+                         if now - last_used <= self.idle_timeout]
+        for sftp in expired:
+            self._close(sftp)
+
+    @staticmethod
+    def _close(sftp):
+        try:
+            transport = sftp.get_channel().get_transport()
+            sftp.close()
+            transport.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """
+        Close every idle session
+        """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for sftp, _ in idle:
+            self._close(sftp)
@@ -0,0 +1,64 @@
+"""
+Helpers to share state files safely between threads and worker processes
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive advisory lock tied to a file, held across processes.
+    The lock lives in a sibling ``.lock`` file so the data file itself
+    can be replaced atomically while the lock is held.
+    """
+    lock_path = f"{path}.lock"
+    with open(lock_path, "a", encoding="utf-8") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def atomic_write_bytes(path, data):
+    """
+    Write a file through a temporary file and a rename, so readers see
+    either the old or the new content, never a truncated file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path, data, indent=2):
+    """
+    Serialize data as JSON and write it atomically
+    """
+    atomic_write_bytes(path, json.dumps(data, indent=indent).encode("utf-8"))
+
+
+def pid_alive(pid):
+    """
+    True while a process of that pid exists, used to spot the state left by a worker that died
+    """
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
@@ -0,0 +1,176 @@
+"""
+Terraform HTTP state backend storage: state versions and locks of every
+workspace in one SQLite database shared by the worker processes
+"""
+
+import json
+import sqlite3
+import time
+import zlib
+from contextlib import closing, contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS states (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    workspace TEXT NOT NULL,
+    serial INTEGER,
+    lineage TEXT,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS states_workspace ON states (workspace, id);
+CREATE TABLE IF NOT EXISTS locks (
+    workspace TEXT PRIMARY KEY,
+    lock_id TEXT NOT NULL,
+    info TEXT NOT NULL,
+    locked_at REAL NOT NULL
+);
+"""
+
+
+class StateLockError(Exception):
+    """
+    Raised when a workspace is locked by another operation, carries the current lock info
+    """
+
+    def __init__(self, info):
+        super().__init__(f"State locked by {info.get('ID')}")
+        self.info = info
+
+
+class TerraformStateStore:
+    """
+    Compressed state versions, the newest one served to Terraform, and one
+    lock per workspace. Every call opens its own connection, which keeps the
+    store usable from any thread and after a fork.
+    """
+
+    def __init__(self, path, url=None, keep_versions=10, lock_ttl=3600):
+        """
+        :param url: base address Terraform reaches the backend routes at, None keeps local state files
+        :param keep_versions: state versions kept per workspace
+        :param lock_ttl: seconds after which a lock is considered abandoned and can be taken over
+        """
+        self.path = path
+        self.url = url.rstrip("/") if url else None
+        self.keep_versions = keep_versions
+        self.lock_ttl = lock_ttl
+        self.initialized = False
+
+    @contextmanager
+    def _connect(self):
+        with closing(sqlite3.connect(self.path, timeout=30, isolation_level=None)) as connection:
+            if not self.initialized:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(SCHEMA)
+                self.initialized = True
+            yield connection
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Write transaction, taken up front so concurrent workers queue instead of failing on upgrade
+        """
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def get(self, workspace):
+        """
+        :return: latest state of the workspace as bytes, None if it has none
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT data FROM states WHERE workspace = ? ORDER BY id DESC LIMIT 1", (workspace,)
+            ).fetchone()
+        return zlib.decompress(row[0]) if row else None
+
+    def put(self, workspace, data, lock_id=None):
+        """
+        Store a new state version, raises StateLockError unless the workspace is unlocked or locked by lock_id
+        """
+        try:
+            state = json.loads(data)
+            serial, lineage = state.get("serial"), state.get("lineage")
+        except ValueError:
+            serial, lineage = None, None
+        compressed = zlib.compress(data, 6)
+        with self._transaction() as connection:
+            current = self._current_lock(connection, workspace)
+            if current and current["ID"] != lock_id:
+                raise StateLockError(current)
+            connection.execute(
+                "INSERT INTO states (workspace, serial, lineage, size, data, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (workspace, serial, lineage, len(data), compressed, time.time())
+            )
+            connection.execute(
+                "DELETE FROM states WHERE workspace = ? AND id NOT IN "
+                "(SELECT id FROM states WHERE workspace = ? ORDER BY id DESC LIMIT ?)",
+                (workspace, workspace, self.keep_versions)
+            )
+
+    def lock(self, workspace, info):
+        """
+        Take the workspace lock described by Terraform's lock info, raises StateLockError if already held
+        """
+        with self._transaction() as connection:
+            current = self._current_lock(connection, workspace)
+            if current and current["ID"] != info.get("ID"):
+                raise StateLockError(current)
+            connection.execute(
+                "INSERT OR REPLACE INTO locks (workspace, lock_id, info, locked_at) VALUES (?, ?, ?, ?)",
+                (workspace, info.get("ID", ""), json.dumps(info), time.time())
+            )
+
+    def unlock(self, workspace, lock_id):
+        """
+        Release the workspace lock, raises StateLockError if it is held under another ID.
+        terraform force-unlock sends no lock info: lock_id None releases whoever holds it.
+        """
+        with self._transaction() as connection:
+            current = self._current_lock(connection, workspace)
+            if current and lock_id is not None and current["ID"] != lock_id:
+                raise StateLockError(current)
+            connection.execute("DELETE FROM locks WHERE workspace = ?", (workspace,))
+
+    def delete(self, workspace):
+        """
+        Forget every state version and the lock of a workspace
+        """
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM states WHERE workspace = ?", (workspace,))
+            connection.execute("DELETE FROM locks WHERE workspace = ?", (workspace,))
+
+    def _current_lock(self, connection, workspace):
+        """
+        :return: lock info holding the workspace, None if unlocked or abandoned for longer than lock_ttl
+        """
+        row = connection.execute(
+            "SELECT info, locked_at FROM locks WHERE workspace = ?", (workspace,)
+        ).fetchone()
+        if row is None or (self.lock_ttl and time.time() - row[1] > self.lock_ttl):
+            return None
+        return json.loads(row[0])
+
+    def backend_config(self, workspace):
+        """
+        :return: backend.tf content pointing a workspace at this backend, None when it is disabled
+        """
+        if not self.url:
+            return None
+        address = f"{self.url}/{workspace}"
+        return (
+            'terraform {\n'
+            '  backend "http" {\n'
+            f'    address        = "{address}"\n'
+            f'    lock_address   = "{address}"\n'
+            f'    unlock_address = "{address}"\n'
+            '  }\n'
+            '}\n'
+        )
@@ -0,0 +1,114 @@
+"""
+Persistent history of Terraform runs, one JSON line per deployment, update
+or destroy, with the duration of every phase
+"""
+
+import json
+import math
+import os
+import re
+import time
+
+from infrastructure.data.shared_state import file_lock
+
+RESOURCE_PATTERNS = (
+    re.compile(r'Resources: (?P<add>\d+) added, (?P<change>\d+) changed, (?P<destroy>\d+) destroyed'),
+    re.compile(r'Plan: (?P<add>\d+) to add, (?P<change>\d+) to change, (?P<destroy>\d+) to destroy'),
+    re.compile(r'Resources: (?P<destroy>\d+) destroyed'),
+)
+PERCENTILES = (50, 90, 95, 99)
+
+
+def parse_resource_counts(output):
+    """
+    :return: dict add/change/destroy from a plan, apply or destroy output, None if absent
+    """
+    for pattern in RESOURCE_PATTERNS:
+        match = pattern.search(output or "")
+        if match:
+            counts = {"add": 0, "change": 0, "destroy": 0}
+            counts.update({key: int(value) for key, value in match.groupdict().items()})
+            return counts
+    return None
+
+
+def percentile(sorted_values, rank):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    index = max(0, min(len(sorted_values), math.ceil(rank / 100 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+class TerraformHistory:
+    """
+    Append-only JSON lines file, rotated once it exceeds max_bytes
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def record(self, entry):
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with file_lock(self.path):
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line)
+
+    def entries(self, since=0, until=None, operation=None):
+        """
+        :return: recorded runs started in [since, until], oldest first
+        """
+        until = until or time.time()
+        entries = []
+        for path in (f"{self.path}.1", self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # line cut by a crash
+                    if since <= entry.get("started_at", 0) <= until and \
+                            (operation is None or entry.get("operation") == operation):
+                        entries.append(entry)
+        return entries
+
+    def stats(self, since=0, until=None, group_by=("template_type", "phase"), operation=None):
+        """
+        Duration percentiles per group, "total" being the whole run as a phase
+        :return: list of dict with the group attributes, count, success_rate, mean, max and pXX
+        """
+        groups = {}
+        for entry in self.entries(since, until, operation):
+            phases = entry.get("phases", []) + [{
+                "phase": "total",
+                "seconds": entry.get("total_seconds"),
+                "exit_code": 0 if entry.get("success") else 1
+            }]
+            for phase in phases:
+                if phase.get("seconds") is None:
+                    continue
+                attributes = dict(entry, phase=phase["phase"])
+                key = tuple(str(attributes.get(name)) for name in group_by)
+                group = groups.setdefault(key, {"durations": [], "succeeded": 0})
+                group["durations"].append(phase["seconds"])
+                group["succeeded"] += phase.get("exit_code") == 0
+
+        stats = []
+        for key, group in sorted(groups.items()):
+            durations = sorted(group["durations"])
+            item = dict(zip(group_by, key))
+            item.update({
+                "count": len(durations),
+                "success_rate": round(group["succeeded"] / len(durations), 3),
+                "mean": round(sum(durations) / len(durations), 3),
+                "max": round(durations[-1], 3),
+            })
+            for rank in PERCENTILES:
+                item[f"p{rank}"] = round(percentile(durations, rank), 3)
+            stats.append(item)
+        return stats
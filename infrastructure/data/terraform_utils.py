@@ -1,5 +1,45 @@
 import subprocess
 import os
+import re
+import time
+from infrastructure.data.adaptive_limiter import terraform_limiter
+from infrastructure.data.inflight import inflight_operations
+from infrastructure.data.metrics import TERRAFORM_PHASE_DURATION
+
+# Failures that mean Proxmox is overloaded, not that the configuration is wrong
+OVERLOAD_ERRORS = re.compile(
+    r'timeout|timed out|deadline exceeded|50[234] |connection (?:refused|reset)|too many', re.IGNORECASE
+)
+
+
+def run_terraform_phase(phase, args, cwd, timeout=None, timings=None, workload=None):
+    """
+    Run one terraform command, within the adaptive Terraform concurrency limit, and record its duration
+    :param timings: optional list receiving {"phase", "seconds", "exit_code"} for the run history
+    :param workload: template type of the workspace; the limiter compares a run's latency with the
+                     runs of the same phase and workload, a Windows apply is not slow next to an LXC one
+    :return: subprocess.CompletedProcess, raises subprocess.TimeoutExpired
+    """
+    started = time.perf_counter()
+    result = "error"
+    exit_code = None
+    try:
+        with terraform_limiter.slot(f"{phase}:{workload}" if workload else phase) as permit:
+            completed = subprocess.run(['terraform', *args], cwd=cwd, capture_output=True, text=True,
+                                       timeout=timeout)
+            if completed.returncode == 1 and OVERLOAD_ERRORS.search(completed.stderr or ""):
+                permit.drop()
+        exit_code = completed.returncode
+        result = "success" if completed.returncode == 0 else "error"
+        return completed
+    except subprocess.TimeoutExpired:
+        result = "timeout"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        TERRAFORM_PHASE_DURATION.labels(phase, result).observe(elapsed)
+        if timings is not None:
+            timings.append({"phase": phase, "seconds": round(elapsed, 3), "exit_code": exit_code})
 
 
 def write_tfvars(path):
@@ -26,18 +66,28 @@ ssh-certificat-path = "{os.getenv('SSH_CERT_PATH', '~/.ssh/id_rsa')}"
         f.write(tfvars)
 
 
-def execute_terraform(path):
+def execute_terraform(path, run_init=True, on_phase=None):
+    """
+    Init (when needed) and apply the Terraform workspace at path.
+    on_phase, if given, is called with "initializing" and "applying" as the run progresses.
+    """
     try:
         write_tfvars(path)
 
-        init = subprocess.run(['terraform', 'init'], cwd=path, capture_output=True, text=True)
-        if init.returncode != 0:
-            return False, init.stderr
+        with inflight_operations.track("terraform"):
+            # An already initialized workspace whose .tf files did not change can skip init
+            if run_init:
+                if on_phase:
+                    on_phase("initializing")
+                init = run_terraform_phase('init', ['init'], path)
+                if init.returncode != 0:
+                    return False, init.stderr
 
-        apply = subprocess.run(['terraform', 'apply', '-auto-approve', '-var-file=terraform.tfvars'], cwd=path,
-                               capture_output=True, text=True)
-        if apply.returncode != 0:
-            return False, apply.stderr
+            if on_phase:
+                on_phase("applying")
+            apply = run_terraform_phase('apply', ['apply', '-auto-approve', '-var-file=terraform.tfvars'], path)
+            if apply.returncode != 0:
+                return False, apply.stderr
 
         return True, apply.stdout
     except Exception as e:
@@ -0,0 +1,277 @@
+"""
+Compact in-memory time series: preallocated ring buffers of 32 bit
+values, one per downsampling tier
+"""
+
+import base64
+import json
+import math
+import os
+import threading
+import time
+from array import array
+
+from infrastructure.data.shared_state import atomic_write_bytes
+
+# (bucket step in seconds, number of buckets): 1h at 10s, 1d at 1min, 7d at 10min, 30d at 1h
+DEFAULT_TIERS = ((10, 360), (60, 1440), (600, 1008), (3600, 720))
+
+
+class Tier:
+    """
+    Ring buffer of bucket averages at a fixed step.
+    Appends are O(1) and the memory is allocated once.
+    """
+
+    def __init__(self, step, capacity, fields):
+        self.step = step
+        self.capacity = capacity
+        self.fields = fields
+        self.times = array('I', bytes(4 * capacity))  # bucket start, epoch seconds
+        self.values = [array('f', bytes(4 * capacity)) for _ in fields]
+        self.head = 0  # next slot to write
+        self.count = 0
+        self.bucket = None  # start time of the bucket being filled
+        self.sums = [0.0] * len(fields)
+        self.samples = 0
+
+    def add(self, timestamp, values):
+        bucket = int(timestamp - timestamp % self.step)
+        if self.bucket is not None and bucket < self.bucket:
+            return  # late sample, its bucket is already closed
+        if bucket != self.bucket:
+            self._close_bucket()
+            self.bucket = bucket
+        for index, value in enumerate(values):
+            self.sums[index] += value
+        self.samples += 1
+
+    def _close_bucket(self):
+        if not self.samples:
+            return
+        self.times[self.head] = self.bucket
+        for index, column in enumerate(self.values):
+            column[self.head] = self.sums[index] / self.samples
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.sums = [0.0] * len(self.fields)
+        self.samples = 0
+
+    def covers(self, start, first_at):
+        """
+        Whether the tier still holds data back to start, knowing the series began at first_at
+        """
+        if self.count < self.capacity:
+            return first_at is not None and first_at <= start
+        return self.times[self.head] <= start
+
+    def points(self, start, end):
+        """
+        :return: (time, values) pairs of the buckets overlapping [start, end], the bucket being filled included
+        """
+        start -= self.step
+        for offset in range(self.count):
+            slot = (self.head - self.count + offset) % self.capacity
+            timestamp = self.times[slot]
+            if start < timestamp <= end:
+                yield timestamp, [column[slot] for column in self.values]
+        if self.samples and start < self.bucket <= end:
+            yield self.bucket, [total / self.samples for total in self.sums]
+
+    def _ordered(self, column):
+        """Filled slots of a column, oldest first"""
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            return column[start:start + self.count]
+        return column[start:] + column[:self.head]
+
+    def to_dict(self):
+        return {
+            "step": self.step,
+            "capacity": self.capacity,
+            "bucket": self.bucket,
+            "sums": self.sums,
+            "samples": self.samples,
+            "times": base64.b64encode(self._ordered(self.times).tobytes()).decode(),
+            "values": [base64.b64encode(self._ordered(column).tobytes()).decode() for column in self.values],
+        }
+
+    @classmethod
+    def from_dict(cls, data, fields):
+        tier = cls(data["step"], data["capacity"], fields)
+        times = array('I', base64.b64decode(data["times"]))
+        tier.count = len(times)
+        tier.head = tier.count % tier.capacity
+        tier.times[:tier.count] = times
+        for column, encoded in zip(tier.values, data["values"]):
+            column[:tier.count] = array('f', base64.b64decode(encoded))
+        tier.bucket = data["bucket"]
+        tier.sums = data["sums"]
+        tier.samples = data["samples"]
+        return tier
+
+
+class Series:
+    """
+    Metrics of one entity (a node or a guest), fed to every tier at once
+    """
+
+    def __init__(self, fields, tiers=DEFAULT_TIERS):
+        self.fields = tuple(fields)
+        self.tiers = [Tier(step, capacity, self.fields) for step, capacity in tiers]
+        self.first_at = None
+        self.updated_at = 0
+
+    def add(self, timestamp, sample):
+        values = [float(sample.get(field) or 0) for field in self.fields]
+        for tier in self.tiers:
+            tier.add(timestamp, values)
+        if self.first_at is None:
+            self.first_at = timestamp
+        self.updated_at = max(self.updated_at, timestamp)
+
+    def query(self, start, end, step=None, max_points=1000):
+        """
+        Points between start and end, read from the coarsest tier that is
+        still fine enough for step and holds data back to start
+        (or the finest one holding data back to start, rebucketed to step)
+        """
+        if step is None:
+            step = max(1, (end - start) / max_points)
+        covering = [tier for tier in self.tiers if tier.covers(start, self.first_at)]
+        fine_enough = [tier for tier in covering if tier.step <= step]
+        if fine_enough:
+            tier = fine_enough[-1]
+        elif covering:
+            tier = covering[0]
+        else:
+            # Nothing goes back that far: the finest tier that never wrapped holds the whole history
+            complete = [tier for tier in self.tiers if tier.count < tier.capacity]
+            tier = complete[0] if complete else self.tiers[-1]
+
+        points = tier.points(start, end)
+        if step > tier.step:
+            points = self._rebucket(points, step)
+        return [dict(zip(self.fields, values), time=int(timestamp)) for timestamp, values in points]
+
+    @staticmethod
+    def _rebucket(points, step):
+        bucket, sums, samples = None, [], 0
+        for timestamp, values in points:
+            start = timestamp - timestamp % step
+            if start != bucket:
+                if samples:
+                    yield bucket, [total / samples for total in sums]
+                bucket, sums, samples = start, [0.0] * len(values), 0
+            for index, value in enumerate(values):
+                sums[index] += value
+            samples += 1
+        if samples:
+            yield bucket, [total / samples for total in sums]
+
+    def to_dict(self):
+        return {
+            "fields": list(self.fields),
+            "first_at": self.first_at,
+            "updated_at": self.updated_at,
+            "tiers": [tier.to_dict() for tier in self.tiers],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        series = cls(data["fields"], tiers=())
+        series.first_at = data["first_at"]
+        series.updated_at = data["updated_at"]
+        series.tiers = [Tier.from_dict(tier, series.fields) for tier in data["tiers"]]
+        return series
+
+
+class TimeSeriesStore:
+    """
+    Named series with a bounded memory footprint, optionally shared with
+    other worker processes through a snapshot file
+    """
+
+    def __init__(self, tiers=DEFAULT_TIERS, snapshot_path=None):
+        self.tiers = tiers
+        self.snapshot_path = snapshot_path
+        self.series = {}
+        self.snapshot_stamp = None
+        self.lock = threading.Lock()
+
+    @property
+    def retention(self):
+        return max(step * capacity for step, capacity in self.tiers)
+
+    def add(self, key, timestamp, sample):
+        """
+        Append a sample (dict of field -> number) to a series, creating it on first use
+        """
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series(sorted(sample), self.tiers)
+            series.add(timestamp, sample)
+
+    def last_time(self, key):
+        with self.lock:
+            series = self.series.get(key)
+            return series.updated_at if series else 0
+
+    def keys(self):
+        with self.lock:
+            return sorted(self.series)
+
+    def query(self, key, start, end, step=None):
+        """
+        :return: list of points, None if the series is unknown
+        """
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                return None
+            return series.query(start, end, step)
+
+    def prune(self, now=None):
+        """
+        Drop the series of entities that stopped reporting longer than the retention ago
+        """
+        horizon = (now or time.time()) - self.retention
+        with self.lock:
+            for key in [key for key, series in self.series.items() if series.updated_at < horizon]:
+                del self.series[key]
+
+    def save(self):
+        with self.lock:
+            data = {key: series.to_dict() for key, series in self.series.items()}
+        atomic_write_bytes(self.snapshot_path, json.dumps(data).encode("utf-8"))
+
+    def load_if_changed(self):
+        """
+        Reload the snapshot written by the collecting process, when it changed
+        """
+        try:
+            stat = os.stat(self.snapshot_path)
+        except (FileNotFoundError, TypeError):
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self.snapshot_stamp:
+            return
+        with open(self.snapshot_path, "rb") as file:
+            data = json.load(file)
+        series = {key: Series.from_dict(value) for key, value in data.items()}
+        with self.lock:
+            self.series = series
+            self.snapshot_stamp = stamp
+
+
+def parse_time(value, default):
+    """
+    Parse a query bound: epoch seconds, or negative seconds relative to now
+    """
+    if value is None or value == "":
+        return default
+    number = float(value)
+    if math.isnan(number):
+        raise ValueError("Invalid time")
+    return time.time() + number if number < 0 else number
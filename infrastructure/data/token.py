@@ -2,8 +2,18 @@
 This file contain function to generate a token
 """
 
+import base64
+import hashlib
+import hmac
+import json
+import os
 import random
+import secrets
 import string
+import threading
+import time
+
+from infrastructure.data.shared_state import file_lock, atomic_write_json
 
 
 def generate_token(length):
@@ -16,3 +26,160 @@ def generate_token(length):
     characters = string.ascii_letters + string.digits
     random_str = ''.join(random.choice(characters) for _ in range(length))
     return random_str
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class SessionTokenManager:
+    """
+    Issue and verify stateless HMAC-signed session tokens.
+
+    A token is ``<payload>.<signature>`` where the payload carries the user,
+    the session id and the expiry. Verification only needs the signing key,
+    so any worker process can check any token without shared state. The
+    only state kept is the set of revoked session ids, pruned once the
+    session they belong to could no longer be valid anyway. When a
+    revocation file is given, revocations are shared between workers
+    through it.
+    """
+
+    def __init__(self, master_key, ttl=28800, max_age=86400, sliding=False,
+                 revocation_file=None):
+        """
+        :param master_key: MASTER_KEY bytes, the signing key is derived from it
+        :param ttl: lifetime of a single token in seconds
+        :param max_age: absolute lifetime of a session, renewals included
+        :param sliding: renew tokens that are past half of their lifetime
+        :param revocation_file: JSON file shared by every worker process
+        """
+        self.key = hmac.new(master_key, b"securify-session-token", hashlib.sha256).digest()
+        self.ttl = int(ttl)
+        self.max_age = int(max_age)
+        self.sliding = sliding
+        self.revoked = {}
+        self.lock = threading.Lock()
+        self.next_prune = 0
+        self.revocation_file = revocation_file
+        self.revocation_stamp = None
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.key, payload.encode(), hashlib.sha256).digest())
+
+    def _encode(self, claims):
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        return f"{payload}.{self._sign(payload)}"
+
+    def issue(self, user, session_id=None, auth_time=None):
+        """
+        Issue a new token
+        :param user: authenticated user name
+        :param session_id: keep an existing session id (used on renewal)
+        :param auth_time: time of the original login (used on renewal)
+        :return: signed token
+        """
+        now = int(time.time())
+        auth_time = auth_time or now
+        claims = {
+            "sub": user,
+            "sid": session_id or secrets.token_hex(8),
+            "auth": auth_time,
+            "iat": now,
+            "exp": min(now + self.ttl, auth_time + self.max_age),
+        }
+        return self._encode(claims)
+
+    def verify(self, token):
+        """
+        Check signature, expiry and revocation
+        :return: token claims, or None if the token is not valid
+        """
+        if not token or token.count(".") != 1:
+            return None
+        payload, signature = token.split(".")
+        # Compared as bytes: compare_digest refuses str holding non-ASCII characters
+        if not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+        if claims.get("exp", 0) <= time.time():
+            return None
+        if self.is_revoked(claims.get("sid")):
+            return None
+        return claims
+
+    def renew(self, claims):
+        """
+        Sliding renewal: reissue a token once half of its lifetime is spent
+        :return: new token, or None if no renewal is needed
+        """
+        if not self.sliding or not claims:
+            return None
+        if claims["exp"] - time.time() > self.ttl / 2:
+            return None
+        if claims["auth"] + self.max_age <= claims["exp"]:
+            return None
+        return self.issue(claims["sub"], claims["sid"], claims["auth"])
+
+    def revoke(self, claims):
+        """
+        Revoke the whole session a token belongs to
+        """
+        with self.lock:
+            self.revoked[claims["sid"]] = claims["auth"] + self.max_age
+            if self.revocation_file:
+                with file_lock(self.revocation_file):
+                    self._sync_revocations()
+                    self.revoked[claims["sid"]] = claims["auth"] + self.max_age
+                    self.next_prune = 0
+                    self._prune()
+                    atomic_write_json(self.revocation_file, self.revoked)
+                    self.revocation_stamp = self._revocation_stamp()
+            else:
+                self._prune()
+
+    def is_revoked(self, session_id):
+        """
+        :return: bool depend on if the session was revoked
+        """
+        if self.revocation_file and self._revocation_stamp() != self.revocation_stamp:
+            with self.lock:
+                self._sync_revocations()
+        if not self.revoked:
+            return False
+        with self.lock:
+            self._prune()
+            return session_id in self.revoked
+
+    def _revocation_stamp(self):
+        try:
+            stat = os.stat(self.revocation_file)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def _sync_revocations(self):
+        """Merge the revocations written by other workers"""
+        stamp = self._revocation_stamp()
+        if stamp is not None:
+            try:
+                with open(self.revocation_file, "r", encoding="utf-8") as file:
+                    self.revoked.update(json.load(file))
+            except ValueError:
+                pass
+        self.revocation_stamp = stamp
+
+    def _prune(self):
+        """Drop revocations of sessions that have expired on their own"""
+        now = time.time()
+        if now < self.next_prune:
+            return
+        self.revoked = {sid: exp for sid, exp in self.revoked.items() if exp > now}
+        self.next_prune = now + 60
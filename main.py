@@ -7,6 +7,10 @@ import os
 from cryptography.fernet import Fernet
 from dotenv import set_key
 import logging
+import hmac
+import hashlib
+import math
+import time
 
 # --- Argument Parsing must happen BEFORE Flask app initialization ---
 if '--generate-key' in sys.argv:
@@ -24,40 +28,200 @@ if '--generate-key' in sys.argv:
         sys.exit(1)
 
 
-from flask import Flask, request, jsonify, abort, send_file
+from flask import Flask, request, jsonify, abort, send_file, g
 from flask_cors import CORS
 import requests
 import tempfile
 import shutil
-from application.interfaces.controllers.crtl_json import JsonCrtl
+from application.interfaces.controllers.crtl_json import JsonCrtl, CHECKLIST_SCHEMA
 from application.interfaces.controllers.ldaps_controller import LdapsController
 from application.interfaces.presenters.ldaps_presenter import LdapsPresenter
 from infrastructure.data.args import Args
 from infrastructure.data.config_manager import ConfigManager
-from infrastructure.data.token import generate_token
-from infrastructure.data.sftp_utils import connect_sftp, is_directory
-from infrastructure.data.terraform_utils import execute_terraform
+from infrastructure.data.proxmox_client import ProxmoxClient
+from infrastructure.data.document_store import DocumentValidationError
+from infrastructure.data.token import SessionTokenManager
+from infrastructure.data.state_backend import TerraformStateStore, StateLockError
+from infrastructure.data.operation_scheduler import OperationScheduler
+from infrastructure.data.adaptive_limiter import proxmox_limiter, terraform_limiter
+from infrastructure.data.sftp_utils import SftpPool
+from infrastructure.data.server import DedicatedListener, ProductionServer, on_worker_start, run_startup_hooks
+from infrastructure.data.timeseries import TimeSeriesStore, parse_time
+from infrastructure.data.metrics import (
+    registry as metrics_registry, HTTP_REQUESTS, HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_PROGRESS
+)
 from application.services.terraform_service import TerraformService
 from application.services.deployment_service import DeploymentService
 from application.services.deployment_tracking_service import DeploymentTrackingService
+from application.services.cluster_inventory_service import ClusterInventoryService
+from application.services.placement_service import PlacementService
+from application.services.clone_service import CloneModeService
+from application.services.validation_service import CLONE_MODES, OS_VERSIONS_LINUX_SERVER
+from application.services.warm_pool_service import WarmPoolService
+from application.services.validation_service import ValidationService
+from application.services.drift_service import DriftService
 from application.services.health_check_service import HealthCheckService
+from application.services.app_catalog_service import AppCatalogService
+from application.services.logo_cache_service import LogoCacheService
+from application.services.app_sync_service import AppSyncService
+from application.services.app_install_service import AppInstallService
+from application.services.proxmox_metrics_service import ProxmoxMetricsCollector
 
 
 args_checker = Args()
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": ["https://securify-stack.homelab"]}})
+CORS(
+    app,
+    resources={r"/*": {"origins": ["https://securify-stack.homelab"]}},
+    expose_headers=["X-Session-Token"]
+)
 
 config_manager = ConfigManager()
+# Processes serving the app: the concurrency ceilings are for the whole server, each worker gets its share
+SERVER_WORKERS = int(config_manager.get('BACKEND_WORKERS', 4)) if '--production' in sys.argv else 1
+proxmox_limiter.configure(max(1, int(os.getenv("PROXMOX_CONCURRENCY_MAX", 16)) // SERVER_WORKERS))
+terraform_limiter.configure(max(1, int(os.getenv("TERRAFORM_CONCURRENCY_MAX", 8)) // SERVER_WORKERS))
 terraform_service = TerraformService(config_manager)
-deployment_service = DeploymentService(config_manager)
+# Terraform runs on this host and reaches the state backend on a listener of its own,
+# so its calls never wait for the request threads that wait for Terraform
+TFSTATE_HOST = os.getenv("TFSTATE_HOST") or "127.0.0.1"
+TFSTATE_PORT = int(os.getenv("TFSTATE_PORT") or int(config_manager.get('BACKEND_PORT', 5000)) + 1)
+TFSTATE_CONNECT_HOST = "127.0.0.1" if TFSTATE_HOST in ("0.0.0.0", "::") else TFSTATE_HOST
+state_store = TerraformStateStore(
+    "infrastructure/persistence/tfstate.sqlite3",
+    url=os.getenv("TFSTATE_URL") or f"http://{TFSTATE_CONNECT_HOST}:{TFSTATE_PORT}/tfstate",
+    keep_versions=int(os.getenv("TFSTATE_VERSIONS", 10)),
+    lock_ttl=int(os.getenv("TFSTATE_LOCK_TTL", 3600))
+)
+TFSTATE_USER = "terraform"
+# Derived from MASTER_KEY so that every worker accepts the credentials of the others
+TFSTATE_PASSWORD = hmac.new(config_manager.key, b"securify-tfstate", hashlib.sha256).hexdigest()
+# Inherited by the terraform processes, the credentials stay out of the workspaces
+os.environ["TF_HTTP_USERNAME"] = TFSTATE_USER
+os.environ["TF_HTTP_PASSWORD"] = TFSTATE_PASSWORD
+state_app = Flask("tfstate")
+on_worker_start(DedicatedListener(
+    state_app, TFSTATE_HOST, TFSTATE_PORT, "infrastructure/persistence/tfstate.listener.lock"
+).start)
+operation_scheduler = OperationScheduler(
+    "infrastructure/persistence/operations.json",
+    "infrastructure/persistence/workspace_locks",
+    max_parallel=int(os.getenv("OPERATIONS_PARALLEL", 4))
+)
+proxmox_client = ProxmoxClient(config_manager)
+cluster_inventory_service = ClusterInventoryService(
+    proxmox_client,
+    ttl=int(os.getenv("CLUSTER_INVENTORY_TTL", 15))
+)
+placement_service = PlacementService(
+    cluster_inventory_service,
+    proxmox_client,
+    strategy=os.getenv("PLACEMENT_STRATEGY", "spread"),
+    cpu_overcommit=float(os.getenv("PLACEMENT_CPU_OVERCOMMIT", 4)),
+    memory_overcommit=float(os.getenv("PLACEMENT_MEMORY_OVERCOMMIT", 1))
+)
+clone_mode_service = CloneModeService(
+    cluster_inventory_service,
+    proxmox_client,
+    default_mode=os.getenv("CLONE_MODE", "full")
+)
+# Container templates of the /validate-config OS list, unless narrowed down
+WARM_POOL_TEMPLATES = os.getenv("WARM_POOL_TEMPLATES") or ",".join(
+    sorted(os_version for os_version in OS_VERSIONS_LINUX_SERVER if ".tar." in os_version)
+)
+WARM_POOL_VMIDS = [int(bound) for bound in os.getenv("WARM_POOL_VMIDS", "8000-8499").split("-")]
+warm_pool_service = WarmPoolService(
+    proxmox_client,
+    "infrastructure/persistence/warm_pool.json",
+    templates=WARM_POOL_TEMPLATES.split(","),
+    size=int(os.getenv("WARM_POOL_SIZE", 0)),
+    vmids=range(WARM_POOL_VMIDS[0], WARM_POOL_VMIDS[1] + 1),
+    node=os.getenv("WARM_POOL_NODE") or None,
+    storage=os.getenv("WARM_POOL_STORAGE", "local-lvm"),
+    interval=int(os.getenv("WARM_POOL_INTERVAL", 60))
+)
+on_worker_start(warm_pool_service.start)
+deployment_service = DeploymentService(
+    config_manager,
+    state_store=state_store,
+    lock_timeout=int(os.getenv("TFSTATE_LOCK_TIMEOUT", 300)),
+    scheduler=operation_scheduler,
+    placement=placement_service,
+    clone_modes=clone_mode_service,
+    warm_pool=warm_pool_service
+)
 tracking_service = DeploymentTrackingService(config_manager)
 health_check_service = HealthCheckService(config_manager)
+validation_service = ValidationService(cluster_inventory_service, tracking_service)
+drift_service = DriftService(cluster_inventory_service, tracking_service, deployment_service)
+session_tokens = SessionTokenManager(
+    config_manager.key,
+    ttl=int(config_manager.get("SESSION_TTL", 28800)),
+    max_age=int(config_manager.get("SESSION_MAX_AGE", 86400)),
+    sliding=str(config_manager.get("SESSION_SLIDING", "false")).lower() == "true",
+    revocation_file="infrastructure/persistence/revoked_sessions.json"
+)
 
 SFTP_BASE_PATH = os.getenv("SFTP_BASE_PATH", ".")
+APPS_SYNC_PARALLEL = int(os.getenv("APPS_SYNC_PARALLEL", 4))
+APPS_INSTALL_PARALLEL = int(os.getenv("APPS_INSTALL_PARALLEL", 2))
+# Every download and every install's listing can hold a session at once, plus a few for the catalog routes
+sftp_pool = SftpPool(
+    max_size=int(os.getenv("SFTP_POOL_SIZE") or APPS_SYNC_PARALLEL + APPS_INSTALL_PARALLEL + 2),
+    idle_timeout=int(os.getenv("SFTP_POOL_IDLE_TIMEOUT", 300)),
+    keepalive=int(os.getenv("SFTP_KEEPALIVE", 30))
+)
+app_catalog_service = AppCatalogService(
+    sftp_pool,
+    SFTP_BASE_PATH,
+    ttl=int(os.getenv("APPS_CATALOG_TTL", 60))
+)
+logo_cache_service = LogoCacheService(
+    sftp_pool,
+    SFTP_BASE_PATH,
+    os.getenv("LOGO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "securify-logo-cache")),
+    max_bytes=int(os.getenv("LOGO_CACHE_MAX_MB", 50)) * 1024 * 1024,
+    stat_ttl=int(os.getenv("APPS_CATALOG_TTL", 60))
+)
 LOCAL_APP_DIR = os.getenv("LOCAL_APP_DIR", "./downloaded_apps")
-USERS_TOKENS = []
-EXCLUDED_ROUTES = ["/login", "/test-proxmox", "/test-ldaps", "/save-config", "/get-config"]
+app_sync_service = AppSyncService(
+    sftp_pool,
+    SFTP_BASE_PATH,
+    LOCAL_APP_DIR,
+    parallel=APPS_SYNC_PARALLEL
+)
+app_install_service = AppInstallService(
+    app_sync_service,
+    "infrastructure/persistence/install_jobs.json",
+    max_workers=APPS_INSTALL_PARALLEL
+)
+CHECKLIST_PATH = "infrastructure/persistence/checklist.json"
+STATS_PATH = "infrastructure/persistence/stats.json"
+metrics_collector = ProxmoxMetricsCollector(
+    proxmox_client,
+    TimeSeriesStore(snapshot_path="infrastructure/persistence/stats_timeseries.json"),
+    interval=int(os.getenv("STATS_COLLECT_INTERVAL", 10))
+)
+on_worker_start(metrics_collector.start)
+# Every worker publishes its metrics so that /metrics reports the whole server
+on_worker_start(lambda: metrics_registry.share(
+    os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "securify-metrics"))
+))
+EXCLUDED_ROUTES = ["/login", "/test-proxmox", "/test-ldaps", "/save-config", "/get-config", "/metrics"]
+
+
+def get_request_token():
+    """
+    :return: session token from the Authorization header or the token arg
+    """
+    # 1. First, try to get the token from the Authorization header (best practice)
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header.split(' ')[1]
+
+    # 2. If not in header, fall back to checking URL parameters (for legacy calls)
+    return request.args.get('token')
 
 
 @app.before_request
@@ -65,23 +229,16 @@ def before_request():
     """
     Before request, check if token is given and if it is valid
     """
+    g.request_started = time.perf_counter()
+    HTTP_REQUESTS_IN_PROGRESS.inc()
+
     if request.method == 'OPTIONS':
         return
 
     if request.path not in EXCLUDED_ROUTES:
-        token = None
-        
-        # 1. First, try to get the token from the Authorization header (best practice)
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-        
-        # 2. If not in header, fall back to checking URL parameters (for legacy calls)
-        if not token:
-            token = request.args.get('token')
-        
-        # 3. Validate the token
-        if not token or token not in USERS_TOKENS:
+        # Validate the token signature, expiry and revocation
+        claims = session_tokens.verify(get_request_token())
+        if not claims:
             abort(
                 code=401,
                 description=jsonify({
@@ -89,6 +246,47 @@ def before_request():
                     "message": "Unauthorized: Token is missing or invalid"
                 })
             )
+        g.session = claims
+
+
+@app.after_request
+def after_request(response):
+    """
+    After request, hand out a renewed token when sliding sessions are enabled
+    """
+    renewed_token = session_tokens.renew(g.get("session"))
+    if renewed_token:
+        response.headers["X-Session-Token"] = renewed_token
+
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
+    if "request_started" in g:
+        HTTP_REQUEST_DURATION.labels(request.method, route).observe(time.perf_counter() - g.request_started)
+    return response
+
+
+@app.teardown_request
+def teardown_request(error=None):
+    """
+    Teardown request, runs even when the request failed
+    """
+    if "request_started" in g:
+        HTTP_REQUESTS_IN_PROGRESS.dec()
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    :return: backend metrics in the Prometheus text format, with METRICS_TOKEN or from loopback only
+    """
+    metrics_token = os.getenv("METRICS_TOKEN")
+    if metrics_token:
+        if not hmac.compare_digest((get_request_token() or "").encode(), metrics_token.encode()):
+            return jsonify({"status": "401", "message": "Unauthorized"}), 401
+    elif request.remote_addr not in ("127.0.0.1", "::1"):
+        # Without a token, only a scraper running on this host may read the metrics
+        return jsonify({"status": "403", "message": "Forbidden: set METRICS_TOKEN to scrape remotely"}), 403
+    return app.response_class(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route('/login', methods=['GET'])
@@ -96,11 +294,8 @@ def login():
     """
     :return: auth token
     """
-    ldap_server = config_manager.get("LDAPS_SERVER")
-    ldap_port = int(config_manager.get("LDAPS_SERVER_PORT"))
-    ldap_cert_info = config_manager.get("LDAPS_CERT", "infrastructure/persistence/certificats/ssrootca.cer")
-    ldap_base_dn = config_manager.get("LDAPS_BASE_DN")
-    ldap_user_ou = config_manager.get("LDAPS_USER_OU", "")
+    ldap = config_manager.ldap
+    ldap_cert_info = ldap.cert
 
     cert_path = None
     is_temp_cert = False
@@ -108,23 +303,27 @@ def login():
         if ldap_cert_info and os.path.exists(ldap_cert_info):
             cert_path = ldap_cert_info
         elif ldap_cert_info:
+            # One file per request, concurrent logins must not share it
             is_temp_cert = True
-            cert_path = "login_temp_cert.cer"
-            with open(cert_path, "w") as cert_file:
+            cert_fd, cert_path = tempfile.mkstemp(suffix=".cer")
+            with os.fdopen(cert_fd, "w") as cert_file:
                 cert_file.write(ldap_cert_info)
 
         # Build the correct DN for binding
         user = request.args["cn"]
         dn = f"uid={user}"
-        if ldap_user_ou:
-            dn += f",ou={ldap_user_ou}"
-        if ldap_base_dn:
-            dn += f",{ldap_base_dn}"
+        if ldap.user_ou:
+            dn += f",ou={ldap.user_ou}"
+        if ldap.base_dn:
+            dn += f",{ldap.base_dn}"
 
         ldaps_controller = LdapsController(
-            server_address=ldap_server,
+            server_address=ldap.server,
             path_to_cert_file=cert_path,
-            port=ldap_port
+            port=ldap.port,
+            bind_cache_ttl=int(config_manager.get("LDAPS_BIND_CACHE_TTL", 0)),
+            bind_cache_size=int(config_manager.get("LDAPS_BIND_CACHE_SIZE", 256)),
+            bind_cache_version=config_manager.section_version("ldap")
         )
 
         result = ldaps_controller.connect(
@@ -139,8 +338,7 @@ def login():
                 "message": "User not found"
             }), 400
 
-        token = generate_token(16)
-        USERS_TOKENS.append(token)
+        token = session_tokens.issue(user)
         return jsonify({
             "status": "200",
             "message": token
@@ -154,39 +352,44 @@ def login():
 @app.route('/disconnect', methods=['GET'])
 def disconnect():
     """
-    delete user token from USERS_TOKEN array
+    revoke the session of the user token
     """
-    token = request.args["token"]
-    USERS_TOKENS.remove(token)
+    session_tokens.revoke(g.session)
     return jsonify({
         "status": "200",
         "message": "Successfully disconnected"
     }), 200
 
 
+def document_response(document):
+    """
+    :return: conditional response serving a cached JSON document as is
+    """
+    response = app.response_class(document.raw, mimetype='application/json')
+    response.set_etag(document.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Document-Version'] = str(document.version)
+    return response.make_conditional(request)
+
+
 @app.route('/checklist/get', methods=['GET'])
 def checklist_get():
     """
-    :return: ping result
+    :return: checklist content
     """
 
-    json_crtl = JsonCrtl("infrastructure/persistence/checklist.json")
-    response = json_crtl.read()
-
-    return response, 200
+    json_crtl = JsonCrtl(CHECKLIST_PATH, CHECKLIST_SCHEMA)
+    return document_response(json_crtl.read_document())
 
 
 @app.route('/checklist/update', methods=['PUT'])
 def checklist_update():
     """
     This route permit to update checklist
-    Take as arg checklist file
+    Take as arg checklist file, and optionally an If-Match header with the etag of the edited version
     :return: bool depend on success of checklist updating
     """
 
-    for x in request.files:
-        print(x)
-
     if 'checklist' not in request.files:
         print("Checklist Update | Error | Missing args")
         return jsonify({
@@ -205,13 +408,29 @@ def checklist_update():
 
     print("Checklist Update | Info | File ok, starting...")
 
-    file_content = file.read()
-    print(file_content)
-
-    json_crtl = JsonCrtl("infrastructure/persistence/checklist.json")
+    json_crtl = JsonCrtl(CHECKLIST_PATH, CHECKLIST_SCHEMA)
+    if_match = next(iter(request.if_match), None)
 
-    response = jsonify(json_crtl.update(file_content))
+    try:
+        document = json_crtl.update(file.read(), if_match=if_match)
+    except DocumentValidationError as e:
+        print(f"Checklist Update | Error | {e}")
+        return jsonify({
+            "status": "400",
+            "message": str(e)
+        }), 400
 
+    if document is None:
+        return jsonify({
+            "status": "412",
+            "message": "Checklist was modified since it was read"
+        }), 412
+    if not document:
+        return jsonify(False), 200
+
+    response = jsonify(True)
+    response.set_etag(document.etag)
+    response.headers['X-Document-Version'] = str(document.version)
     return response, 200
 
 
@@ -306,17 +525,36 @@ def stats_proxmox():
     :return: ping result
     """
 
-    json_crtl = JsonCrtl("infrastructure/persistence/stats.json")
-    response = json_crtl.read()
-
-    return response, 200
+    series = request.args.get('series') or f"node/{config_manager.get('NODE')}"
+    try:
+        end = parse_time(request.args.get('to'), time.time())
+        start = parse_time(request.args.get('from'), end - 3600)
+        step = float(request.args['step']) if request.args.get('step') else None
+    except ValueError:
+        return jsonify({'error': 'from, to and step must be numbers'}), 400
+    if step is not None and not (math.isfinite(step) and step > 0):
+        return jsonify({'error': 'step must be a positive number'}), 400
+
+    points = metrics_collector.query(series, start, end, step)
+    if points is None:
+        # Nothing collected yet, serve the last exported statistics
+        json_crtl = JsonCrtl(STATS_PATH)
+        return document_response(json_crtl.read_document())
+    return jsonify(points), 200
+
+
+@app.route('/stats/proxmox/series', methods=['GET'])
+def stats_proxmox_series():
+    """
+    :return: names of the collected series (node/<name>, qemu/<vmid>, lxc/<vmid>)
+    """
+    return jsonify(metrics_collector.keys()), 200
 
 
 @app.route('/fetch-proxmox-data', methods=['GET'])
 def fetch_proxmox_data():
     try:
         # Use the service layer, which contains the correct Proxmox API logic
-        terraform_service = TerraformService(config_manager)
         templates = terraform_service.get_templates()
         bridges = terraform_service.get_bridges()
         return jsonify({"templates": templates, "bridges": bridges})
@@ -358,6 +596,7 @@ def save_config():
     }
 
     if config_manager.save_config(config_to_save):
+        LdapsController.flush_bind_cache()
         return jsonify({"status": "success", "message": "Configuration saved successfully."}), 200
     else:
         return jsonify({"status": "error", "message": "Failed to save configuration."}), 500
@@ -437,155 +676,78 @@ def run_terraform():
 
 @app.route('/apps', methods=['GET'])
 def list_apps():
-    sftp = connect_sftp()
-    sftp.chdir(SFTP_BASE_PATH)
-    app_folders = []
-
-    for item in sftp.listdir():
-        if item.startswith('.') or item == '.git':
-            continue
-        if not is_directory(sftp, item):
-            continue
-        try:
-            sftp.chdir(item)
-            files = sftp.listdir()
-            if 'description.txt' in files:
-                with sftp.open('description.txt') as f:
-                    description = f.read().decode()
-                app_folders.append({
-                    'name': item,
-                    'description': description.strip(),
-                    'logo_url': f'/apps/{item}/logo'
-                })
-            sftp.chdir('..')
-        except IOError:
-            continue
-    sftp.close()
-    return jsonify(app_folders)
+    catalog, etag = app_catalog_service.get_catalog()
+    response = jsonify(catalog)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 @app.route('/apps/<app_name>/logo', methods=['GET'])
 def get_logo(app_name):
-    sftp = connect_sftp()
+    def send_logo():
+        local_path, etag = logo_cache_service.get_logo(app_name)
+        return send_file(
+            local_path,
+            mimetype='image/png',
+            etag=etag,
+            conditional=True,
+            max_age=int(os.getenv("LOGO_CACHE_MAX_AGE", 3600))
+        )
+
     try:
-        sftp.chdir(f"{SFTP_BASE_PATH}/{app_name}")
-        local_path = os.path.join(tempfile.gettempdir(), f"logo.png")
-        sftp.get('logo.png', local_path)
-        return send_file(local_path, mimetype='image/png')
+        try:
+            return send_logo()
+        except FileNotFoundError:
+            # Evicted by another worker between the lookup and the read, the cache downloads it again
+            return send_logo()
     except Exception as e:
         return jsonify({'error': str(e)}), 404
-    finally:
-        sftp.close()
 
-@app.route('/install/<app_name>', methods=['POST', 'GET'])
-def install_app(app_name):
-    sftp = connect_sftp()
+@app.route('/install', methods=['POST'])
+def install_apps():
+    """
+    Install several apps in the background
+    :return: the job id and the state of each app, to poll on /install/jobs/<job_id>
+    """
+    data = request.get_json(silent=True) or {}
+    app_names = data.get('apps')
+    if not isinstance(app_names, list) or not app_names or not all(isinstance(name, str) for name in app_names):
+        return jsonify({'error': 'A non-empty list of app names is expected in "apps"'}), 400
 
-    local_path = os.path.join(LOCAL_APP_DIR, app_name)
+    job = app_install_service.install(app_names)
+    return jsonify(job), 202
 
-    if os.path.exists(local_path):
-        shutil.rmtree(local_path)
 
-    os.makedirs(local_path, exist_ok=True)
+@app.route('/install/jobs/<job_id>', methods=['GET'])
+def install_job_status(job_id):
+    job = app_install_service.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
 
-    try:
-        sftp.chdir(f"{SFTP_BASE_PATH}/{app_name}")
-        for file in sftp.listdir():
-            sftp.get(file, os.path.join(local_path, file))
 
-        success, output_or_error = execute_terraform(local_path)
-        if not success:
-            return jsonify({'error': 'Terraform error', 'details': output_or_error}), 500
+@app.route('/install/<app_name>', methods=['POST', 'GET'])
+def install_app(app_name):
+    try:
+        # Goes through the install service so that it joins an install of the same app already running
+        job = app_install_service.wait(app_install_service.install([app_name])['id'])
+        run = job['apps'][app_name]
+        if run['status'] != 'done':
+            return jsonify({'error': 'Terraform error', 'details': run.get('error')}), 500
 
-        return jsonify({'status': 'success', 'output': output_or_error})
+        return jsonify({'status': 'success', 'output': run.get('output'), 'sync': run.get('sync')})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        sftp.close()
 
 
 
 @app.route('/validate-config', methods=['POST'])
 def validate_config():
-    data = request.json
-    errors = []
-    vmid_set = set()
-    ip_set = set()
-    roles_windows_server = ['ADDS', 'DNS', 'DHCP', 'IIS']
-    roles_linux_server = ['Web Server', 'Database', 'File Server']
-    os_versions_windows_server = ['2016', '2019', '2022']
-    os_versions_linux_server = [
-        'debian-12.4.0-amd64-netinst.iso',
-        'debian-12.5.0-amd64-netinst.iso', 
-        'noble-server-cloudimg-amd64.img',
-        'ubuntu-24.04-desktop-amd64.iso',
-        'debian-12-standard_12.2-1_amd64.tar.zst',
-        'ubuntu-20.04-standard_20.04-1_amd64.tar.gz',
-        'ubuntu-24.04-standard_24.04-2_amd64.tar.zst'
-    ]
-    machines = data.get('machines', [])
-    if not machines:
-        errors.append('No machines defined.')
-    for idx, m in enumerate(machines):
-        base_type = m.get('baseType') or (m.get('id', '').split('-')[0])
-        name = m.get('name') or m.get('id')
-        adv = m.get('advanced', {})
-        # VMID
-        vmid = adv.get('vmid') or (100 + idx)
-        if not isinstance(vmid, int) or vmid <= 0 or vmid >= 10000:
-            errors.append(f'{name}: Invalid or missing VMID.')
-        if vmid in vmid_set:
-            errors.append(f'{name}: Duplicate VMID ({vmid}).')
-        vmid_set.add(vmid)
-        # Name
-        if not name or not isinstance(name, str) or not name.strip():
-            errors.append(f'{name}: Name is required.')
-        # IP (only require for static mode)
-        if base_type != 'vmPack':
-            ip_mode = adv.get('ip_mode', 'dhcp')
-            if ip_mode == 'static':
-                ip = adv.get('ip_address')
-                if not ip or not isinstance(ip, str) or not is_valid_ip(ip):
-                    errors.append(f'{name}: Invalid or missing IP address.')
-                if ip in ip_set:
-                    errors.append(f'{name}: Duplicate IP ({ip}).')
-                ip_set.add(ip)
-        # OS Version
-        if base_type == 'windowsServer' and adv.get('os_version') not in os_versions_windows_server:
-            errors.append(f'{name}: Invalid or missing Windows Server OS version.')
-        if base_type == 'linuxServer' and adv.get('os_version') not in os_versions_linux_server:
-            errors.append(f'{name}: Invalid or missing Linux Server OS version.')
-        # Roles
-        roles = m.get('roles', [])
-        if base_type == 'windowsServer' and not all(r in roles_windows_server for r in roles):
-            errors.append(f'{name}: Invalid roles selected.')
-        if base_type == 'linuxServer' and not all(r in roles_linux_server for r in roles):
-            errors.append(f'{name}: Invalid roles selected.')
-        # VM Pack count
-        if base_type == 'vmPack':
-            count = m.get('group', {}).get('count')
-            if not isinstance(count, int) or count < 1 or count > 10:
-                errors.append(f'{name}: VM Pack count must be 1-10.')
-        # VLANs
-        vlans = m.get('vlans', [])
-        if vlans:
-            if not isinstance(vlans, list):
-                errors.append(f'{name}: VLANs must be a list.')
-            else:
-                seen_vlans = set()
-                for v in vlans:
-                    if not v or (not isinstance(v, (str, int))):
-                        errors.append(f'{name}: VLANs must be non-empty strings or numbers.')
-                    if v in seen_vlans:
-                        errors.append(f'{name}: Duplicate VLAN ({v}).')
-                    seen_vlans.add(v)
-    if errors:
-        return jsonify({'valid': False, 'errors': errors}), 200
-    return jsonify({'valid': True}), 200
-
-
-def is_valid_ip(ip):
-    import re
-    return re.match(r'^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$', ip) is not None
+    data = request.get_json(silent=True) or {}
+    result = validation_service.validate(data.get('machines', []))
+    if not result['valid']:
+        return jsonify(result), 200
+    return jsonify({'valid': True, 'warnings': result['warnings']}), 200
 
 
 @app.route('/deploy-machines', methods=['POST'])
@@ -598,8 +760,14 @@ def deploy_machines():
         if not machines:
             return jsonify({'error': 'No machines provided for deployment'}), 400
         
+        # Clone mode of the whole lab, a machine's advanced.clone_mode takes precedence
+        clone_mode = data.get('cloneMode')
+        if clone_mode is not None and (not isinstance(clone_mode, str) or clone_mode not in CLONE_MODES):
+            return jsonify({'error': 'cloneMode must be "full" or "linked"'}), 400
+        
         # Deploy all machines using the deployment service
-        results = deployment_service.deploy_machines(machines)
+        results = deployment_service.deploy_machines(machines, clone_mode)
+        cluster_inventory_service.invalidate()
         
         # Check if any deployments failed
         failed_deployments = [r for r in results if r['status'] == 'error']
@@ -619,6 +787,8 @@ def deploy_machines():
             response['message'] = f"All {len(machines)} machines deployed successfully"
             return jsonify(response), 200
             
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error in deploy_machines: {e}", exc_info=True)
         return jsonify({'error': f'Deployment service error: {str(e)}'}), 500
@@ -640,6 +810,7 @@ def destroy_machine(machine_id):
     """Destroy a specific machine deployment"""
     try:
         result = deployment_service.destroy_machine(machine_id)
+        cluster_inventory_service.invalidate()
         
         if result['success']:
             return jsonify(result), 200
@@ -651,6 +822,46 @@ def destroy_machine(machine_id):
         return jsonify({'error': f'Failed to destroy machine: {str(e)}'}), 500
 
 
+@app.route('/destroy-machines', methods=['POST'])
+def destroy_machines():
+    """
+    Destroy several machines at once: {"machines": [machine or pack IDs]} or {"machines": "all"}.
+    Each Terraform workspace is destroyed once, OPERATIONS_PARALLEL workspaces at a time.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        targets = data.get('machines')
+        if not targets or not (targets == 'all' or isinstance(targets, list)):
+            return jsonify({'error': 'machines must be a list of machine or pack IDs, or "all"'}), 400
+
+        report = deployment_service.destroy_machines(targets)
+        cluster_inventory_service.invalidate()
+
+        results = report['results']
+        failed = [r for r in results if not r['success']]
+        response = {
+            'total_workspaces': len(results),
+            'successful': len(results) - len(failed),
+            'failed': len(failed),
+            'removed': report['removed'],
+            'unresolved': report['unresolved'],
+            'results': results
+        }
+        if not results:
+            response['message'] = 'No deployment found for the given machines'
+            return jsonify(response), 404
+        if failed or report['unresolved']:
+            response['message'] = f"{len(results) - len(failed)} deployments destroyed, {len(failed)} failed, " \
+                                  f"{len(report['unresolved'])} machines not found"
+            return jsonify(response), 207
+        response['message'] = f"All {len(results)} deployments destroyed"
+        return jsonify(response), 200
+
+    except Exception as e:
+        logging.error(f"Error in destroy_machines: {e}", exc_info=True)
+        return jsonify({'error': f'Failed to destroy machines: {str(e)}'}), 500
+
+
 @app.route('/deployed-machines', methods=['GET'])
 def get_deployed_machines():
     """Get all deployed machines for Conceptify display"""
@@ -662,6 +873,130 @@ def get_deployed_machines():
         return jsonify({'error': f'Failed to get deployed machines: {str(e)}'}), 500
 
 
+@app.route('/drift', methods=['GET'])
+def drift():
+    """
+    Machines that no longer match their deployment, from a single inventory snapshot.
+    ?plan=1 also runs terraform plan -refresh-only in the flagged workspaces.
+    """
+    try:
+        report = drift_service.detect(plan=request.args.get('plan') in ('1', 'true'))
+        if report is None:
+            return jsonify({'error': 'Proxmox inventory unavailable'}), 503
+        return jsonify(report), 200
+    except Exception as e:
+        logging.error(f"Error detecting drift: {e}", exc_info=True)
+        return jsonify({'error': f'Failed to detect drift: {str(e)}'}), 500
+
+
+@app.route('/operations', methods=['GET'])
+def list_operations():
+    """
+    :return: deploy, update and destroy operations, oldest first, with the queue
+             position of the pending ones (?workspace=&active=1)
+    """
+    operations = operation_scheduler.list_operations(
+        workspace=request.args.get('workspace'),
+        active_only=request.args.get('active') in ('1', 'true')
+    )
+    return jsonify({
+        'operations': operations,
+        'running': sum(1 for operation in operations if operation['status'] == 'running'),
+        'queued': sum(1 for operation in operations if operation['status'] == 'queued'),
+        'max_parallel': operation_scheduler.max_parallel,
+        'concurrency': {'proxmox': proxmox_limiter.state(), 'terraform': terraform_limiter.state()}
+    }), 200
+
+
+@app.route('/operations/<operation_id>', methods=['GET'])
+def operation_status(operation_id):
+    operation = operation_scheduler.get(operation_id)
+    if operation is None:
+        return jsonify({'error': 'Operation not found'}), 404
+    return jsonify(operation), 200
+
+
+@app.route('/warm-pool', methods=['GET'])
+def warm_pool_status():
+    """
+    :return: ready and in-creation containers of each template of the warm pool
+    """
+    return jsonify(warm_pool_service.status()), 200
+
+
+@state_app.route('/tfstate/<workspace>', methods=['GET', 'POST', 'DELETE', 'LOCK', 'UNLOCK'])
+def tfstate(workspace):
+    """
+    Terraform HTTP state backend of a deployment workspace, served on TFSTATE_PORT.
+    A lock held by another operation is answered with 423 and its lock info.
+    """
+    auth = request.authorization
+    if not auth or auth.username != TFSTATE_USER or \
+            not hmac.compare_digest(auth.password or "", TFSTATE_PASSWORD):
+        return jsonify({"status": "401", "message": "Unauthorized"}), 401
+    try:
+        if request.method == 'GET':
+            state = state_store.get(workspace)
+            if state is None:
+                return '', 404
+            return state_app.response_class(state, mimetype='application/json')
+        if request.method == 'POST':
+            state_store.put(workspace, request.get_data(), lock_id=request.args.get('ID'))
+        elif request.method == 'LOCK':
+            state_store.lock(workspace, request.get_json(force=True))
+        elif request.method == 'UNLOCK':
+            info = request.get_json(force=True, silent=True) or {}
+            state_store.unlock(workspace, info.get('ID'))
+        else:
+            state_store.delete(workspace)
+        return '', 200
+    except StateLockError as e:
+        return jsonify(e.info), 423
+    except Exception as e:
+        logging.error(f"State backend error for {workspace}: {e}", exc_info=True)
+        return jsonify({'error': f'State backend error: {str(e)}'}), 500
+
+
+HISTORY_GROUP_FIELDS = {"template_type", "phase", "operation", "perf", "base_type"}
+
+
+@app.route('/terraform/history', methods=['GET'])
+def terraform_history():
+    """
+    :return: recorded Terraform runs, most recent first (?from=&to=&operation=&limit=)
+    """
+    try:
+        end = parse_time(request.args.get('to'), time.time())
+        start = parse_time(request.args.get('from'), end - 86400)
+        limit = int(request.args['limit']) if request.args.get('limit') else 100
+    except ValueError:
+        return jsonify({'error': 'from, to and limit must be numbers'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be at least 1'}), 400
+
+    entries = deployment_service.history.entries(start, end, request.args.get('operation'))
+    return jsonify({'runs': entries[::-1][:limit]}), 200
+
+
+@app.route('/terraform/stats', methods=['GET'])
+def terraform_stats():
+    """
+    :return: Terraform duration percentiles grouped by template type and phase
+             (?from=&to=&operation=&group_by=template_type,phase)
+    """
+    try:
+        end = parse_time(request.args.get('to'), time.time())
+        start = parse_time(request.args.get('from'), end - 7 * 86400)
+    except ValueError:
+        return jsonify({'error': 'from and to must be numbers'}), 400
+    group_by = tuple(request.args.get('group_by', 'template_type,phase').split(','))
+    if not set(group_by) <= HISTORY_GROUP_FIELDS:
+        return jsonify({'error': f"group_by accepts {', '.join(sorted(HISTORY_GROUP_FIELDS))}"}), 400
+
+    stats = deployment_service.history.stats(start, end, group_by, request.args.get('operation'))
+    return jsonify({'from': start, 'to': end, 'group_by': group_by, 'stats': stats}), 200
+
+
 @app.route('/machine-health/<machine_id>', methods=['GET'])
 def get_machine_health(machine_id):
     """Get health status of a specific machine"""
@@ -691,7 +1026,7 @@ def get_machine_health(machine_id):
             pass
         
         if vm_id:
-            health_info = health_check_service.comprehensive_health_check(machine_id, vm_id)
+            health_info = health_check_service.comprehensive_health_check(machine_id, vm_id, machine.get('node'))
             if health_info:
                 # Update tracking with latest health info
                 tracking_service.update_machine_status(
@@ -720,9 +1055,13 @@ def update_machine(machine_id):
         result = deployment_service.update_machine(machine_id, data)
         
         if result.get('success'):
-            return jsonify({'message': 'Machine updated successfully'}), 200
+            return jsonify({
+                'message': result.get('message', 'Machine updated successfully'),
+                'mode': result.get('mode'),
+                'changes': result.get('changes', {})
+            }), 200
         else:
-            return jsonify({'error': result.get('error', 'Failed to update machine')}), 500
+            return jsonify({'error': result.get('message', 'Failed to update machine')}), 500
     except Exception as e:
         logging.error(f"Error updating machine {machine_id}: {e}", exc_info=True)
         return jsonify({'error': f'Failed to update machine: {str(e)}'}), 500
@@ -782,21 +1121,8 @@ def boot_all_machines():
             if vm_id:
                 try:
                     # Check if the container is already running
-                    from proxmoxer import ProxmoxAPI
-                    import urllib3
-                    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-                    proxmox_server = deployment_service.config_manager.get("PROXMOX_SERVER")
-                    proxmox_token = deployment_service.config_manager.get("PVEAPITOKEN")
-                    proxmox_node = deployment_service.config_manager.get("NODE")
-                    user_realm, token_rest = proxmox_token.split("!", 1)
-                    token_name, token_value = token_rest.split("=", 1)
-                    proxmox = ProxmoxAPI(
-                        proxmox_server,
-                        user=user_realm,
-                        token_name=token_name,
-                        token_value=token_value,
-                        verify_ssl=False
-                    )
+                    proxmox = proxmox_client.api
+                    proxmox_node = machine.get('node') or proxmox_client.node
                     ct = proxmox.nodes(proxmox_node).lxc(int(vm_id))
                     status = ct.status.current.get()
                     if status.get('status') == 'running':
@@ -813,27 +1139,11 @@ def boot_all_machines():
                     logging.info(f"  Attempting to boot VM/Container with ID: {vm_id}")
                     
                     # Use the deployment service's boot method
-                    boot_success = deployment_service._start_vm_via_proxmox_api(vm_id)
+                    boot_success = deployment_service._start_vm_via_proxmox_api(vm_id, proxmox_node)
                     
                     if boot_success:
                         # Fetch eth0 IP using proxmoxer with comprehensive logging
                         try:
-                            from proxmoxer import ProxmoxAPI
-                            import urllib3
-                            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-                            proxmox_server = deployment_service.config_manager.get("PROXMOX_SERVER")
-                            proxmox_token = deployment_service.config_manager.get("PVEAPITOKEN")
-                            proxmox_node = deployment_service.config_manager.get("NODE")
-                            user_realm, token_rest = proxmox_token.split("!", 1)
-                            token_name, token_value = token_rest.split("=", 1)
-                            proxmox = ProxmoxAPI(
-                                proxmox_server,
-                                user=user_realm,
-                                token_name=token_name,
-                                token_value=token_value,
-                                verify_ssl=False
-                            )
-                            
                             # Wait a moment for container to fully start
                             import time
                             time.sleep(3)
@@ -899,7 +1209,7 @@ def boot_all_machines():
                             # Method 4: Use health check service as fallback
                             if not eth0_ip:
                                 logging.info(f"  Trying health check service for VM {vm_id}...")
-                                health_info = health_check_service.get_machine_ip_from_proxmox(machine_id, vm_id)
+                                health_info = health_check_service.get_machine_ip_from_proxmox(machine_id, vm_id, proxmox_node)
                                 if health_info and health_info.get('ip_address'):
                                     potential_ip = health_info['ip_address']
                                     if potential_ip and '.' in potential_ip and not potential_ip.startswith('127.') and potential_ip.lower() not in ('dhcp', 'static', 'unknown'):
@@ -1009,34 +1319,15 @@ def refresh_ips():
         updated_count = 0
         results = []
         
-        # Get Proxmox config
-        proxmox_server = config_manager.get("PROXMOX_SERVER")
-        proxmox_token = config_manager.get("PVEAPITOKEN")
-        proxmox_node = config_manager.get("NODE")
-        
-        if not all([proxmox_server, proxmox_token, proxmox_node]):
-            return jsonify({'error': 'Missing Proxmox configuration'}), 500
-        
-        # Parse token for proxmoxer
+        # Get Proxmox config, machines placed on another node say so in tracking
         try:
-            user_realm, token_rest = proxmox_token.split("!", 1)
-            token_name, token_value = token_rest.split("=", 1)
-        except Exception as e:
-            return jsonify({'error': f'Invalid Proxmox token format: {e}'}), 500
+            default_node = proxmox_client.node
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 500
         
         # Initialize proxmoxer
         try:
-            from proxmoxer import ProxmoxAPI
-            import urllib3
-            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-            
-            proxmox = ProxmoxAPI(
-                proxmox_server,
-                user=user_realm,
-                token_name=token_name,
-                token_value=token_value,
-                verify_ssl=False
-            )
+            proxmox = proxmox_client.api
         except Exception as e:
             return jsonify({'error': f'Failed to connect to Proxmox: {e}'}), 500
         
@@ -1044,6 +1335,7 @@ def refresh_ips():
             machine_id = machine.get('id')
             machine_name = machine.get('name', 'Unknown')
             vm_id = machine_id  # Use machine ID as VM ID
+            proxmox_node = machine.get('node') or default_node
             
             logging.info(f"Processing machine: {machine_name} (ID: {machine_id}, VM ID: {vm_id})")
             
@@ -1131,4 +1423,18 @@ def ping_machine():
 if __name__ == '__main__':
     host = config_manager.get('BACKEND_HOST', '0.0.0.0')
     port = int(config_manager.get('BACKEND_PORT', 5000))
-    app.run(host=host, debug=True, port=port)
+    if '--production' in sys.argv:
+        ProductionServer(
+            app,
+            host=host,
+            port=port,
+            workers=SERVER_WORKERS,
+            threads=int(config_manager.get('BACKEND_THREADS', 8)),
+            graceful_timeout=int(config_manager.get('BACKEND_GRACEFUL_TIMEOUT', 900)),
+            timeout=int(config_manager.get('BACKEND_TIMEOUT', 120))
+        ).run()
+    else:
+        # The reloader starts a child process, hooks belong to the one serving
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            run_startup_hooks()
+        app.run(host=host, debug=True, port=port)